@@ -0,0 +1,207 @@
+import json
+import threading
+
+from JsonDecoder import CTJsonDecoder
+from WebsocketSupervisor import CTWebsocketSupervisor
+
+
+class CTBinanceStreams:
+    """
+        Binance market streams multiplexed over combined-stream connections.
+
+        Every stream name (e.g. '!ticker@arr', 'ethbtc@depth', 'ethbtc@trade',
+        'ethbtc@kline_1m') is registered with a parser and assigned to a
+        connection with free capacity. Messages arrive as
+        {"stream": <name>, "data": <payload>} and are routed to the parser of
+        their stream, they are decoded by CTJsonDecoder.
+        Streams are added and removed on open connections with
+        SUBSCRIBE/UNSUBSCRIBE requests; requests made within flush_delay are
+        sent as one message, Binance closes connections receiving more than
+        5 messages per second. A reconnected connection subscribes its
+        streams again.
+        Debug: ct['Binance']._streams.get_state()
+    """
+    def __init__(self, url='wss://stream.binance.com:9443/stream', streams_per_connection=200, flush_delay=0.25,
+                 on_open=None):
+        """
+            on_open - called with (streams of the connection, is_reconnect)
+            whenever a connection is (re)established
+        """
+        self._url = url
+        self._streams_per_connection = streams_per_connection
+        self._flush_delay = flush_delay
+        self._on_open = on_open
+        self._json_decoder = CTJsonDecoder.instance()
+        self._parsers = {}
+        self._stream_connections = {}
+        self._connections = []
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._started = True
+            connections = list(self._connections)
+        for connection in connections:
+            connection.start()
+
+    def subscribe(self, stream, parser):
+        """
+            parser is called with the parsed data of every message of stream
+        """
+        with self._lock:
+            self._parsers[stream] = parser
+            if stream in self._stream_connections:
+                return
+            connection = None
+            for candidate in self._connections:
+                if candidate.get_stream_count() < self._streams_per_connection:
+                    connection = candidate
+                    break
+            if connection is None:
+                connection = CTBinanceStreamConnection(self, len(self._connections), self._url, self._flush_delay)
+                self._connections.append(connection)
+                if self._started:
+                    connection.start()
+            self._stream_connections[stream] = connection
+        connection.subscribe(stream)
+
+    def unsubscribe(self, stream):
+        with self._lock:
+            self._parsers.pop(stream, None)
+            connection = self._stream_connections.pop(stream, None)
+        if connection is not None:
+            connection.unsubscribe(stream)
+
+    def get_streams(self):
+        return list(self._stream_connections.keys())
+
+    def get_supervisors(self):
+        return [connection.get_supervisor() for connection in self._connections]
+
+    def route(self, message):
+        """
+            Passes a combined-stream message to the parser of its stream
+        """
+        parsed_message = self._json_decoder.loads(message)
+        stream = parsed_message.get('stream', None)
+        if stream is None:
+            if parsed_message.get('error', None) is not None:
+                print("*** Binance stream request failed: ", parsed_message)
+            return
+        parser = self._parsers.get(stream, None)
+        if parser is not None:
+            try:
+                parser(parsed_message['data'])
+            except Exception as e:
+                print("Failed to parse Binance stream ", stream, e)
+
+    def notify_open(self, streams, is_reconnect):
+        if self._on_open is not None:
+            try:
+                self._on_open(streams, is_reconnect)
+            except Exception as e:
+                print("Binance stream open handler failed: ", e)
+
+    def get_state(self):
+        return {
+            'Streams': len(self._stream_connections),
+            'Connections': [connection.get_state() for connection in self._connections],
+        }
+
+
+class CTBinanceStreamConnection:
+    """
+        One combined-stream websocket of CTBinanceStreams. Reconnects, stalls
+        and pings are handled by its CTWebsocketSupervisor, the stream set is
+        kept here so that it can be sent in batched requests.
+    """
+    def __init__(self, manager, index, url, flush_delay):
+        self._manager = manager
+        self._flush_delay = flush_delay
+        self._streams = set()
+        # Requests not sent yet, method -> stream names
+        self._pending = {'SUBSCRIBE': [], 'UNSUBSCRIBE': []}
+        self._flush_timer = None
+        self._request_id = 0
+        self._is_open = False
+        self._lock = threading.Lock()
+        # Binance pings every 3 minutes, client pings keep quiet connections measurable.
+        # The all market ticker array is a large message every second, parsed off the event loop.
+        self._supervisor = CTWebsocketSupervisor(
+            'Binance stream {}'.format(index),
+            lambda: url,
+            self._manager.route,
+            on_open=self.on_open,
+            on_close=self.on_close,
+            ping_interval=30,
+            parse_in_executor=True
+        )
+
+    def start(self):
+        self._supervisor.start()
+
+    def get_supervisor(self):
+        return self._supervisor
+
+    def get_stream_count(self):
+        return len(self._streams)
+
+    def subscribe(self, stream):
+        with self._lock:
+            self._streams.add(stream)
+            self.queue_request('SUBSCRIBE', stream)
+
+    def unsubscribe(self, stream):
+        with self._lock:
+            self._streams.discard(stream)
+            self.queue_request('UNSUBSCRIBE', stream)
+
+    def queue_request(self, method, stream):
+        """
+            Called with _lock held. Streams of a closed connection are
+            subscribed when it opens, nothing is queued for them.
+        """
+        if not self._is_open:
+            return
+        for pending_method, streams in self._pending.items():
+            if stream in streams:
+                streams.remove(stream)
+        self._pending[method].append(stream)
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self._flush_delay, self.flush_requests)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush_requests(self):
+        with self._lock:
+            self._flush_timer = None
+            pending = self._pending
+            self._pending = {'SUBSCRIBE': [], 'UNSUBSCRIBE': []}
+            if self._is_open:
+                for method in ('UNSUBSCRIBE', 'SUBSCRIBE'):
+                    if pending[method]:
+                        self.send_request(method, pending[method])
+
+    def send_request(self, method, streams):
+        self._request_id += 1
+        self._supervisor.send(json.dumps({'method': method, 'params': streams, 'id': self._request_id}))
+
+    def on_open(self, is_reconnect):
+        with self._lock:
+            self._is_open = True
+            streams = sorted(self._streams)
+            if streams:
+                self.send_request('SUBSCRIBE', streams)
+        self._manager.notify_open(streams, is_reconnect)
+
+    def on_close(self):
+        with self._lock:
+            self._is_open = False
+            self._pending = {'SUBSCRIBE': [], 'UNSUBSCRIBE': []}
+
+    def get_state(self):
+        return {
+            'Streams': len(self._streams),
+            **self._supervisor.get_state(),
+        }
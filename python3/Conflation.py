@@ -0,0 +1,163 @@
+import threading
+
+
+class CTConflator:
+    """
+        Latest market state between the feeds and the GUI.
+
+        Feeds publish (topic, key, value) for every update they receive, the
+        conflator keeps only the latest value per key. Every subscription has
+        a set of keys changed since it last called collect(), so a view
+        refreshing at its own frame rate gets each changed market once, no
+        matter how many updates arrived in between, and does work
+        proportional to what changed rather than to the universe.
+
+        Values are replaced, never changed in place: a collected value stays
+        consistent while feeds keep publishing. Topics:
+            'Quotes' - key (exchange, code_base, code_curr), value {quote field: value}
+            'OrderBooks' - key (exchange, market_symbol), value None, the book
+                           itself is read from the exchange
+
+        Publishers may skip the work of building values while a topic has no
+        subscribers, subscribers load the full state when they start.
+        Debug: CTConflator.instance().get_state()
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._subscriptions = {}
+        self._counters = {'Published': 0, 'Collected': 0}
+
+    @classmethod
+    def instance(cls):
+        """
+            Conflator shared by all exchanges and views
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def has_subscribers(self, topic):
+        return bool(self._subscriptions.get(topic, None))
+
+    def publish(self, topic, key, value=None, merge=False):
+        self.publish_many(topic, ((key, value),), merge)
+
+    def publish_many(self, topic, items, merge=False):
+        """
+            items - iterable of (key, value)
+            merge - values are dictionaries of changed fields, merged into a
+                    copy of the latest value of their key
+        """
+        with self._lock:
+            values = self._values.setdefault(topic, {})
+            keys = []
+            for key, value in items:
+                if merge:
+                    latest = values.get(key, None)
+                    if latest is not None:
+                        value = {**latest, **value}
+                values[key] = value
+                keys.append(key)
+            self._counters['Published'] += len(keys)
+            for subscription in self._subscriptions.get(topic, ()):
+                subscription.mark_dirty(keys)
+
+    def remove(self, topic, key):
+        """
+            Forgets a key, e.g. of a market no longer listed
+        """
+        with self._lock:
+            self._values.get(topic, {}).pop(key, None)
+
+    def get(self, topic, key, default=None):
+        return self._values.get(topic, {}).get(key, default)
+
+    def subscribe(self, topic, keys=None):
+        """
+            Returns a CTConflatedSubscription to keys of topic, or to every key
+            when keys is None. Its first collect() returns the keys known already.
+        """
+        subscription = CTConflatedSubscription(self, topic, keys)
+        with self._lock:
+            self._subscriptions.setdefault(topic, []).append(subscription)
+            subscription.mark_dirty(self._values.get(topic, {}).keys())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.get_topic(), [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+
+    def set_keys(self, subscription, keys):
+        with self._lock:
+            subscription.replace_keys(keys)
+            subscription.mark_dirty(self._values.get(subscription.get_topic(), {}).keys())
+
+    def collect(self, subscription):
+        """
+            {key: latest value} of keys changed since the previous collect()
+        """
+        with self._lock:
+            dirty = subscription.take_dirty()
+            values = self._values.get(subscription.get_topic(), {})
+            self._counters['Collected'] += len(dirty)
+            return {key: values.get(key, None) for key in dirty}
+
+    def get_state(self):
+        with self._lock:
+            return {
+                'Topics': {topic: len(values) for topic, values in self._values.items()},
+                'Subscriptions': {topic: len(subscriptions) for topic, subscriptions in self._subscriptions.items()},
+                **self._counters,
+            }
+
+
+class CTConflatedSubscription:
+    """
+        Changed keys of one topic of a CTConflator for one subscriber,
+        the set is only touched with the lock of the conflator held
+    """
+    def __init__(self, conflator, topic, keys=None):
+        self._conflator = conflator
+        self._topic = topic
+        self._keys = set(keys) if keys is not None else None
+        self._dirty = set()
+
+    def get_topic(self):
+        return self._topic
+
+    def mark_dirty(self, keys):
+        if self._keys is None:
+            self._dirty.update(keys)
+        else:
+            self._dirty.update(key for key in keys if key in self._keys)
+
+    def replace_keys(self, keys):
+        self._keys = set(keys) if keys is not None else None
+        self._dirty = set()
+
+    def take_dirty(self):
+        dirty = self._dirty
+        self._dirty = set()
+        return dirty
+
+    def set_keys(self, keys):
+        """
+            Follows other keys, their current values are returned by the next collect()
+        """
+        self._conflator.set_keys(self, keys)
+
+    def has_changes(self):
+        return bool(self._dirty)
+
+    def collect(self):
+        return self._conflator.collect(self)
+
+    def close(self):
+        self._conflator.unsubscribe(self)
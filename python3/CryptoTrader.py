@@ -1,17 +1,38 @@
+import asyncio
+import concurrent.futures
 import threading
-
 from pydoc import locate
 
+from DefinitionsCache import CTDefinitionsCache
+from EventBus import CTEvent, CTEventBus
+from EventLoop import CTEventLoop
+from MarketStore import CTMarketStore
+from Registry import CTInstrumentRegistry
+
 
 class CryptoTrader:
-    def __init__(self, api_keys, settings, log):
+    def __init__(self, api_keys, settings, log, wait_for_exchanges=True):
         self.trader = {}
         self._map_global_code_to_local_code = {}
         self._map_local_code_to_global_code = {}
+        # code_base -> code_curr -> exchange -> market, replaced by refresh_agg_active_markets()
         self._active_markets = {}
+        self._active_markets_lock = threading.Lock()
+        self._registry = CTInstrumentRegistry()
+        self._market_store = CTMarketStore(self._registry)
         self._API_KEYS = api_keys
         self._SETTINGS = settings
         self.log = log
+        self._exchange_states = {}
+        self._exchanges_settled = threading.Event()
+        self._wait_for_exchanges = wait_for_exchanges
+        self._exchange_listeners = []
+        self._listeners_lock = threading.Lock()
+        cache_settings = self._SETTINGS.get('Definitions Cache', {})
+        self._definitions_cache = CTDefinitionsCache(
+            cache_settings.get('File', 'definitions_cache.json'),
+            cache_settings.get('Max Age Hours', 24) * 60 * 60
+        )
         self.init_exchanges()
         self.update_exchange_instance_api_keys()
 
@@ -24,12 +45,34 @@ class CryptoTrader:
         """
             Loading exchange classes using provided exchange names
         """
+        http_settings = self._SETTINGS.get('HTTP Connection Pool', {})
+        retry_settings = self._SETTINGS.get('Request Retry', {})
+        breaker_settings = self._SETTINGS.get('Circuit Breaker', {})
+        coalescing_settings = self._SETTINGS.get('Request Coalescing', {})
         for exchange in self._SETTINGS.get('Exchange Classes to Initialize', []):
             exchange_file = locate('Exchanges.' + exchange)
             exchange_class = getattr(exchange_file, exchange)
             self.trader[exchange] = exchange_class()
-        self.init_currencies()
-        self.init_markets()
+            self.trader[exchange].init_market_store(self._market_store)
+            self.trader[exchange].init_http_session(
+                pool_size=http_settings.get('Pool Size', None),
+                timeout=http_settings.get('Timeout Seconds', None),
+                keep_alive=http_settings.get('Keep Alive', None)
+            )
+            self.trader[exchange].init_retry_policy(
+                max_attempts=retry_settings.get('Max Attempts', None),
+                base_delay=retry_settings.get('Base Delay Seconds', None),
+                max_delay=retry_settings.get('Max Delay Seconds', None)
+            )
+            self.trader[exchange].init_circuit_breakers(
+                failure_threshold=breaker_settings.get('Failure Threshold', None),
+                cooldown=breaker_settings.get('Cooldown Seconds', None),
+                max_cooldown=breaker_settings.get('Max Cooldown Seconds', None)
+            )
+            self.trader[exchange].init_request_coalescing(
+                freshness=coalescing_settings.get('Freshness Seconds', None)
+            )
+        self.bootstrap()
 
     def update_exchange_instance_api_keys(self):
         """
@@ -53,112 +96,370 @@ class CryptoTrader:
         if not isinstance(list_of_exchanges, list):
             list_of_exchanges = self._SETTINGS.get('Exchanges to Load', [])
 
-        map_global_code_to_local_code = {}
-        map_local_code_to_global_code = {}
-
         # Parallel loading of currency definitions on exchanges
+        self.log('Loading currencies for ' + ', '.join(list_of_exchanges))
+        self.run_async(self.async_call_exchanges('async_update_currency_definitions', list_of_exchanges), 5)
         for exchange in list_of_exchanges:
-            self.log('Loading currencies for ' + exchange)
-            t = threading.Thread(target=self.trader[exchange].update_currency_definitions)
-            t.start()
-            t.join(5)
+            self.merge_currency_maps(exchange)
+        self.log('Done loading currencies')
 
-        for exchange in list_of_exchanges:
-            # Gather code overrides from program settings
-            code_rename_map = self._SETTINGS.get('Exchange Currency Rename Map', {}).get(exchange, {})
+    def merge_currency_maps(self, exchange):
+        """
+            Derives currency code maps of the exchange object from its loaded
+            currency definitions and merges them into the CryptoTrader maps,
+            so exchanges can be added one at a time as they finish loading
+        """
+        # Gather code overrides from program settings
+        code_rename_map = self._SETTINGS.get('Exchange Currency Rename Map', {}).get(exchange, {})
+        exchange_name_column = exchange + 'Name'
 
-            # Create empty exchange maps
-            exchange_map_local_code_to_global_code = {}
-            exchange_map_global_code_to_local_code = {}
-            map_local_code_to_global_code[exchange] = {}
+        # Create empty exchange maps
+        exchange_map_local_code_to_global_code = {}
+        exchange_map_global_code_to_local_code = {}
 
-            # Retrieve loaded currency codes and names from exchange
-            currencies = self.trader[exchange]._currencies
-            for currency in currencies:
-                try:
-                    code = code_rename_map.get(currency, currency)
+        # Retrieve loaded currency codes and names from exchange
+        currencies = self.trader[exchange]._currencies
+        for currency in list(currencies):
+            try:
+                code = code_rename_map.get(currency, currency)
 
-                    currency_name = currencies[currency]['Name']
-                    exchange_name_column = exchange + 'Name'
+                currency_name = currencies[currency]['Name']
 
-                    if code not in map_global_code_to_local_code:
-                        map_global_code_to_local_code[code] = {
-                            'Name': code
-                        }
+                if code not in self._map_global_code_to_local_code:
+                    self._map_global_code_to_local_code[code] = {
+                        'Name': code
+                    }
 
-                    # Populate maps for the exchange object
-                    exchange_map_local_code_to_global_code[currency] = code
-                    exchange_map_global_code_to_local_code[code] = currency
+                self._registry.get_currency_id(code)
 
-                    # Populate maps for the CryptoTrader object
-                    map_local_code_to_global_code[exchange][currency] = code
-                    map_global_code_to_local_code[code][exchange] = currency
-                    map_global_code_to_local_code[code][exchange_name_column] = currency_name
+                # Populate maps for the exchange object
+                exchange_map_local_code_to_global_code[currency] = code
+                exchange_map_global_code_to_local_code[code] = currency
 
-                    if code == map_global_code_to_local_code[code]['Name']:
-                        map_global_code_to_local_code[code]['Name'] = currency_name
+                # Populate maps for the CryptoTrader object
+                self._map_global_code_to_local_code[code][exchange] = currency
+                self._map_global_code_to_local_code[code][exchange_name_column] = currency_name
 
-                except Exception as e:
-                    self.log(str(e))
+                if code == self._map_global_code_to_local_code[code]['Name']:
+                    self._map_global_code_to_local_code[code]['Name'] = currency_name
 
-            # Update exchange specific maps on exchange object
-            self.trader[exchange]._map_local_code_to_global_code = exchange_map_local_code_to_global_code
-            self.trader[exchange]._map_global_code_to_local_code = exchange_map_global_code_to_local_code
+            except Exception as e:
+                print(str(e))
 
-        # Update overall currency maps on the CryptoTrader object
-        self._map_global_code_to_local_code = map_global_code_to_local_code
-        self._map_local_code_to_global_code = map_local_code_to_global_code
-        self.log('Done loading currencies')
+        # Forget codes the exchange does not list anymore
+        for code in list(self._map_global_code_to_local_code):
+            if code not in exchange_map_global_code_to_local_code:
+                self._map_global_code_to_local_code[code].pop(exchange, None)
+                self._map_global_code_to_local_code[code].pop(exchange_name_column, None)
+
+        # Update exchange specific maps on exchange object
+        self.trader[exchange]._map_local_code_to_global_code = exchange_map_local_code_to_global_code
+        self.trader[exchange]._map_global_code_to_local_code = exchange_map_global_code_to_local_code
+        self._map_local_code_to_global_code[exchange] = dict(exchange_map_local_code_to_global_code)
+        CTEventBus.instance().publish(CTEvent.CURRENCIES, exchange)
+
+    # ##### Bootstrap #####
+    def bootstrap(self):
+        """
+            Loads all exchanges to load concurrently on the shared event loop
+            and waits at most 'Bootstrap Deadline Seconds'. Exchanges that miss
+            the deadline keep loading in the background and join the
+            aggregated markets as soon as they are ready.
+            Each exchange goes through states Pending, Connecting, Currencies,
+            Markets, Quotes and ends in Ready or Failed, see get_exchange_states().
+            When created with wait_for_exchanges=False nothing is awaited, the
+            caller follows progress with add_exchange_listener().
+        """
+        list_of_exchanges = self._SETTINGS.get('Exchanges to Load', [])
+        deadline = self._SETTINGS.get('Bootstrap Deadline Seconds', 5)
+        self._exchange_states = {exchange: 'Pending' for exchange in list_of_exchanges}
+        self._exchanges_settled.clear()
+        cached_exchanges = self.load_definitions_cache()
+
+        self.log('Loading exchanges ' + ', '.join(list_of_exchanges))
+        CTEventLoop.instance().submit(self.async_bootstrap(list_of_exchanges, cached_exchanges))
+        if not self._wait_for_exchanges:
+            return
+        if list_of_exchanges:
+            self._exchanges_settled.wait(deadline)
+
+        ready = self.get_ready_exchanges()
+        late = [exchange for exchange in list_of_exchanges if self._exchange_states[exchange] not in ('Ready', 'Failed')]
+        failed = [exchange for exchange in list_of_exchanges if self._exchange_states[exchange] == 'Failed']
+        self.log('Ready exchanges: ' + ', '.join(ready))
+        if late:
+            self.log('Still loading in the background: ' + ', '.join(late))
+        if failed:
+            self.log('Failed to load: ' + ', '.join(failed))
+
+    async def async_bootstrap(self, list_of_exchanges, cached_exchanges):
+        """
+            Runs exchange pipelines concurrently and saves the definitions
+            cache once all of them finished
+        """
+        await asyncio.gather(
+            *[self.async_bootstrap_exchange(exchange, exchange in cached_exchanges) for exchange in list_of_exchanges]
+        )
+        await asyncio.get_running_loop().run_in_executor(None, self.save_definitions_cache)
 
-    def init_markets(self):
-        for exchange in self._SETTINGS.get('Exchanges to Load', []):
-            self.log('Loading market definitions for ' + exchange)
-            t = threading.Thread(target=self.trader[exchange].update_market_definitions)
-            t.start()
-            t.join(5)
-        self.log('Done loading market definitions')
-        for exchange in self._SETTINGS.get('Exchanges to Load', []):
-            self.log('Loading market quotes for ' + exchange)
-            t = threading.Thread(target=self.trader[exchange].update_market_quotes)
-            t.start()
-            t.join(5)
-        self.refresh_agg_active_markets()
-        self.log('Done loading market quotes')
-
-    def refresh_agg_active_markets(self):
-        for exchange in self._SETTINGS.get('Exchanges to Load', []):
-            for code_base in self.trader[exchange]._active_markets:
-                if code_base not in self._active_markets:
-                    self._active_markets[code_base] = {}
-                for code_curr in self.trader[exchange]._active_markets[code_base]:
-                    if code_curr not in self._active_markets[code_base]:
-                        self._active_markets[code_base][code_curr] = {}
-                    self._active_markets[code_base][code_curr][exchange] = \
-                        self.trader[exchange]._active_markets[code_base][code_curr]
+    async def async_bootstrap_exchange(self, exchange, is_cached):
+        """
+            Loading pipeline of one exchange. Cached exchanges only need quotes
+            to become ready, their definitions are refreshed afterwards.
+        """
+        trader = self.trader[exchange]
+        try:
+            self.set_exchange_state(exchange, 'Connecting')
+            await trader.async_connect()
+            if not is_cached:
+                await self.async_load_definitions(exchange)
+            self.set_exchange_state(exchange, 'Quotes')
+            await trader.async_update_market_quotes()
+            self.refresh_agg_active_markets([exchange])
+            self.set_exchange_state(exchange, 'Ready')
+            if is_cached:
+                await self.async_load_definitions(exchange)
+        except Exception as e:
+            print('Exception loading {}: {}'.format(exchange, e))
+            if self._exchange_states[exchange] != 'Ready':
+                self.set_exchange_state(exchange, 'Failed')
+
+    async def async_load_definitions(self, exchange):
+        """
+            Downloads currency and market definitions of the exchange. When
+            definitions were loaded before (from the cache) the difference is
+            applied: new and changed markets are merged, delisted ones removed.
+        """
+        trader = self.trader[exchange]
+        is_loading = self._exchange_states[exchange] != 'Ready'
+        if is_loading:
+            self.set_exchange_state(exchange, 'Currencies')
+        await trader.async_update_currency_definitions()
+        self.merge_currency_maps(exchange)
+
+        if is_loading:
+            self.set_exchange_state(exchange, 'Markets')
+        previous_markets = trader.start_definitions_refresh()
+        await trader.async_update_market_definitions()
+        diff = trader.finish_definitions_refresh(previous_markets)
+        if diff is None:
+            if previous_markets:
+                print('Could not refresh market definitions of {}, keeping cached ones'.format(exchange))
+            return
+        if previous_markets and any(diff.values()):
+            print('{} market definitions refreshed: {} added, {} removed, {} changed'.format(
+                exchange, len(diff['Added']), len(diff['Removed']), len(diff['Changed'])))
+        self.refresh_agg_active_markets([exchange])
+
+    def set_exchange_state(self, exchange, state):
+        with self._listeners_lock:
+            self._exchange_states[exchange] = state
+            listeners = list(self._exchange_listeners)
+        if all(state in ('Ready', 'Failed') for state in self._exchange_states.values()):
+            self._exchanges_settled.set()
+        for listener in listeners:
+            try:
+                listener(exchange, state)
+            except Exception as e:
+                print('Exception in exchange state listener for {}: {}'.format(exchange, e))
+
+    def add_exchange_listener(self, listener):
+        """
+            Registers listener(exchange, state) called on every state change
+            of an exchange, see bootstrap(). It runs on the event loop thread,
+            GUI code has to hand the call over to the GUI thread.
+            The listener is called at once for exchanges already Ready or Failed.
+        """
+        with self._listeners_lock:
+            self._exchange_listeners.append(listener)
+            settled = [(exchange, state) for exchange, state in self._exchange_states.items()
+                       if state in ('Ready', 'Failed')]
+        for exchange, state in settled:
+            listener(exchange, state)
+
+    def remove_exchange_listener(self, listener):
+        with self._listeners_lock:
+            if listener in self._exchange_listeners:
+                self._exchange_listeners.remove(listener)
+
+    def get_exchange_states(self):
+        """
+            Debug: self._CTMain._Crypto_Trader.get_exchange_states()
+        """
+        return dict(self._exchange_states)
+
+    def get_ready_exchanges(self):
+        return [exchange for exchange, state in self._exchange_states.items() if state == 'Ready']
+
+    def get_live_exchanges(self):
+        """
+            Ready exchanges whose websocket feeds are up, quotes of the others may be frozen
+        """
+        return [exchange for exchange in self.get_ready_exchanges() if not self.trader[exchange].is_quotes_stale()]
+
+    # ##### Definitions cache #####
+    def load_definitions_cache(self):
+        """
+            Restores currency and market definitions and code maps of the
+            exchanges to load found in the definitions cache.
+            Returns the set of restored exchanges, the others need a cold start.
+        """
+        list_of_exchanges = self._SETTINGS.get('Exchanges to Load', [])
+        cached = self._definitions_cache.load(CTDefinitionsCache.get_signature(self._SETTINGS))
+        if cached is None:
+            return set()
+
+        cached_exchanges = {exchange for exchange in list_of_exchanges if exchange in cached['Exchanges']}
+        for exchange in cached_exchanges:
+            self.trader[exchange].load_definitions_snapshot(cached['Exchanges'][exchange])
+            self.merge_currency_maps(exchange)
+        self.refresh_agg_active_markets(list(cached_exchanges))
+        if cached_exchanges:
+            self.log('Loaded cached currency and market definitions for ' + ', '.join(sorted(cached_exchanges)))
+        return cached_exchanges
+
+    def save_definitions_cache(self):
+        list_of_exchanges = self._SETTINGS.get('Exchanges to Load', [])
+        self._definitions_cache.save(
+            {
+                exchange: self.trader[exchange].get_definitions_snapshot()
+                for exchange in list_of_exchanges if self.trader[exchange]._markets
+            },
+            CTDefinitionsCache.get_signature(self._SETTINGS)
+        )
+
+    def run_async(self, coroutine, timeout=None):
+        """
+            Runs coroutine on the shared event loop and waits for at most
+            timeout seconds. Work that did not finish keeps running in the
+            background and its results are picked up by the next refresh.
+        """
+        try:
+            return CTEventLoop.instance().run(coroutine, timeout)
+        except concurrent.futures.TimeoutError:
+            self.log('Exchange requests did not finish within {} seconds'.format(timeout))
+            return None
+
+    async def async_call_exchanges(self, method_name, list_of_exchanges, *args):
+        """
+            Awaits coroutine method method_name(*args) on all exchanges in
+            list_of_exchanges concurrently.
+            Returns a dictionary exchange -> result
+        """
+        results = await asyncio.gather(
+            *[getattr(self.trader[exchange], method_name)(*args) for exchange in list_of_exchanges],
+            return_exceptions=True
+        )
+        for exchange, result in zip(list_of_exchanges, results):
+            if isinstance(result, Exception):
+                print('Exception in {} {}: {}'.format(exchange, method_name, result))
+        return dict(zip(list_of_exchanges, results))
+
+    async def async_load_order_books(self, markets, depth=5):
+        """
+            Loads order book snapshots of many markets concurrently.
+            markets is a list of (exchange, market_symbol) tuples.
+            Returns a dictionary (exchange, market_symbol) -> consolidated order book
+        """
+        results = await asyncio.gather(
+            *[self.trader[exchange].async_get_consolidated_order_book(market_symbol, depth)
+              for exchange, market_symbol in markets],
+            return_exceptions=True
+        )
+        return {
+            market: result for market, result in zip(markets, results) if not isinstance(result, Exception)
+        }
+
+    def load_order_books(self, markets, depth=5, timeout=5):
+        """
+            Blocking version of async_load_order_books()
+            Debug: self._CTMain._Crypto_Trader.load_order_books([('Binance', 'ETHBTC'), ('Bittrex', 'BTC-ETH')])
+        """
+        return self.run_async(self.async_load_order_books(markets, depth), timeout) or {}
+
+    def refresh_agg_active_markets(self, list_of_exchanges=None):
+        """
+            Replaces the markets of the exchanges in _active_markets by their
+            current active markets, markets removed, cleared or no longer
+            active are dropped. A changed copy is swapped in, scans iterating
+            the previous one are not disturbed.
+        """
+        if not isinstance(list_of_exchanges, list):
+            list_of_exchanges = self._SETTINGS.get('Exchanges to Load', [])
+        refreshed_exchanges = set(list_of_exchanges)
+        with self._active_markets_lock:
+            agg_markets = {}
+            for code_base, base_markets in self._active_markets.items():
+                for code_curr, markets in base_markets.items():
+                    kept_markets = {
+                        exchange: market for exchange, market in markets.items() if exchange not in refreshed_exchanges
+                    }
+                    if kept_markets:
+                        agg_markets.setdefault(code_base, {})[code_curr] = kept_markets
+            for exchange in list_of_exchanges:
+                for code_base, base_markets in self.trader[exchange]._active_markets.items():
+                    agg_base_markets = agg_markets.setdefault(code_base, {})
+                    for code_curr, market in base_markets.items():
+                        agg_base_markets.setdefault(code_curr, {})[exchange] = market
+            self._active_markets = agg_markets
 
     def load_active_markets(self):
-        for exchange in self._SETTINGS.get('Exchanges to Load', []):
+        """
+            Refreshes quotes of exchanges that are ready, exchanges still
+            loading are merged in by their bootstrap pipeline
+        """
+        ready_exchanges = self.get_ready_exchanges()
+        list_of_exchanges = []
+        for exchange in ready_exchanges:
             if not self.trader[exchange].has_implementation('ws_all_markets_best_bid_ask'):
                 self.log('Loading active markets for ' + exchange)
-                t = threading.Thread(target=self.trader[exchange].update_market_quotes)
-                t.start()
-                t.join(5)
+                list_of_exchanges.append(exchange)
+        self.run_async(self.async_call_exchanges('async_update_market_quotes', list_of_exchanges), 5)
 
-        self.refresh_agg_active_markets()
+        self.refresh_agg_active_markets(ready_exchanges)
 
         return self._active_markets
 
     def load_24hour_moves(self):
-        for exchange in self._SETTINGS.get('Exchanges to Load', []):
+        ready_exchanges = self.update_24hour_moves()
+        self.refresh_agg_active_markets(ready_exchanges)
+
+        return self._active_markets
+
+    def update_24hour_moves(self):
+        """
+            Polls 24 hour statistics of ready exchanges without a websocket
+            feed of them, returns the ready exchanges. Updates reach views
+            through the 'Quotes' topic of the conflator.
+        """
+        ready_exchanges = self.get_ready_exchanges()
+        list_of_exchanges = []
+        for exchange in ready_exchanges:
             if not self.trader[exchange].has_implementation('ws_24hour_market_moves'):
                 self.log('Loading active markets for ' + exchange)
-                t = threading.Thread(target=self.trader[exchange].update_market_24hrs)
-                t.start()
-                t.join(5)
+                list_of_exchanges.append(exchange)
+        self.run_async(self.async_call_exchanges('async_update_market_24hrs', list_of_exchanges), 5)
+        return ready_exchanges
 
-        self.refresh_agg_active_markets()
-
-        return self._active_markets
+    def get_exchange_health(self):
+        """
+            Returns a dictionary exchange -> {'Stale': bool, 'Endpoints': circuit breaker states,
+                                              'Feeds': websocket supervisor states}
+            Debug: self._CTMain._Crypto_Trader.get_exchange_health()
+        """
+        return {
+            exchange: {
+                'Stale': self.trader[exchange].is_stale(),
+                'Endpoints': self.trader[exchange].get_health(),
+                'Feeds': self.trader[exchange].get_ws_state(),
+            } for exchange in self.trader
+        }
+
+    def get_stale_exchanges(self):
+        """
+            Exchanges currently answered from cached data or with a websocket feed down
+        """
+        return [exchange for exchange in self._SETTINGS.get('Exchanges to Load', []) if self.trader[exchange].is_stale()]
 
     def get_currency_code(self, exchange, exchange_code):
         if exchange in self._map_local_code_to_global_code:
@@ -171,68 +472,83 @@ class CryptoTrader:
         return self.trader[exchange].get_market_symbol(code_base, code_curr)
 
     def get_arbitrage_possibilities(self, required_rate_of_return):
+        """
+            Markets of live exchanges where the best bid on one exchange beats
+            the best ask on another, found by a vectorized scan of the market store
+        """
         self.load_active_markets()
         self._arbitrage_possibilities = {}
-        for code_base in self._active_markets:
-            for code_curr in self._active_markets[code_base]:
-                markets = self._active_markets[code_base][code_curr]
-                best_bid = None
-                best_ask = None
-                if len(markets) > 1:
-                    for exchange in markets:
-                        if not markets[exchange]['BestBid'] is None:
-                            if best_bid is None or best_bid < markets[exchange]['BestBid']:
-                                best_bid = markets[exchange]['BestBid']
-                        if not markets[exchange]['BestAsk'] is None:
-                            if best_ask is None or best_ask > markets[exchange]['BestAsk']:
-                                best_ask = markets[exchange]['BestAsk']
-                    if best_bid is not None and best_ask is not None and best_bid > best_ask * required_rate_of_return:
-                        if code_base not in self._arbitrage_possibilities:
-                            self._arbitrage_possibilities[code_base] = {}
-                        self._arbitrage_possibilities[code_base][code_curr] = markets
+        live_exchanges = self.get_live_exchanges()
+        pairs = self._market_store.get_arbitrage_pairs(required_rate_of_return, live_exchanges)
+        active_markets = self._active_markets
+        for code_base, code_curr in pairs:
+            # Snapshots, the rows keep changing while the opportunity is shown
+            markets = {
+                exchange: market.get_snapshot()
+                for exchange, market in active_markets.get(code_base, {}).get(code_curr, {}).items()
+                if exchange in live_exchanges
+            }
+            if len(markets) > 1:
+                if code_base not in self._arbitrage_possibilities:
+                    self._arbitrage_possibilities[code_base] = {}
+                self._arbitrage_possibilities[code_base][code_curr] = markets
         return self._arbitrage_possibilities
 
     def get_arbitrage_possibilities_circle(self, required_rate_of_return):
+        """
+            Circles base1 -> curr -> base2 -> base1 on one exchange. Candidate
+            base2 currencies come from the pairs the registry lists for curr
+            instead of trying every base currency.
+        """
         self.load_active_markets()
         self._arbitrage_possibilities = []
-        for code_base1 in self._active_markets:
-            for code_curr in self._active_markets[code_base1]:
-                for code_base2 in self._active_markets:
-                    if code_base1 != code_base2:
-                        for exchange in self._active_markets[code_base1][code_curr]:
-                            if code_curr in self._active_markets[code_base2]:
-                                if exchange in self._active_markets[code_base2][code_curr]:
-                                    if code_base2 in self._active_markets[code_base1]:
-                                        if exchange in self._active_markets[code_base1][code_base2]:
-                                            market1 = self._active_markets[code_base1][code_curr][exchange]
-                                            market2 = self._active_markets[code_base2][code_curr][exchange]
-                                            market3 = self._active_markets[code_base1][code_base2][exchange]
-                                            if market3['BestAsk'] is not None and market2['BestAsk'] is not None and market1['BestBid'] is not None and market3['BestAsk'] * market2['BestAsk'] > 0 and market3['BestAsk'] * market2['BestAsk'] * required_rate_of_return < market1['BestBid']:
-                                                self._arbitrage_possibilities.append(
-                                                    {
-                                                        'exchange': exchange,
-                                                        'market1': market1,
-                                                        'action1': 'sell',
-                                                        'market2': market2,
-                                                        'action2': 'buy',
-                                                        'market3': market3,
-                                                        'action3': 'buy',
-                                                        'return': 100.0 * (market1['BestBid'] / (market3['BestAsk'] * market2['BestAsk']) - 1)
-                                                    }
-                                                )
-                                            if market1['BestAsk'] is not None and market3['BestBid'] is not None and market2['BestBid'] is not None and market1['BestAsk'] > 0 and market3['BestBid'] * market2['BestBid'] > market1['BestAsk'] * required_rate_of_return:
-                                                self._arbitrage_possibilities.append(
-                                                    {
-                                                        'exchange': exchange,
-                                                        'market1': market1,
-                                                        'action1': 'buy',
-                                                        'market2': market2,
-                                                        'action2': 'sell',
-                                                        'market3': market3,
-                                                        'action3': 'sell',
-                                                        'return': 100.0 * (market3['BestBid'] * market2['BestBid'] / market1['BestAsk'] - 1)
-                                                    }
-                                                )
+        live_exchanges = set(self.get_live_exchanges())
+        active_markets = self._active_markets
+        for code_base1, base1_markets in active_markets.items():
+            for code_curr, markets1 in base1_markets.items():
+                curr_id = self._registry.find_currency_id(code_curr)
+                if curr_id is None:
+                    continue
+                for pair_id in self._registry.get_pairs_of_currency(curr_id):
+                    code_base2, code_curr2 = self._registry.get_pair(pair_id)
+                    if code_curr2 != code_curr or code_base2 == code_base1:
+                        continue
+                    markets2 = active_markets.get(code_base2, {}).get(code_curr, None)
+                    markets3 = base1_markets.get(code_base2, None)
+                    if not markets2 or not markets3:
+                        continue
+                    for exchange in markets1:
+                        if exchange in live_exchanges and exchange in markets2 and exchange in markets3:
+                            # Bid and ask of each market from the same update
+                            quotes1 = markets1[exchange].get_quotes()
+                            quotes2 = markets2[exchange].get_quotes()
+                            quotes3 = markets3[exchange].get_quotes()
+                            if quotes3['BestAsk'] is not None and quotes2['BestAsk'] is not None and quotes1['BestBid'] is not None and quotes3['BestAsk'] * quotes2['BestAsk'] > 0 and quotes3['BestAsk'] * quotes2['BestAsk'] * required_rate_of_return < quotes1['BestBid']:
+                                self._arbitrage_possibilities.append(
+                                    {
+                                        'exchange': exchange,
+                                        'market1': {**markets1[exchange].get_snapshot(), **quotes1},
+                                        'action1': 'sell',
+                                        'market2': {**markets2[exchange].get_snapshot(), **quotes2},
+                                        'action2': 'buy',
+                                        'market3': {**markets3[exchange].get_snapshot(), **quotes3},
+                                        'action3': 'buy',
+                                        'return': 100.0 * (quotes1['BestBid'] / (quotes3['BestAsk'] * quotes2['BestAsk']) - 1)
+                                    }
+                                )
+                            if quotes1['BestAsk'] is not None and quotes3['BestBid'] is not None and quotes2['BestBid'] is not None and quotes1['BestAsk'] > 0 and quotes3['BestBid'] * quotes2['BestBid'] > quotes1['BestAsk'] * required_rate_of_return:
+                                self._arbitrage_possibilities.append(
+                                    {
+                                        'exchange': exchange,
+                                        'market1': {**markets1[exchange].get_snapshot(), **quotes1},
+                                        'action1': 'buy',
+                                        'market2': {**markets2[exchange].get_snapshot(), **quotes2},
+                                        'action2': 'sell',
+                                        'market3': {**markets3[exchange].get_snapshot(), **quotes3},
+                                        'action3': 'sell',
+                                        'return': 100.0 * (quotes3['BestBid'] * quotes2['BestBid'] / quotes1['BestAsk'] - 1)
+                                    }
+                                )
 
         return self._arbitrage_possibilities
 
@@ -244,7 +560,12 @@ class CryptoTrader:
         self._balances_btc = {}
         self.load_active_markets()
         for exchange in self._SETTINGS.get('Exchanges with API Keys', []):
+            # Exchanges still loading join the next refresh
+            if self._exchange_states.get(exchange, 'Ready') != 'Ready':
+                continue
             self.trader[exchange].load_balances_btc()
+            CTEventBus.instance().publish(
+                CTEvent.BALANCES, exchange, None, self.trader[exchange]._complete_balances_btc)
             for currency in self.trader[exchange]._complete_balances_btc:
                 try:
                     if self.trader[exchange]._complete_balances_btc[currency]['Total'] > 0:
@@ -254,10 +575,12 @@ class CryptoTrader:
                                 btc_rate = 1
                             else:
                                 if code in ['USD', 'USDT']:
-                                    btc_rate = 2.0 / (self._active_markets[code]['BTC'][exchange]['BestBid'] + self._active_markets[code]['BTC'][exchange]['BestAsk'])
+                                    quotes = self._active_markets[code]['BTC'][exchange].get_quotes()
+                                    btc_rate = 2.0 / (quotes['BestBid'] + quotes['BestAsk'])
                                 else:
-                                    if code in self._active_markets['BTC']:
-                                        btc_rate = (self._active_markets['BTC'][code][exchange]['BestBid'] + self._active_markets['BTC'][code][exchange]['BestAsk']) / 2.0
+                                    if code in self._active_markets.get('BTC', {}):
+                                        quotes = self._active_markets['BTC'][code][exchange].get_quotes()
+                                        btc_rate = (quotes['BestBid'] + quotes['BestAsk']) / 2.0
                                     else:
                                         btc_rate = 0
                             self.trader[exchange]._complete_balances_btc[currency]['BtcValue'] = self.trader[exchange]._complete_balances_btc[currency]['Total'] * btc_rate
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import time
+
+
+class CTDefinitionsCache:
+    """
+        On-disk cache of currency and market definitions of exchanges and of
+        the currency code maps derived from them, used to start without
+        waiting for exchange APIs. The file is ignored when it was written by
+        another version of the format, is older than max_age seconds or was
+        built with a different currency rename map.
+        Debug: CTDefinitionsCache('definitions_cache.json').load()
+    """
+    _VERSION = 2
+
+    def __init__(self, file_path, max_age=24*60*60):
+        self._file_path = file_path
+        self._max_age = max_age
+
+    @staticmethod
+    def get_signature(settings):
+        """
+            Fingerprint of settings that change derived code maps
+        """
+        rename_map = settings.get('Exchange Currency Rename Map', {})
+        return hashlib.sha1(json.dumps(rename_map, sort_keys=True).encode()).hexdigest()
+
+    def load(self, signature=None):
+        """
+            Returns cached contents {'Exchanges': {exchange name: snapshot}}
+            or None when the cache is missing or cannot be used
+        """
+        try:
+            with open(self._file_path, 'rb') as cache_file:
+                contents = json.loads(cache_file.read())
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            print('Definitions cache is corrupted: {}'.format(e))
+            return None
+
+        if contents.get('Version', None) != self._VERSION:
+            return None
+        if time.time() - contents.get('Saved', 0) > self._max_age:
+            return None
+        if signature is not None and contents.get('Signature', None) != signature:
+            return None
+        return contents
+
+    def save(self, exchanges, signature=None):
+        """
+            exchanges - dictionary exchange name -> Exchange.get_definitions_snapshot()
+            The file is replaced atomically, so a crash while saving keeps the old cache.
+        """
+        contents = {
+            'Version': self._VERSION,
+            'Saved': time.time(),
+            'Signature': signature,
+            'Exchanges': exchanges,
+        }
+        temporary_path = self._file_path + '.tmp'
+        try:
+            with open(temporary_path, 'w') as cache_file:
+                json.dump(contents, cache_file, default=str)
+            os.replace(temporary_path, self._file_path)
+        except (OSError, TypeError, ValueError) as e:
+            print('Could not save definitions cache: {}'.format(e))
@@ -0,0 +1,158 @@
+import threading
+
+
+class CTEvent:
+    """
+        One update published on the CTEventBus.
+        type - one of CTEvent.TYPES
+        exchange - name of the exchange, e.g. 'Binance'
+        key - what was updated:
+              Market - (code_base, code_curr), data {field: value} of the changed fields
+              OrderBook - market symbol, data None, the book is read from the exchange
+              Trades - market symbol, data list of recent trades of the market
+              OpenOrders - market symbol, data list of open orders of the market
+              Balances - None, data {currency: balance}
+              Currencies - None, data None, currency maps of CryptoTrader changed
+    """
+    MARKET = 'Market'
+    ORDER_BOOK = 'OrderBook'
+    TRADES = 'Trades'
+    OPEN_ORDERS = 'OpenOrders'
+    BALANCES = 'Balances'
+    CURRENCIES = 'Currencies'
+    TYPES = (MARKET, ORDER_BOOK, TRADES, OPEN_ORDERS, BALANCES, CURRENCIES)
+
+    __slots__ = ('type', 'exchange', 'key', 'data')
+
+    def __init__(self, event_type, exchange, key=None, data=None):
+        self.type = event_type
+        self.exchange = exchange
+        self.key = key
+        self.data = data
+
+    def __repr__(self):
+        return 'CTEvent({}, {}, {}, {})'.format(self.type, self.exchange, self.key, self.data)
+
+
+class CTEventBus:
+    """
+        Publishes exchange updates to the handlers subscribed to their type,
+        optionally limited to one exchange and a set of keys. Handlers are
+        called on the publishing thread (websocket, event loop or worker
+        threads), views receive them on the GUI thread through
+        Views.EventBridge.CTQtEventBridge. Publishers check has_subscribers()
+        before building events nobody listens to.
+        Debug: CTEventBus.instance().get_state()
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Event type -> subscriptions, replaced on every change so publishers iterate without the lock
+        self._subscriptions = {event_type: () for event_type in CTEvent.TYPES}
+        self._counters = {'Published': 0, 'Delivered': 0}
+
+    @classmethod
+    def instance(cls):
+        """
+            Event bus shared by all exchanges and views
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def subscribe(self, handler, event_type, exchange=None, keys=None):
+        """
+            handler(event) is called for events of event_type of exchange
+            (any exchange when None) whose key is in keys (any key when None)
+            Returns a CTEventSubscription
+        """
+        if event_type not in CTEvent.TYPES:
+            raise ValueError('Unknown event type {}, expected one of {}'.format(event_type, CTEvent.TYPES))
+        subscription = CTEventSubscription(self, handler, event_type, exchange, keys)
+        with self._lock:
+            self._subscriptions[event_type] = self._subscriptions[event_type] + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions[subscription.get_type()] = tuple(
+                s for s in self._subscriptions[subscription.get_type()] if s is not subscription
+            )
+
+    def has_subscribers(self, event_type):
+        return len(self._subscriptions[event_type]) > 0
+
+    def publish(self, event_type, exchange, key=None, data=None):
+        subscriptions = self._subscriptions[event_type]
+        if not subscriptions:
+            return
+        self._counters['Published'] += 1
+        event = CTEvent(event_type, exchange, key, data)
+        for subscription in subscriptions:
+            if subscription.matches(exchange, key):
+                self.deliver(subscription, event)
+
+    def publish_many(self, event_type, exchange, items):
+        """
+            items - iterable of (key, data), e.g. all quotes of one message
+        """
+        subscriptions = self._subscriptions[event_type]
+        if not subscriptions:
+            return
+        for key, data in items:
+            self._counters['Published'] += 1
+            event = None
+            for subscription in subscriptions:
+                if subscription.matches(exchange, key):
+                    if event is None:
+                        event = CTEvent(event_type, exchange, key, data)
+                    self.deliver(subscription, event)
+
+    def deliver(self, subscription, event):
+        self._counters['Delivered'] += 1
+        try:
+            subscription.get_handler()(event)
+        except Exception as e:
+            print('Exception in {} event handler: {}'.format(event.type, e))
+
+    def get_state(self):
+        return {
+            'Subscriptions': {
+                event_type: len(subscriptions) for event_type, subscriptions in self._subscriptions.items()
+            },
+            **self._counters,
+        }
+
+
+class CTEventSubscription:
+    """
+        Handler and filter of one CTEventBus subscriber
+    """
+    def __init__(self, bus, handler, event_type, exchange=None, keys=None):
+        self._bus = bus
+        self._handler = handler
+        self._type = event_type
+        # (exchange, keys) replaced as a whole, publishing threads never see half of a new filter
+        self._filter = (exchange, frozenset(keys) if keys is not None else None)
+
+    def get_type(self):
+        return self._type
+
+    def get_handler(self):
+        return self._handler
+
+    def matches(self, exchange, key):
+        subscribed_exchange, keys = self._filter
+        return (subscribed_exchange is None or subscribed_exchange == exchange) and (keys is None or key in keys)
+
+    def set_filter(self, exchange=None, keys=None):
+        """
+            Follows another exchange and keys, e.g. when a view switches markets
+        """
+        self._filter = (exchange, frozenset(keys) if keys is not None else None)
+
+    def close(self):
+        self._bus.unsubscribe(self)
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+
+class CTEventLoop:
+    """
+        Single asyncio event loop shared by all exchanges and views.
+
+        The loop runs forever on a background daemon thread. Blocking code
+        (GUI callbacks, exchange worker threads) hands coroutines over with
+        submit() or run(), so hundreds of concurrent exchange calls only cost
+        one OS thread.
+        Debug: CTEventLoop.instance().run(ct['Binance'].async_update_market_quotes())
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='CTEventLoop', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def instance(cls):
+        """
+            Returns the process wide event loop, starting it on first use
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def get_loop(self):
+        return self._loop
+
+    def submit(self, coroutine):
+        """
+            Schedules coroutine on the loop from any thread.
+            Returns concurrent.futures.Future with the coroutine result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def run(self, coroutine, timeout=None):
+        """
+            Runs coroutine on the loop and blocks the calling thread until it
+            finishes or timeout (seconds) expires. On timeout
+            concurrent.futures.TimeoutError is raised and the coroutine keeps
+            running in the background.
+        """
+        return self.submit(coroutine).result(timeout)
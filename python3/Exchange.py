@@ -1,6 +1,29 @@
 # Abstract Exchange class. Each exchange implementation should inherit from it.
+import asyncio
+import functools
+import threading
 import time
 import traceback
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Conflation import CTConflator
+from EventBus import CTEvent, CTEventBus
+from EventLoop import CTEventLoop
+from Health import CTExchangeHealth
+from JsonDecoder import CTJsonDecoder
+from LocalOrderBook import CTLocalOrderBook
+from MarketStore import CTMarketRow, CTMarketStore
+from RateLimiter import CTRateLimiter
+from Retry import CTRequestMetrics, CTRetryPolicy
+from SingleFlight import CTSingleFlight
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
 
 class Exchange:
@@ -14,20 +37,64 @@ class Exchange:
         self._implements = {}
 
         self._currencies = {}
+        # Nested dictionaries code_base -> code_curr -> CTMarketRow of _market_store
+        self._market_store = CTMarketStore()
         self._markets = {}
         self._active_markets = {}
+        # Serializes writers of the copy-on-write _markets and _active_markets, readers never take it
+        self._markets_lock = threading.Lock()
         self._balances = {}
         self._timestamps = {}
 
         self._map_global_code_to_local_code = {}
         self._map_local_code_to_global_code = {}
         self._map_market_to_global_codes = {}
+        # Market symbol -> market store row, see get_quote_key()
+        self._quote_keys = {}
+        # Market fields describing the market itself rather than its current prices
+        self._market_definition_fields = {
+            'MarketSymbol',
+            'BaseMinAmount',
+            'BaseIncrement',
+            'CurrMinAmount',
+            'CurrIncrement',
+            'PriceMin',
+            'PriceIncrement',
+            'IsActive',
+            'IsRestricted',
+            'Notice',
+            'Created',
+            'LogoUrl',
+        }
+        self._refreshed_markets = None
+        # Market fields published to the 'Quotes' topic of the conflator
+        self._quote_fields = (
+            'BestBid',
+            'BestAsk',
+            'BestBidSize',
+            'BestAskSize',
+            'BaseVolume',
+            'CurrVolume',
+            '24HrHigh',
+            '24HrLow',
+            '24HrPercentMove',
+            'LastTradedPrice',
+        )
+        self._conflator = CTConflator.instance()
+        self._event_bus = CTEventBus.instance()
 
         self._open_orders = {}
         self._recent_market_trades = {}
         self._recent_user_trades = {}
 
         self._order_book = {}
+        self._ws_supervisors = []
+        # Backoff between order book snapshot attempts, doubled up to the maximum
+        self._order_book_resync_delay = 1
+        self._order_book_resync_max_delay = 30
+        # Order books with an async_resync_order_book() running, gaps are found on several threads
+        self._order_book_resyncs = set()
+        self._order_book_resyncs_lock = threading.Lock()
 
         self._market_prices = {}
         self._available_balances = {}
@@ -35,12 +102,21 @@ class Exchange:
         self._tick_intervals = {}
         self._tick_lookbacks = {}
         self._map_tick_intervals = {}
-        self._max_error_count = 3
-        self._error = {
-            'count': 0,
-            'message': '',
-            'result_timestamp': time.time()
-        }
+
+        self._http_pool_size = 10
+        self._http_timeout = (5, 10)
+        self._http_keep_alive = True
+        self._session = None
+        self._async_session = None
+        self.init_http_session()
+        self._json_decoder = CTJsonDecoder.instance()
+
+        self._rate_limiter = CTRateLimiter()
+
+        self._retry_policy = CTRetryPolicy()
+        self._request_metrics = CTRequestMetrics()
+        self._health = CTExchangeHealth(self.__class__.__name__)
+        self._single_flight = CTSingleFlight()
 
     def update_api_keys(self, APIKey='', Secret='', PassPhrase=''):
         self._API_KEY = APIKey
@@ -53,6 +129,143 @@ class Exchange:
     def has_implementation(self, name):
         return name in self._implements
 
+    # ##### HTTP connection pool #####
+    def init_http_session(self, pool_size=None, timeout=None, keep_alive=None):
+        """
+            (Re)creates the pooled HTTP session used by every REST call of the
+            exchange, so that consecutive polls reuse already open TCP/TLS
+            connections instead of paying a fresh handshake each time.
+            pool_size - maximum number of kept alive connections per host
+            timeout - seconds, either a number or a (connect, read) tuple
+            keep_alive - set to False to close connections after each request
+        """
+        if pool_size is not None:
+            self._http_pool_size = int(pool_size)
+        if timeout is not None:
+            self._http_timeout = tuple(timeout) if isinstance(timeout, list) else timeout
+        if keep_alive is not None:
+            self._http_keep_alive = keep_alive
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self._http_pool_size, pool_maxsize=self._http_pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not self._http_keep_alive:
+            session.headers['Connection'] = 'close'
+
+        previous_session = self._session
+        self._session = session
+        if previous_session is not None:
+            previous_session.close()
+
+    def http_request(self, method, url, **kwargs):
+        """
+            Sends a request through the exchange connection pool and returns
+            requests.Response. method is a lower case http verb ('get', 'post',
+            'delete', ...), kwargs are passed to requests.Session.request
+        """
+        kwargs.setdefault('timeout', self._http_timeout)
+        self._rate_limiter.acquire(self.get_request_weights(method, url))
+        response = self._session.request(method, url, **kwargs)
+        self.update_rate_limits(response.status_code, response.headers)
+        return response
+
+    # ##### JSON decoding #####
+    def decode_json(self, payload):
+        """
+            Decodes a str or bytes payload (REST body, websocket message) with
+            the fastest JSON backend installed, see CTJsonDecoder
+        """
+        return self._json_decoder.loads(payload)
+
+    def decode_response(self, response):
+        """
+            Decoded body of a requests.Response, the raw bytes are handed to
+            the decoder so they are never copied into a str
+        """
+        return self._json_decoder.loads(response.content)
+
+    def iterate_json_items(self, payload, path=()):
+        """
+            Elements of the array at path of a large document, one at a time
+            when ijson is installed
+            Debug: next(ct['Binance'].iterate_json_items(ct['Binance'].http_request('get', 'https://api.binance.com/api/v1/exchangeInfo').content, ('symbols',)))
+        """
+        return self._json_decoder.iterate_items(payload, path)
+
+    # ##### Rate limiting #####
+    def set_request_rate_limit(self, request_count, interval):
+        """
+            Static limit for exchanges that do not publish endpoint weights:
+            at most request_count calls per interval seconds
+        """
+        self._rate_limiter.set_bucket('REQUESTS', request_count, interval)
+        self._rate_limiter.set_default_weights({'REQUESTS': 1})
+
+    def get_request_weights(self, method, url):
+        """
+            Returns {bucket name: weight} charged for the request. By default
+            looks up the url path in the rate limiter endpoint table,
+            exchanges override it for weights depending on parameters.
+        """
+        return self._rate_limiter.get_weights(urlsplit(url).path)
+
+    def update_rate_limits(self, status_code, headers):
+        """
+            Corrects rate limiter with server reported usage and backs off
+            when the exchange says the limit was hit
+        """
+        self._rate_limiter.update_from_headers(headers)
+        if status_code in (418, 429):
+            try:
+                retry_after = float(headers.get('Retry-After', 60))
+            except ValueError:
+                retry_after = 60
+            print('{} rate limit hit, pausing requests for {} seconds'.format(self.__class__.__name__, retry_after))
+            self._rate_limiter.pause(retry_after)
+
+    # ##### Asynchronous HTTP transport #####
+    def get_async_http_session(self):
+        """
+            aiohttp session bound to the running event loop. It is created on
+            first use and mirrors the pool size and timeouts of the blocking
+            session.
+        """
+        if self._async_session is None or self._async_session.closed:
+            if isinstance(self._http_timeout, tuple):
+                connect_timeout, read_timeout = self._http_timeout
+            else:
+                connect_timeout = read_timeout = self._http_timeout
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=self._http_pool_size,
+                    force_close=not self._http_keep_alive
+                ),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+            )
+        return self._async_session
+
+    async def async_http_request(self, method, url, **kwargs):
+        """
+            Coroutine counterpart of http_request(), returns the decoded json.
+            Without aiohttp installed the pooled blocking session is used in
+            the loop executor, so callers can rely on the coroutine API anyway.
+        """
+        if aiohttp is None:
+            response = await self.run_in_executor(self.http_request, method, url, **kwargs)
+            return self.decode_response(response)
+        await self._rate_limiter.async_acquire(self.get_request_weights(method, url))
+        async with self.get_async_http_session().request(method.upper(), url, **kwargs) as response:
+            self.update_rate_limits(response.status, response.headers)
+            return self.decode_json(await response.read())
+
+    @staticmethod
+    async def run_in_executor(function, *args, **kwargs):
+        """
+            Awaits a blocking function in the default executor of the running loop
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(function, *args, **kwargs))
+
     # ##### Error handling #####
     def raise_not_implemented_error(self):
         raise NotImplementedError("Class {} needs to implement method {}!!!".format(
@@ -61,13 +274,6 @@ class Exchange:
             )
         )
 
-    def log_request_success(self):
-        self._error = {
-            'count': 0,
-            'message': '',
-            'result_timestamp': time.time()
-        }
-
     def log_request_error(self, message):
         error_message = 'Exception in class {} method {}: {}'.format(
             self.__class__.__name__,
@@ -75,13 +281,334 @@ class Exchange:
             message
         )
         print(error_message)
-        self._error = {
-            'count': self._error['count'] + 1,
-            'message': error_message
+
+    # ##### Retries #####
+    def init_retry_policy(self, max_attempts=None, base_delay=None, max_delay=None):
+        """
+            Replaces the retry policy of the exchange. Arguments left as None
+            keep their defaults.
+            max_attempts - number of tries of a single call, including the first one
+            base_delay, max_delay - backoff bounds in seconds
+        """
+        kwargs = {
+            'max_attempts': max_attempts,
+            'base_delay': base_delay,
+            'max_delay': max_delay,
         }
+        self._retry_policy = CTRetryPolicy(**{key: value for key, value in kwargs.items() if value is not None})
+
+    def get_request_metrics(self):
+        return self._request_metrics.get_metrics()
+
+    def init_request_coalescing(self, freshness=None):
+        """
+            freshness - seconds a successful result is reused by identical requests
+        """
+        if freshness is not None:
+            self._single_flight.set_freshness(freshness)
+
+    def execute_request(self, endpoint, send, validate=None, idempotent=True, default=None, cache_key=None,
+                        max_age=None, method='get'):
+        """
+            Calls send() until it succeeds, fails with a fatal error or the
+            retry policy runs out of attempts. Retry state lives in this call
+            only, so a failing endpoint does not use up retries of other calls.
+            endpoint - name under which attempts are recorded in metrics and health
+            send - function without arguments doing the request and returning decoded json
+            validate - function checking the decoded json, raises CTRequestError
+                       on errors reported by the exchange and returns the payload
+            idempotent - False for calls such as new orders that must not be
+                         repeated unless the exchange certainly did not act on them
+            default - returned when every attempt failed and there is no cached result
+            cache_key - identifies the request (e.g. url with parameters) for
+                        coalescing and the last good result cache, defaults to endpoint
+            max_age - seconds a previous result of the request may be reused,
+                      defaults to the freshness window of the exchange; 0 only
+                      merges calls in flight (e.g. account data)
+            method - HTTP method of the request, part of the cache key, so that
+                     e.g. querying and cancelling the same order never share results
+            Identical idempotent GET requests in flight at the same time are
+            sent once, requests with other methods change state and are always
+            sent. While the endpoint circuit breaker is open a GET request
+            returns the last good result straight away and is_stale() reports
+            it, other requests return default.
+        """
+        endpoint, cache_key = self.get_request_keys(endpoint, cache_key, method, idempotent)
+        if cache_key is None:
+            return self.run_request_attempts(endpoint, send, validate, idempotent, default, None)
+        return self._single_flight.call(
+            cache_key,
+            lambda: self.run_request_attempts(endpoint, send, validate, True, default, cache_key),
+            max_age
+        )
+
+    @staticmethod
+    def get_request_keys(endpoint, cache_key, method, idempotent=True):
+        """
+            Returns (endpoint, cache_key) of a request. Requests other than GET
+            get a circuit breaker of their own, so failing order queries do not
+            stop cancels. cache_key, under which identical requests are
+            coalesced and the last good result is kept, is the method and the
+            url, None for requests other than idempotent GETs.
+        """
+        method = method.upper()
+        if method != 'GET':
+            return method + ' ' + endpoint, None
+        if not idempotent:
+            return endpoint, None
+        return endpoint, method + ' ' + (cache_key if cache_key is not None else endpoint)
+
+    def run_request_attempts(self, endpoint, send, validate, idempotent, default, cache_key):
+        """
+            Retry loop of execute_request()
+        """
+        def attempt():
+            result = send()
+            return result if validate is None else validate(result)
+
+        if not self._health.allow_request(endpoint):
+            if cache_key is None:
+                print('Request {} of class {} not sent, its circuit breaker is open'.format(
+                    endpoint, self.__class__.__name__))
+            return self._health.get_cached(cache_key, default)
+
+        started = time.monotonic()
+        retry = 0
+        while True:
+            attempt_started = time.monotonic()
+            try:
+                result = attempt()
+                self._request_metrics.record_attempt(endpoint, time.monotonic() - attempt_started, 'Success')
+                self._health.record_success(endpoint, time.monotonic() - started, cache_key, result)
+                if cache_key is not None:
+                    self._single_flight.store(cache_key, result)
+                return result
+            except Exception as e:
+                retryable = self._retry_policy.is_retryable(e, idempotent)
+                delay = self.handle_request_failure(endpoint, e, retry, retryable, time.monotonic() - attempt_started)
+                if delay is None:
+                    if not (retryable and idempotent):
+                        return default
+                    return self.handle_call_failure(
+                        endpoint,
+                        time.monotonic() - started,
+                        lambda: self.run_in_executor(attempt),
+                        cache_key,
+                        default
+                    )
+            time.sleep(delay)
+            retry += 1
+
+    async def async_execute_request(self, endpoint, send, validate=None, idempotent=True, default=None,
+                                    cache_key=None, max_age=None, method='get'):
+        """
+            Coroutine version of execute_request(), send() returns an awaitable
+        """
+        endpoint, cache_key = self.get_request_keys(endpoint, cache_key, method, idempotent)
+        if cache_key is None:
+            return await self.async_run_request_attempts(endpoint, send, validate, idempotent, default, None)
+        return await self._single_flight.async_call(
+            cache_key,
+            lambda: self.async_run_request_attempts(endpoint, send, validate, True, default, cache_key),
+            max_age
+        )
+
+    async def async_run_request_attempts(self, endpoint, send, validate, idempotent, default, cache_key):
+        """
+            Coroutine version of run_request_attempts()
+        """
+        async def attempt():
+            result = await send()
+            return result if validate is None else validate(result)
+
+        if not self._health.allow_request(endpoint):
+            if cache_key is None:
+                print('Request {} of class {} not sent, its circuit breaker is open'.format(
+                    endpoint, self.__class__.__name__))
+            return self._health.get_cached(cache_key, default)
+
+        started = time.monotonic()
+        retry = 0
+        while True:
+            attempt_started = time.monotonic()
+            try:
+                result = await attempt()
+                self._request_metrics.record_attempt(endpoint, time.monotonic() - attempt_started, 'Success')
+                self._health.record_success(endpoint, time.monotonic() - started, cache_key, result)
+                if cache_key is not None:
+                    self._single_flight.store(cache_key, result)
+                return result
+            except Exception as e:
+                retryable = self._retry_policy.is_retryable(e, idempotent)
+                delay = self.handle_request_failure(endpoint, e, retry, retryable, time.monotonic() - attempt_started)
+                if delay is None:
+                    if not (retryable and idempotent):
+                        return default
+                    return self.handle_call_failure(endpoint, time.monotonic() - started, attempt, cache_key, default)
+            await asyncio.sleep(delay)
+            retry += 1
+
+    def handle_call_failure(self, endpoint, latency, probe, cache_key, default):
+        """
+            Reports an idempotent call that ran out of attempts on transient
+            errors to the endpoint health and returns the last good result of
+            the request if there is one. Fatal errors (bad parameters, rejected
+            orders) say nothing about the endpoint health and are not counted,
+            neither are calls that are not idempotent, as probing would repeat them.
+        """
+        self._health.record_failure(endpoint, latency, probe, cache_key)
+        return self._health.get_cached(cache_key, default)
+
+    def handle_request_failure(self, endpoint, error, attempt, retryable, latency):
+        """
+            Records a failed attempt and returns seconds to wait before the
+            next one, or None when the call should give up
+        """
+        message = '{}: {}'.format(type(error).__name__, error)
+        if retryable and attempt + 1 < self._retry_policy.get_max_attempts():
+            self._request_metrics.record_attempt(endpoint, latency, 'Retry', message)
+            return self._retry_policy.get_delay(attempt)
+        self._request_metrics.record_attempt(endpoint, latency, 'Failure', message)
+        print('Exception in class {} request {} after {} attempt(s): {}'.format(
+            self.__class__.__name__,
+            endpoint,
+            attempt + 1,
+            message
+        ))
+        return None
+
+    # ##### Health #####
+    def init_circuit_breakers(self, failure_threshold=None, cooldown=None, max_cooldown=None):
+        """
+            Replaces settings of endpoint circuit breakers. Arguments left as
+            None keep their defaults.
+            failure_threshold - failed calls in a row that open the breaker
+            cooldown, max_cooldown - seconds before the first and the longest
+                                     wait between background probes
+        """
+        kwargs = {
+            'failure_threshold': failure_threshold,
+            'cooldown': cooldown,
+            'max_cooldown': max_cooldown,
+        }
+        self._health.configure(**{key: value for key, value in kwargs.items() if value is not None})
+
+    def get_health(self):
+        """
+            Circuit breaker state, failure rate and latency per endpoint
+            Debug: ct['Binance'].get_health()
+        """
+        return self._health.get_state()
+
+    def is_stale(self, cache_key=None):
+        """
+            True when some request (or the request cache_key, the method and
+            the url, see get_request_keys()) was answered with cached data
+            because its endpoint is failing, or without cache_key when a
+            websocket feed is down
+        """
+        return self._health.is_stale(cache_key) or (cache_key is None and self.is_quotes_stale())
+
+    # ##### Websocket feeds #####
+    def add_ws_supervisor(self, supervisor):
+        """
+            Registers a CTWebsocketSupervisor whose feed delivers quotes
+        """
+        self._ws_supervisors.append(supervisor)
+        return supervisor
+
+    def get_ws_supervisors(self):
+        return self._ws_supervisors
+
+    def is_quotes_stale(self):
+        """
+            True while a websocket feed of the exchange is down or stalled,
+            its quotes are frozen at the last received values
+        """
+        return any(not supervisor.is_live() for supervisor in self.get_ws_supervisors())
+
+    def get_ws_state(self):
+        """
+            Debug: ct['Kucoin'].get_ws_state()
+        """
+        return [supervisor.get_state() for supervisor in self.get_ws_supervisors()]
+
+    # ##### Definitions snapshot #####
+    def get_definitions_snapshot(self):
+        """
+            Currency and market definitions with the code maps, without quotes
+            or 24 hour statistics, for CTDefinitionsCache
+        """
+        markets = {}
+        for code_base, base_markets in list(self._markets.items()):
+            markets[code_base] = {}
+            for code_curr, market in list(base_markets.items()):
+                # Values json cannot represent (e.g. datetime) are kept as strings, as in the cache file
+                markets[code_base][code_curr] = {
+                    key: value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+                    for key, value in market.items() if key in self._market_definition_fields
+                }
+        return {
+            'Currencies': dict(self._currencies),
+            'Markets': markets,
+            'MapGlobalCodeToLocalCode': dict(self._map_global_code_to_local_code),
+            'MapLocalCodeToGlobalCode': dict(self._map_local_code_to_global_code),
+            'MapMarketToGlobalCodes': dict(self._map_market_to_global_codes),
+        }
+
+    def load_definitions_snapshot(self, snapshot):
+        """
+            Restores definitions saved by get_definitions_snapshot()
+        """
+        self.clear_markets()
+        registry = self._market_store.get_registry()
+        for code_base, base_markets in snapshot.get('Markets', {}).items():
+            for code_curr, market in base_markets.items():
+                self.add_market(code_base, code_curr).update(market)
+                self.update_market_activity(code_base, code_curr)
+                if 'MarketSymbol' in market:
+                    registry.get_symbol_id(self.__class__.__name__, market['MarketSymbol'], code_base, code_curr)
+        self._currencies = snapshot.get('Currencies', {})
+        self._map_global_code_to_local_code = snapshot.get('MapGlobalCodeToLocalCode', {})
+        self._map_local_code_to_global_code = snapshot.get('MapLocalCodeToGlobalCode', {})
+        self._map_market_to_global_codes = snapshot.get('MapMarketToGlobalCodes', {})
+        self._timestamps['load_definitions_snapshot'] = time.time()
+
+    def start_definitions_refresh(self):
+        """
+            Starts recording markets touched by update_market_definitions()
+            and returns market definitions before the refresh
+        """
+        self._refreshed_markets = set()
+        return self.get_definitions_snapshot()['Markets']
 
-    def retry_count_not_exceeded(self):
-        return self._error['count'] < self._max_error_count
+    def finish_definitions_refresh(self, previous_markets):
+        """
+            Compares refreshed market definitions with previous_markets and
+            removes markets that are not listed anymore. Returns the difference
+            {'Added': [(code_base, code_curr), ...], 'Removed': [...], 'Changed': [...]}
+            or None when the refresh did not load any market.
+        """
+        refreshed_markets = self._refreshed_markets
+        self._refreshed_markets = None
+        if not refreshed_markets:
+            return None
+
+        current_markets = self.get_definitions_snapshot()['Markets']
+        previous_keys = {
+            (code_base, code_curr) for code_base in previous_markets for code_curr in previous_markets[code_base]
+        }
+        diff = {
+            'Added': sorted(refreshed_markets - previous_keys),
+            'Removed': sorted(previous_keys - refreshed_markets),
+            'Changed': sorted(
+                (code_base, code_curr) for code_base, code_curr in refreshed_markets & previous_keys
+                if previous_markets[code_base][code_curr] != current_markets.get(code_base, {}).get(code_curr, {})
+            ),
+        }
+        for code_base, code_curr in diff['Removed']:
+            self.remove_market(code_base, code_curr)
+        return diff
 
     # ##### Generic methods #####
     def get_consolidated_currency_definitions(self):
@@ -160,6 +687,7 @@ class Exchange:
                 'GlobalBase': code_base,
                 'GlobalCurr': code_curr
             }
+            self._quote_keys.pop(market_symbol, None)
         else:
             if market_symbol in self._map_market_to_global_codes:
                 code_base = self._map_market_to_global_codes[market_symbol]['GlobalBase']
@@ -169,38 +697,337 @@ class Exchange:
                 code_curr = self.get_global_code(local_curr)
 
         if code_base is not None and code_curr is not None:
-            if code_base not in self._markets:
-                self._markets[code_base] = {}
-            if code_curr not in self._markets[code_base]:
-                self._markets[code_base][code_curr] = {}
-            if code_base not in self._active_markets:
-                self._active_markets[code_base] = {}
-            if code_curr not in self._active_markets[code_base]:
-                self._active_markets[code_base][code_curr] = {}
-
-            update_dict = {
-                'MarketSymbol':     market_symbol,
-                'BaseMinAmount':    0,
-                'BaseIncrement':    0.00000001,
-                'CurrMinAmount':    0,
-                'CurrIncrement':    0.00000001,
-                'PriceMin':         0,
-                'PriceIncrement':   0.00000001,
-                'IsActive':         True,
-                'IsRestricted':     False,
-                'Notice':           '',
-            }
-            update_dict.update(input_dict)
-            self._markets[code_base][code_curr].update(update_dict)
+            if self._refreshed_markets is not None:
+                self._refreshed_markets.add((code_base, code_curr))
 
-            if update_dict['IsActive'] and not update_dict['IsRestricted']:
-                self._active_markets[code_base][code_curr].update(update_dict)
-            else:
-                self._active_markets[code_base].pop(code_curr)
+            # New markets start with CTMarketStore defaults, quote updates keep loaded definitions
+            market = self.add_market(code_base, code_curr)
+            market['MarketSymbol'] = market_symbol
+            market.update(input_dict)
+            self.update_market_activity(code_base, code_curr)
+            if self._conflator.has_subscribers('Quotes'):
+                quotes = {field: input_dict[field] for field in self._quote_fields if field in input_dict}
+                if quotes:
+                    self._conflator.publish('Quotes', (self.__class__.__name__, code_base, code_curr), quotes, merge=True)
+            if self._event_bus.has_subscribers(CTEvent.MARKET):
+                self._event_bus.publish(CTEvent.MARKET, self.__class__.__name__, (code_base, code_curr), dict(input_dict))
+            self._market_store.get_registry().get_symbol_id(
+                self.__class__.__name__, market_symbol, code_base, code_curr)
+
+    # ##### Market store #####
+    def init_market_store(self, market_store):
+        """
+            Moves markets of the exchange to market_store, which CryptoTrader
+            shares between exchanges to scan all markets at once
+        """
+        markets = {
+            (code_base, code_curr): dict(market)
+            for code_base, base_markets in self._markets.items() for code_curr, market in base_markets.items()
+        }
+        self.clear_markets()
+        self._market_store = market_store
+        registry = market_store.get_registry()
+        registry.get_exchange_id(self.__class__.__name__)
+        for (code_base, code_curr), market in markets.items():
+            self.add_market(code_base, code_curr).update(market)
+            self.update_market_activity(code_base, code_curr)
+            if 'MarketSymbol' in market:
+                registry.get_symbol_id(self.__class__.__name__, market['MarketSymbol'], code_base, code_curr)
+
+    def get_market_store(self):
+        return self._market_store
+
+    def add_market(self, code_base, code_curr):
+        """
+            Returns the market row, creating it in the market store when needed
+        """
+        market = self._markets.get(code_base, {}).get(code_curr, None)
+        if market is None:
+            with self._markets_lock:
+                market = self._markets.get(code_base, {}).get(code_curr, None)
+                if market is None:
+                    row = self._market_store.add_market(self.__class__.__name__, code_base, code_curr)
+                    market = CTMarketRow(self._market_store, row)
+                    self._markets = self.replace_market(self._markets, code_base, code_curr, market)
+        return market
+
+    @staticmethod
+    def replace_market(markets, code_base, code_curr, market=None):
+        """
+            Copy-on-write change of nested dictionaries code_base -> code_curr
+            -> market that other threads may be iterating. The dictionary of
+            code_base is replaced by a changed copy, the outer one is copied
+            only when code_base is new, so readers never see a dictionary
+            change size. Returns the dictionary to keep, market None removes.
+            Called with _markets_lock held, otherwise concurrent writers copy
+            the same dictionary and only the last change survives.
+        """
+        base_markets = dict(markets.get(code_base, {}))
+        if market is None:
+            base_markets.pop(code_curr, None)
+        else:
+            base_markets[code_curr] = market
+        if code_base not in markets:
+            markets = dict(markets)
+        markets[code_base] = base_markets
+        return markets
+
+    def update_market_activity(self, code_base, code_curr):
+        """
+            Keeps _active_markets in line with IsActive and IsRestricted of the market
+        """
+        with self._markets_lock:
+            market = self._markets.get(code_base, {}).get(code_curr, None)
+            if market is None:
+                return
+            is_listed = self._active_markets.get(code_base, {}).get(code_curr, None) is market
+            if market['IsActive'] and not market['IsRestricted']:
+                if not is_listed:
+                    self._active_markets = self.replace_market(self._active_markets, code_base, code_curr, market)
+            elif code_curr in self._active_markets.get(code_base, {}):
+                self._active_markets = self.replace_market(self._active_markets, code_base, code_curr)
+
+    def remove_market(self, code_base, code_curr):
+        """
+            Forgets a market that is no longer listed
+        """
+        with self._markets_lock:
+            market = self._markets.get(code_base, {}).get(code_curr, None)
+            if market is None:
+                return
+            self._markets = self.replace_market(self._markets, code_base, code_curr)
+            if code_curr in self._active_markets.get(code_base, {}):
+                self._active_markets = self.replace_market(self._active_markets, code_base, code_curr)
+            self._map_market_to_global_codes.pop(market.get('MarketSymbol', None), None)
+            self._market_store.remove_market(self.__class__.__name__, code_base, code_curr)
+            self._quote_keys = {}
+        self._conflator.remove('Quotes', (self.__class__.__name__, code_base, code_curr))
+
+    def clear_markets(self):
+        """
+            Forgets all markets like remove_market() does, returns the
+            removed [(code_base, code_curr), ...]. CryptoTrader drops them
+            from its aggregate on its next refresh_agg_active_markets().
+        """
+        with self._markets_lock:
+            removed = [
+                (code_base, code_curr) for code_base, base_markets in self._markets.items() for code_curr in base_markets
+            ]
+            for code_base, code_curr in removed:
+                self._market_store.remove_market(self.__class__.__name__, code_base, code_curr)
+            self._markets = {}
+            self._active_markets = {}
+            self._quote_keys = {}
+        for code_base, code_curr in removed:
+            self._conflator.remove('Quotes', (self.__class__.__name__, code_base, code_curr))
+        return removed
+
+    # ##### Quotes fast path #####
+    def get_quote_key(self, market_symbol):
+        """
+            Market store row of market_symbol for update_quotes(), resolved
+            once per symbol. None for markets without definitions.
+        """
+        key = self._quote_keys.get(market_symbol, None)
+        if key is None:
+            codes = self._map_market_to_global_codes.get(market_symbol, None)
+            if codes is None:
+                return None
+            market = self._markets.get(codes['GlobalBase'], {}).get(codes['GlobalCurr'], None)
+            if market is None:
+                return None
+            key = self._quote_keys[market_symbol] = market.get_row()
+        return key
+
+    def update_quotes(self, fields, batch):
+        """
+            Applies quotes of a whole message in one pass.
+            fields - tuple of numeric market fields, e.g. ('BestBid', 'BestAsk')
+            batch - list of (get_quote_key(market_symbol), value of fields[0], ...)
+            Unlike update_market() it never creates markets nor changes their
+            definitions. TimeStamp values are epoch seconds.
+            Debug: ct['Binance'].update_quotes(('BestBid',), [(ct['Binance'].get_quote_key('ETHBTC'), 0.02)])
+        """
+        if batch:
+            self._market_store.update_quotes(fields, batch)
+            if self._conflator.has_subscribers('Quotes') or self._event_bus.has_subscribers(CTEvent.MARKET):
+                self.publish_quotes(fields, [entry[0] for entry in batch], [entry[1:] for entry in batch])
+
+    def update_quote_columns(self, fields, rows, values):
+        """
+            update_quotes() of a frame already converted column-wise,
+            rows - array of get_quote_key() results, values - float array
+            of shape (len(rows), len(fields))
+        """
+        if len(rows):
+            self._market_store.update_quote_columns(fields, rows, values)
+            if self._conflator.has_subscribers('Quotes') or self._event_bus.has_subscribers(CTEvent.MARKET):
+                self.publish_quotes(fields, rows.tolist(), values.tolist())
+
+    def publish_quotes(self, fields, rows, values):
+        """
+            Hands quotes applied to the market store to the conflator and
+            the event bus, values - one sequence of values of fields per row
+        """
+        exchange = self.__class__.__name__
+        published = [index for index, field in enumerate(fields) if field in self._quote_fields]
+        get_market = self._market_store.get_market
+        quotes = [
+            (get_market(row), {fields[index]: row_values[index] for index in published})
+            for row, row_values in zip(rows, values)
+        ]
+        self._conflator.publish_many('Quotes', (((exchange,) + market, data) for market, data in quotes), merge=True)
+        self._event_bus.publish_many(CTEvent.MARKET, exchange, quotes)
+
+    def update_quote_activity(self, market_symbol, key, is_active, is_restricted):
+        """
+            Goes through update_market() only when a quote message changes
+            whether the market can be traded
+        """
+        if self._market_store.get_value(key, 'IsActive') != bool(is_active) or \
+                self._market_store.get_value(key, 'IsRestricted') != bool(is_restricted):
+            self.update_market(market_symbol, {'IsActive': is_active, 'IsRestricted': is_restricted})
 
     def get_market_symbol(self, code_base, code_curr):
         return self._markets[code_base][code_curr]['MarketSymbol']
 
+    def get_price_increment(self, market_symbol):
+        codes = self._map_market_to_global_codes.get(market_symbol, None)
+        if codes is None:
+            return None
+        market = self._markets.get(codes['GlobalBase'], {}).get(codes['GlobalCurr'], None)
+        if market is None:
+            return None
+        return market.get('PriceIncrement', None)
+
+    # ##### Websocket order books #####
+    def create_local_order_book(self, market_symbol):
+        """
+            Empty websocket order book of market_symbol in _order_book, priced
+            in ticks of the PriceIncrement of the market
+        """
+        self._order_book[market_symbol] = CTLocalOrderBook(self.get_price_increment(market_symbol))
+        return self._order_book[market_symbol]
+
+    def get_local_order_book(self, market_symbol):
+        """
+            Websocket order book of market_symbol, created when missing
+        """
+        book = self._order_book.get(market_symbol, None)
+        if book is None:
+            book = self.create_local_order_book(market_symbol)
+        return book
+
+    def subscribe_order_book(self, market_symbol):
+        """
+            Starts the websocket order book of market_symbol, it becomes
+            consistent once the first snapshot is loaded
+        """
+        book = self._order_book.get(market_symbol, None)
+        if book is None:
+            book = self.create_local_order_book(market_symbol)
+            self.ws_subscribe(market_symbol)
+        return book
+
+    def apply_order_book_delta(self, market_symbol, first_sequence, last_sequence, changes):
+        """
+            Applies changes [(side, price, amount), ...] numbered first_sequence
+            to last_sequence by the exchange to the order book of market_symbol.
+            Deltas arriving before the snapshot are buffered by the book,
+            a gap in the sequence starts resync_order_book().
+        """
+        book = self._order_book.get(market_symbol, None)
+        if book is None:
+            return
+        if not book.apply_delta(first_sequence, last_sequence, changes):
+            print('{} order book {} has a sequence gap at {}, resynchronizing'.format(
+                self.__class__.__name__, market_symbol, first_sequence))
+            self.resync_order_book(market_symbol)
+        self.publish_order_book(market_symbol)
+
+    def publish_order_book(self, market_symbol):
+        """
+            Marks the order book of market_symbol changed in the conflator,
+            views read the book itself when they repaint
+        """
+        self._conflator.publish('OrderBooks', (self.__class__.__name__, market_symbol))
+        self._event_bus.publish(CTEvent.ORDER_BOOK, self.__class__.__name__, market_symbol)
+
+    def resync_order_book(self, market_symbol):
+        """
+            Brings an inconsistent order book back in sync. The default loads a
+            REST snapshot with async_get_order_book_snapshot() and replays the
+            deltas buffered meanwhile, exchanges whose websocket sends the
+            book on subscription resubscribe instead.
+        """
+        book = self._order_book.get(market_symbol, None)
+        if book is None:
+            return
+        book.start_resync()
+        self.publish_order_book(market_symbol)
+        self.submit_order_book_resync(market_symbol, book)
+
+    def submit_order_book_resync(self, market_symbol, book):
+        """
+            Starts async_resync_order_book() unless one is running for book
+            already, e.g. reconnects while snapshots keep failing do not pile
+            up retrying coroutines
+        """
+        with self._order_book_resyncs_lock:
+            if book in self._order_book_resyncs:
+                return
+            self._order_book_resyncs.add(book)
+        CTEventLoop.instance().submit(self.async_resync_order_book(market_symbol, book))
+
+    async def async_resync_order_book(self, market_symbol, book):
+        try:
+            await self.async_load_order_book_snapshots(market_symbol, book)
+        finally:
+            with self._order_book_resyncs_lock:
+                self._order_book_resyncs.discard(book)
+        # A gap found after the snapshot loaded but before the discard was not resubmitted
+        if book.is_syncing() and self._order_book.get(market_symbol, None) is book:
+            self.submit_order_book_resync(market_symbol, book)
+
+    async def async_load_order_book_snapshots(self, market_symbol, book):
+        """
+            Loads snapshots until one is continued by the buffered deltas. A
+            syncing book only buffers deltas and no gap starts another resync,
+            so it keeps trying with capped backoff until the book is removed.
+        """
+        delay = self._order_book_resync_delay
+        while self._order_book.get(market_symbol, None) is book:
+            try:
+                bids, asks, sequence = await self.async_get_order_book_snapshot(market_symbol)
+            except Exception as e:
+                print('{} order book snapshot of {} failed: {}'.format(self.__class__.__name__, market_symbol, e))
+            else:
+                if self._order_book.get(market_symbol, None) is not book:
+                    return
+                loaded = book.load_snapshot(bids, asks, sequence)
+                self.publish_order_book(market_symbol)
+                if loaded:
+                    return
+            print('{} order book {} not resynchronized, retrying in {} seconds'.format(
+                self.__class__.__name__, market_symbol, delay))
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self._order_book_resync_max_delay)
+
+    async def async_get_order_book_snapshot(self, market_symbol):
+        """
+            Full order book of market_symbol for resync_order_book() as
+            (bids, asks, sequence), bids and asks are iterables of (price, amount)
+            and sequence is the number of the last delta included in them
+        """
+        self.raise_not_implemented_error()
+
+    def get_order_book_states(self):
+        """
+            Sequence, consistency and resync counters of the websocket order books
+            Debug: ct['Poloniex'].get_order_book_states()
+        """
+        return {market_symbol: book.get_state() for market_symbol, book in list(self._order_book.items())}
+
     def update_market_quotes(self):
         """
             Updates _markets with current market definitions
@@ -213,6 +1040,40 @@ class Exchange:
         """
         self.raise_not_implemented_error()
 
+    async def async_connect(self):
+        """
+            First step of loading the exchange: network setup that must happen
+            before definitions are requested (e.g. server time). Kept out of
+            constructors so that exchanges are created without waiting.
+        """
+        pass
+
+    async def async_update_currency_definitions(self):
+        """
+            Coroutine version of update_currency_definitions()
+        """
+        await self.run_in_executor(self.update_currency_definitions)
+
+    async def async_update_market_definitions(self):
+        """
+            Coroutine version of update_market_definitions()
+        """
+        await self.run_in_executor(self.update_market_definitions)
+
+    async def async_update_market_quotes(self):
+        """
+            Coroutine version of update_market_quotes(). Exchanges override it
+            with a native implementation on top of async_http_request(), the
+            default runs the blocking version in the executor.
+        """
+        await self.run_in_executor(self.update_market_quotes)
+
+    async def async_update_market_24hrs(self):
+        """
+            Coroutine version of update_market_24hrs()
+        """
+        await self.run_in_executor(self.update_market_24hrs)
+
     def update_open_user_orders_in_market(self, market):
         """
             get_consolidated_open_user_orders_in_market() needs to return a list
@@ -232,6 +1093,13 @@ class Exchange:
         """
         self._open_orders[market] = self.get_consolidated_open_user_orders_in_market(market)
         self._timestamps['update_open_user_orders_in_market'] = time.time()
+        self.publish_open_orders(market)
+
+    def publish_open_orders(self, market):
+        """
+            Announces changed open orders of market, also called by websocket feeds
+        """
+        self._event_bus.publish(CTEvent.OPEN_ORDERS, self.__class__.__name__, market, self._open_orders[market])
 
     def update_recent_market_trades_per_market(self, market):
         """
@@ -251,6 +1119,19 @@ class Exchange:
         """
         self._recent_market_trades[market] = self.get_consolidated_recent_market_trades_per_market(market)
         self._timestamps['update_recent_market_trades_per_market'] = time.time()
+        self.publish_trades(market)
+
+    def publish_trades(self, market):
+        """
+            Announces new trade prints of market, also called by websocket feeds
+        """
+        self._event_bus.publish(CTEvent.TRADES, self.__class__.__name__, market, self._recent_market_trades[market])
+
+    async def async_update_recent_market_trades_per_market(self, market):
+        """
+            Coroutine version of update_recent_market_trades_per_market()
+        """
+        await self.run_in_executor(self.update_recent_market_trades_per_market, market)
 
     def load_available_balances(self):
         """
@@ -281,6 +1162,12 @@ class Exchange:
         """
         self.raise_not_implemented_error()
 
+    async def async_get_consolidated_order_book(self, market, depth):
+        """
+            Coroutine version of get_consolidated_order_book()
+        """
+        return await self.run_in_executor(self.get_consolidated_order_book, market, depth)
+
     def get_consolidated_klines(self, market_symbol, interval, lookback):
         """
             interval is an exchange specific name, e.g. 'fiveMin'
@@ -380,4 +1267,11 @@ class Exchange:
     def get_available_balance(self, currency, force_update=False):
         if not self._available_balances or force_update:
             self.load_available_balances()
+            self.publish_balances()
         return self._available_balances.get(currency, 0)
+
+    def publish_balances(self):
+        """
+            Announces changed available balances, also called by websocket feeds
+        """
+        self._event_bus.publish(CTEvent.BALANCES, self.__class__.__name__, None, self._available_balances)
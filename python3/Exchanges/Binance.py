@@ -1,15 +1,16 @@
 import hashlib
 import hmac
-import json
 import time
 from datetime import datetime
+from operator import itemgetter
+from urllib.parse import urlsplit, parse_qs
 
-import requests
-import websocket
-from PyQt5.QtCore import QThreadPool
+import numpy as np
 
+from BinanceStreams import CTBinanceStreams
+from EventLoop import CTEventLoop
 from Exchange import Exchange
-from Worker import CTWorker
+from Retry import CTRequestError
 
 
 class Binance(Exchange):
@@ -39,65 +40,131 @@ class Binance(Exchange):
             '1w':   7*24*60,
             '1M':   30*24*60
         }
-        try:
-            self._timestamp_correction = int(self.public_get_server_time()) - int(time.time()*1000)
-        except Exception as e:
-            self._timestamp_correction = 0
-        self.public_update_exchange_info()
-        self._thread_pool = QThreadPool()
-        self._thread_pool.start(CTWorker(self.ws_init))
-
-        self._ws = None
+        # Request weights per endpoint, endpoints missing here weigh 1
+        self._request_weights = {
+            '/api/v3/allOrders':        5,
+            '/api/v3/account':          5,
+            '/api/v3/myTrades':         5,
+        }
+        # Request weights when the symbol parameter is omitted
+        self._request_weights_without_symbol = {
+            '/api/v1/ticker/24hr':          40,
+            '/api/v3/ticker/price':         2,
+            '/api/v3/ticker/bookTicker':    2,
+            '/api/v3/openOrders':           40,
+        }
+        self._rate_limit_buckets = {}
+        self.init_rate_limits()
+        # Error codes worth another attempt: unknown/internal errors, disconnects,
+        # timeouts, rate limits and timestamps outside of recvWindow. Anything else
+        # (bad parameters, rejected orders, invalid keys) fails straight away.
+        self._retryable_error_codes = {-1000, -1001, -1003, -1006, -1007, -1015, -1016, -1021}
+        self._timestamp_correction = 0
+        # Market fields of 24 hour ticker messages and statistics, in update_quotes() order
+        self._ticker_fields = (
+            'BaseVolume',
+            'CurrVolume',
+            'BestBid',
+            'BestAsk',
+            'BestBidSize',
+            'BestAskSize',
+            '24HrHigh',
+            '24HrLow',
+            '24HrPercentMove',
+            'LastTradedPrice',
+            'TimeStamp',
+        )
+        # Keys of _ticker_fields in !ticker@arr entries, TimeStamp comes from the close time 'C'
+        self._get_ticker_values = itemgetter('q', 'v', 'b', 'a', 'B', 'A', 'h', 'l', 'P', 'c')
+        # Market symbol -> (quote key, close time, values) of the last applied ticker entry
+        self._ticker_versions = {}
+        self._book_ticker_fields = ('BestBid', 'BestAsk', 'BestBidSize', 'BestAskSize')
+        self._streams = CTBinanceStreams(on_open=self.ws_on_open)
+        # Depth of REST order book snapshots the diff-depth streams are applied to
+        self._order_book_snapshot_depth = 1000
         self._implements = {
             'ws_24hour_market_moves',
             'ws_all_markets_best_bid_ask',
+            'ws_order_book',
         }
 
+        # Started last, stream parsers use attributes set above
+        self.ws_init()
+
+    def validate_response(self, results):
+        """
+            Raises CTRequestError for responses carrying a Binance error code
+        """
+        if isinstance(results, dict) and 'code' in results:
+            raise CTRequestError(
+                results.get('msg', ''),
+                retryable=results['code'] in self._retryable_error_codes,
+                code=results['code']
+            )
+        return results
+
     def public_get_request(self, url):
-        try:
-            results = requests.get(self._BASE_URL + url).json()
-            if 'code' in results:
-                self.log_request_error(results['msg'])
-                if self.retry_count_not_exceeded():
-                    return self.public_get_request(url)
-                else:
-                    return {}
-            else:
-                self.log_request_success()
-                return results
-        except Exception as e:
-            self.log_request_error(self._BASE_URL + url)
-            if self.retry_count_not_exceeded():
-                return self.public_get_request(url)
-            else:
-                return {}
+        return self.execute_request(
+            urlsplit(url).path,
+            lambda: self.decode_response(self.http_request('get', self._BASE_URL + url)),
+            self.validate_response,
+            default={},
+            cache_key=url
+        )
+
+    async def async_public_get_request(self, url):
+        return await self.async_execute_request(
+            urlsplit(url).path,
+            lambda: self.async_http_request('get', self._BASE_URL + url),
+            self.validate_response,
+            default={},
+            cache_key=url
+        )
+
+    def private_sign_request(self, url, req):
+        """
+            Returns signed request url and headers
+        """
+        req['timestamp'] = int(time.time()*1000) + self._timestamp_correction
+        query_string = '&'.join(["{}={}".format(k, v) for k, v in req.items()])
+        signature = hmac.new(self._API_SECRET.encode(), query_string.encode(), hashlib.sha256).hexdigest()
+        query_string = query_string + '&signature=' + signature
+
+        headers = {'X-MBX-APIKEY': self._API_KEY}
+
+        return self._BASE_URL + url + '?' + query_string, headers
 
     def private_request(self, method, url, req={}):
-        try:
-            req['timestamp'] = int(time.time()*1000) + self._timestamp_correction
-            query_string = '&'.join(["{}={}".format(k, v) for k, v in req.items()])
-            signature = hmac.new(self._API_SECRET.encode(), query_string.encode(), hashlib.sha256).hexdigest()
-            query_string = query_string + '&signature=' + signature
-
-            headers = {'X-MBX-APIKEY': self._API_KEY}
-
-            req_url = self._BASE_URL + url + '?' + query_string
-            results = getattr(requests, method)(req_url, headers=headers).json()
-            if 'code' in results:
-                self.log_request_error(results['msg'])
-                if self.retry_count_not_exceeded():
-                    return self.private_request(method, url, req)
-                else:
-                    return {}
-            else:
-                self.log_request_success()
-                return results
-        except Exception as e:
-            self.log_request_error(str(e))
-            if self.retry_count_not_exceeded():
-                return self.private_request(method, url, req)
-            else:
-                return {}
+        def send():
+            # Signed again on every attempt, so that the timestamp stays within recvWindow
+            req_url, headers = self.private_sign_request(url, dict(req))
+            return self.decode_response(self.http_request(method, req_url, headers=headers))
+        return self.execute_request(
+            url,
+            send,
+            self.validate_response,
+            idempotent=method != 'post',
+            default={},
+            cache_key=url + '?' + self.order_params_for_sig(req),
+            method=method,
+            # Account data must not be reused, only identical calls in flight are merged
+            max_age=0
+        )
+
+    async def async_private_request(self, method, url, req={}):
+        def send():
+            req_url, headers = self.private_sign_request(url, dict(req))
+            return self.async_http_request(method, req_url, headers=headers)
+        return await self.async_execute_request(
+            url,
+            send,
+            self.validate_response,
+            idempotent=method != 'post',
+            default={},
+            cache_key=url + '?' + self.order_params_for_sig(req),
+            method=method,
+            max_age=0
+        )
 
     # ############################################
     # ##### Exchange specific public methods #####
@@ -203,8 +270,99 @@ class Binance(Exchange):
              'timezone': 'UTC'}
         """
         self._exchangeInfo = self.public_get_request('/api/v1/exchangeInfo')
+        if isinstance(self._exchangeInfo.get('rateLimits', None), list):
+            self.init_rate_limits(self._exchangeInfo['rateLimits'])
         return self._exchangeInfo
 
+    def update_timestamp_correction(self):
+        """
+            Difference between Binance server time and local time used to sign private requests
+        """
+        try:
+            self._timestamp_correction = int(self.public_get_server_time()) - int(time.time()*1000)
+        except Exception as e:
+            self.log_request_error(str(e))
+
+    async def async_connect(self):
+        await self.run_in_executor(self.update_timestamp_correction)
+
+    def get_exchange_info(self, force_update=False):
+        """
+            exchangeInfo is large, it is downloaded on first use (or when
+            force_update is set) instead of in the constructor
+        """
+        if force_update or not self._exchangeInfo:
+            self.public_update_exchange_info()
+        return self._exchangeInfo
+
+    def init_rate_limits(self, rate_limits=None):
+        """
+            Seeds rate limiter buckets with exchangeInfo rateLimits. Until
+            exchangeInfo is downloaded the documented defaults are used.
+            Bucket names follow usage headers, e.g. REQUEST_WEIGHT_1M is
+            corrected by X-MBX-USED-WEIGHT-1M and ORDERS_10S by X-MBX-ORDER-COUNT-10S.
+        """
+        if rate_limits is None:
+            rate_limits = [
+                {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': 1200},
+                {'rateLimitType': 'ORDERS', 'interval': 'SECOND', 'intervalNum': 1, 'limit': 10},
+                {'rateLimitType': 'ORDERS', 'interval': 'DAY', 'intervalNum': 1, 'limit': 100000},
+            ]
+        interval_seconds = {
+            'SECOND':   1,
+            'MINUTE':   60,
+            'HOUR':     60*60,
+            'DAY':      24*60*60,
+        }
+        usage_headers = {
+            'REQUEST_WEIGHT':   'X-MBX-USED-WEIGHT-',
+            'ORDERS':           'X-MBX-ORDER-COUNT-',
+        }
+        for rate_limit in rate_limits:
+            try:
+                limit_type = rate_limit['rateLimitType']
+                interval_num = rate_limit.get('intervalNum', 1)
+                suffix = '{}{}'.format(interval_num, rate_limit['interval'][0])
+                name = limit_type + '_' + suffix
+                self._rate_limiter.set_bucket(
+                    name,
+                    rate_limit['limit'],
+                    interval_num * interval_seconds[rate_limit['interval']]
+                )
+                if name not in self._rate_limit_buckets.setdefault(limit_type, []):
+                    self._rate_limit_buckets[limit_type].append(name)
+                if limit_type in usage_headers:
+                    self._rate_limiter.set_usage_header(usage_headers[limit_type] + suffix, name)
+            except Exception as e:
+                self.log_request_error(str(e))
+
+    def get_request_weights(self, method, url):
+        """
+            Request weight depends on endpoint and on parameters (omitted
+            symbol, order book limit). New orders also count against ORDERS limits.
+        """
+        parts = urlsplit(url)
+        params = parse_qs(parts.query)
+        weight = self._request_weights.get(parts.path, 1)
+        if 'symbol' not in params:
+            weight = self._request_weights_without_symbol.get(parts.path, weight)
+        if parts.path == '/api/v1/depth':
+            limit = int(params.get('limit', ['100'])[0])
+            if limit > 500:
+                weight = 10
+            elif limit > 100:
+                weight = 5
+
+        weights = {}
+        for name in self._rate_limit_buckets.get('REQUEST_WEIGHT', []):
+            weights[name] = weight
+        for name in self._rate_limit_buckets.get('RAW_REQUESTS', []):
+            weights[name] = 1
+        if method == 'post' and parts.path == '/api/v3/order':
+            for name in self._rate_limit_buckets.get('ORDERS', []):
+                weights[name] = 1
+        return weights
+
     def public_get_order_book(self, market, depth='5'):
         """
             Get order book for a given currency pair (market).
@@ -719,13 +877,17 @@ class Binance(Exchange):
     # ############################################
 
     def ws_init(self):
+        """
+            Starts the stream connections, the all market ticker array is
+            always subscribed
+        """
         self.ws_subscribe('!ticker@arr', self.ws_on_24hour_ticker_message)
-        self._ws.run_forever()
+        self._streams.start()
 
-    def ws_subscribe(self, channel, message_parser):
+    def ws_subscribe(self, stream, message_parser):
         """
-            Subscibe to a channel
-            The following <channel> values are supported:
+            Subscribe to a stream, message_parser gets the parsed data of its messages
+            The following <stream> values are supported:
             <symbol>@aggTrade - Aggregate Trade Streams
             <symbol>@trade - Trade Streams
             <symbol>@kline_<interval> - Kline/Candlestick Streams
@@ -735,55 +897,112 @@ class Binance(Exchange):
             !ticker@arr - All Market Tickers Stream
             <symbol>@depth<levels> - Partial Book Depth Streams
             <symbol>@depth - Diff. Depth Stream
-            Debug: ct['Poloniex'].ws_subscribe(1000)
-        """
-        self._ws = websocket.WebSocketApp("wss://stream.binance.com:9443/ws/" + channel,
-                                          on_message=message_parser,
-                                          on_error=self.ws_on_error,
-                                          on_close=self.ws_on_close,
-                                          on_ping=self.ws_pong
-                                          )
-
-    def ws_pong(self):
-        self._ws.pong()
-
-    def ws_on_24hour_ticker_message(self, message):
-        parsed_message = json.loads(message)
-        if isinstance(parsed_message, list):
-            for market in parsed_message:
-                try:
-                    market_symbol = market['s']
-                    self.update_market(
-                        market_symbol,
-                        {
-                            'BaseVolume': float(market.get('q', 0)),
-                            'CurrVolume': float(market.get('v', 0)),
-                            'BestBid': float(market.get('b', 0)),
-                            'BestAsk': float(market['a']),
-                            'BestBidSize': float(market['B']),
-                            'BestAskSize': float(market['A']),
-                            '24HrHigh': float(market['h']),
-                            '24HrLow': float(market['l']),
-                            '24HrPercentMove': float(market['P']),
-                            'LastTradedPrice': float(market['c']),
-                            'TimeStamp': datetime.fromtimestamp(market['C'] / 1000),
-                        }
-                    )
-                except Exception as e:
-                    self.log_request_error(str(e))
+            Debug: ct['Binance'].ws_subscribe('ethbtc@trade', print)
+        """
+        self._streams.subscribe(stream, message_parser)
 
-    @staticmethod
-    def ws_on_error(error):
-        print("*** Binance websocket ERROR: ", error)
+    def ws_unsubscribe(self, stream):
+        """
+            Debug: ct['Binance'].ws_unsubscribe('ethbtc@trade')
+        """
+        self._streams.unsubscribe(stream)
 
-    def ws_on_close(self):
-        print("### Binance websocket is closed ###")
-        self.ws_init()
+    def get_ws_supervisors(self):
+        return self._streams.get_supervisors()
+
+    def ws_on_open(self, streams, is_reconnect):
+        """
+            Depth events of the streams were missed while the connection was
+            down, their order books are resynchronized
+        """
+        if is_reconnect:
+            for stream in streams:
+                if stream.endswith('@depth'):
+                    self.resync_order_book(stream[:-len('@depth')].upper())
+
+    def ws_on_depth_message(self, parsed_message):
+        """
+            Diff. depth event, U and u are the first and the last update id:
+            {"e": "depthUpdate", "E": 123456789, "s": "BNBBTC", "U": 157, "u": 160,
+             "b": [["0.0024", "10"]], "a": [["0.0026", "100"]]}
+        """
+        changes = [('Bids', level[0], level[1]) for level in parsed_message['b']]
+        changes.extend(('Asks', level[0], level[1]) for level in parsed_message['a'])
+        self.apply_order_book_delta(parsed_message['s'], parsed_message['U'], parsed_message['u'], changes)
+
+    def ws_on_24hour_ticker_message(self, parsed_message):
+        """
+            All market ticker array, about once a second. Entries whose close
+            time or values did not change since the last applied one are
+            skipped, the values of the others are kept as strings and
+            converted to floats in one NumPy call for the whole frame, which
+            is applied to the market store with one assignment per field.
+        """
+        if not isinstance(parsed_message, list):
+            return
+        versions = self._ticker_versions
+        get_values = self._get_ticker_values
+        rows = []
+        values = []
+        close_times = []
+        for market in parsed_message:
+            try:
+                symbol = market['s']
+                key = self.get_quote_key(symbol)
+                if key is None:
+                    continue
+                close_time = market['C']
+                market_values = get_values(market)
+                version = versions.get(symbol, None)
+                if version is not None and version[0] == key and \
+                        (version[1] >= close_time or version[2] == market_values):
+                    continue
+                versions[symbol] = (key, close_time, market_values)
+                rows.append(key)
+                values.append(market_values)
+                close_times.append(close_time)
+            except Exception as e:
+                self.log_request_error(str(e))
+        if not rows:
+            return
+        try:
+            columns = np.empty((len(rows), len(self._ticker_fields)))
+            columns[:, :-1] = np.array(values, dtype=np.float64)
+            columns[:, -1] = np.array(close_times, dtype=np.float64) / 1000
+        except ValueError as e:
+            # A malformed value fails the whole frame, versions are forgotten so the next one is applied in full
+            self._ticker_versions = {}
+            self.log_request_error(str(e))
+            return
+        self.update_quote_columns(self._ticker_fields, np.array(rows, dtype=np.intp), columns)
 
     # ###########################
     # ##### Generic methods #####
     # ###########################
 
+    def subscribe_order_book(self, market_symbol):
+        """
+            Diff-depth stream of market_symbol on the stream connections plus a
+            REST snapshot, events received before the snapshot are buffered by
+            the book and those up to its lastUpdateId are dropped
+            Debug: ct['Binance'].subscribe_order_book('ETHBTC')
+        """
+        book = self._order_book.get(market_symbol, None)
+        if book is None:
+            book = self.create_local_order_book(market_symbol)
+            self.ws_subscribe(market_symbol.lower() + '@depth', self.ws_on_depth_message)
+            self.submit_order_book_resync(market_symbol, book)
+        return book
+
+    async def async_get_order_book_snapshot(self, market_symbol):
+        results = await self.async_public_get_request(
+            "/api/v1/depth?symbol={}&limit={}".format(market_symbol, self._order_book_snapshot_depth))
+        return (
+            [(bid[0], bid[1]) for bid in results['bids']],
+            [(ask[0], ask[1]) for ask in results['asks']],
+            results['lastUpdateId']
+        )
+
     def get_consolidated_currency_definitions(self):
         """
             Loading currencies
@@ -805,8 +1024,9 @@ class Binance(Exchange):
                 }
         """
         results = {}
-        if isinstance(self._exchangeInfo['symbols'], list):
-            for symbol in self._exchangeInfo['symbols']:
+        symbols = self.get_exchange_info(force_update=True).get('symbols', None)
+        if isinstance(symbols, list):
+            for symbol in symbols:
                 try:
                     self._currencies[symbol['baseAsset']] = {
                         'Name': symbol['baseAsset'],
@@ -844,8 +1064,9 @@ class Binance(Exchange):
             in recently enough
             Debug: ct['Binance'].update_market_definitions()
         """
-        if isinstance(self._exchangeInfo['symbols'], list):
-            for market in self._exchangeInfo['symbols']:
+        symbols = self.get_exchange_info(force_update).get('symbols', None)
+        if isinstance(symbols, list):
+            for market in symbols:
                 try:
                     is_active = market.get('status', '') == 'TRADING'
                     is_restricted = not is_active
@@ -886,23 +1107,35 @@ class Binance(Exchange):
             Used to get the market quotes
             Debug: ct['Binance'].update_market_quotes()
         """
-        book_ticker = self.public_get_ticker()
+        self.apply_market_quotes(self.public_get_ticker())
+
+    async def async_update_market_quotes(self):
+        """
+            Coroutine version of update_market_quotes()
+            Debug: CTEventLoop.instance().run(ct['Binance'].async_update_market_quotes())
+        """
+        self.apply_market_quotes(await self.async_public_get_request('/api/v3/ticker/bookTicker'))
+
+    def apply_market_quotes(self, book_ticker):
+        """
+            Updates markets with public_get_ticker() output for all symbols
+        """
         if isinstance(book_ticker, list):
+            batch = []
             for ticker in book_ticker:
                 try:
-                    market_symbol = ticker['symbol']
-                    update_dict = {
-                        'BestBid': float(ticker['bidPrice']),
-                        'BestAsk': float(ticker['askPrice']),
-                        'BestBidSize': float(ticker['bidQty']),
-                        'BestAskSize': float(ticker['askQty']),
-                    }
-                    self.update_market(
-                        market_symbol,
-                        update_dict
-                    )
+                    key = self.get_quote_key(ticker['symbol'])
+                    if key is not None:
+                        batch.append((
+                            key,
+                            float(ticker['bidPrice']),
+                            float(ticker['askPrice']),
+                            float(ticker['bidQty']),
+                            float(ticker['askQty']),
+                        ))
                 except Exception as e:
                     self.log_request_error(str(e))
+            self.update_quotes(self._book_ticker_fields, batch)
 
     def update_market_24hrs(self):
         """
@@ -911,27 +1144,28 @@ class Binance(Exchange):
         """
         statistics = self.public_get_24hour_statistics()
         if isinstance(statistics, list):
+            batch = []
             for market in statistics:
                 try:
-                    market_symbol = market['symbol']
-                    self.update_market(
-                        market_symbol,
-                        {
-                            'BaseVolume':       float(market.get('quoteVolume', 0)),
-                            'CurrVolume':       float(market.get('volume', 0)),
-                            'BestBid':          float(market['bidPrice']),
-                            'BestAsk':          float(market['askPrice']),
-                            'BestBidSize':      float(market['bidQty']),
-                            'BestAskSize':      float(market['askQty']),
-                            '24HrHigh':         float(market['highPrice']),
-                            '24HrLow':          float(market['lowPrice']),
-                            '24HrPercentMove':  float(market['priceChangePercent']),
-                            'LastTradedPrice':  float(market['lastPrice']),
-                            'TimeStamp':        datetime.fromtimestamp(market['closeTime'] / 1000),
-                        }
-                    )
+                    key = self.get_quote_key(market['symbol'])
+                    if key is not None:
+                        batch.append((
+                            key,
+                            float(market.get('quoteVolume', 0)),
+                            float(market.get('volume', 0)),
+                            float(market['bidPrice']),
+                            float(market['askPrice']),
+                            float(market['bidQty']),
+                            float(market['askQty']),
+                            float(market['highPrice']),
+                            float(market['lowPrice']),
+                            float(market['priceChangePercent']),
+                            float(market['lastPrice']),
+                            market['closeTime'] / 1000,
+                        ))
                 except Exception as e:
                     self.log_request_error(str(e))
+            self.update_quotes(self._ticker_fields, batch)
 
     def get_consolidated_open_user_orders_in_market(self, market):
         """
@@ -1009,7 +1243,14 @@ class Binance(Exchange):
         return results
 
     def get_consolidated_order_book(self, market, depth=5):
-        raw_results = self.public_get_order_book(market, str(depth))
+        return self.format_consolidated_order_book(self.public_get_order_book(market, str(depth)), depth)
+
+    async def async_get_consolidated_order_book(self, market, depth=5):
+        raw_results = await self.async_public_get_request("/api/v1/depth?symbol={}&limit={}".format(market, depth))
+        return self.format_consolidated_order_book(raw_results, depth)
+
+    @staticmethod
+    def format_consolidated_order_book(raw_results, depth):
         take_bid = min(depth, len(raw_results['bids']))
         take_ask = min(depth, len(raw_results['asks']))
 
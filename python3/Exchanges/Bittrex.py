@@ -3,9 +3,8 @@ import hmac
 import time
 from datetime import datetime
 
-import requests
-
 from Exchange import Exchange
+from Retry import CTRequestError
 
 
 class Bittrex(Exchange):
@@ -22,56 +21,103 @@ class Bittrex(Exchange):
             'hour':         60,
             'day':          24*60
         }
+        # Bittrex allows up to 60 API calls per minute
+        self.set_request_rate_limit(60, 60)
+        # Errors caused by the request itself, repeating it cannot help
+        self._fatal_error_messages = {
+            'INVALID_MARKET',
+            'MARKET_NOT_PROVIDED',
+            'INVALID_CURRENCY',
+            'APIKEY_INVALID',
+            'APIKEY_NOT_PROVIDED',
+            'INVALID_SIGNATURE',
+            'INVALID_PERMISSION',
+            'WHITELIST_VIOLATION_IP',
+            'INSUFFICIENT_FUNDS',
+            'MIN_TRADE_REQUIREMENT_NOT_MET',
+            'DUST_TRADE_DISALLOWED_MIN_VALUE_50K_SAT',
+            'ORDER_NOT_OPEN',
+            'UUID_INVALID',
+        }
+        # Commands that must not be sent twice
+        self._non_idempotent_commands = {
+            '/market/buylimit',
+            '/market/selllimit',
+            '/account/withdraw',
+        }
+
+    def validate_response(self, result):
+        """
+            Returns the payload of a successful response, raises CTRequestError otherwise
+        """
+        if result.get('success', False):
+            return result['result']
+        message = result.get('message', '')
+        raise CTRequestError(message, retryable=message not in self._fatal_error_messages)
 
     def public_get_request(self, url, base_url_override=None):
         if base_url_override is None:
             base_url_override = self._BASE_URL
-        try:
-            result = requests.get(base_url_override + url).json()
-            if result.get('success', False):
-                self.log_request_success()
-                return result['result']
-            else:
-                self.log_request_error(result['message'])
-                if self.retry_count_not_exceeded():
-                    return self.public_get_request(url, base_url_override)
-                else:
-                    return {}
-        except Exception as e:
-            self.log_request_error(base_url_override + url + ". " + str(e))
-            if self.retry_count_not_exceeded():
-                return self.public_get_request(url, base_url_override)
-            else:
-                return {}
+        return self.execute_request(
+            url.split('?')[0],
+            lambda: self.decode_response(self.http_request('get', base_url_override + url)),
+            self.validate_response,
+            default={},
+            cache_key=base_url_override + url
+        )
+
+    async def async_public_get_request(self, url, base_url_override=None):
+        if base_url_override is None:
+            base_url_override = self._BASE_URL
+        return await self.async_execute_request(
+            url.split('?')[0],
+            lambda: self.async_http_request('get', base_url_override + url),
+            self.validate_response,
+            default={},
+            cache_key=base_url_override + url
+        )
+
+    def private_sign_request(self, command, extra=''):
+        """
+            Returns signed request url and headers
+        """
+        nonce = str(int(time.time()*1000))
+        request_url = self._BASE_URL + command + '?' + 'apikey=' + self._API_KEY + "&nonce=" + nonce + extra
+        headers = {"apisign": hmac.new(self._API_SECRET.encode(),
+                                       request_url.encode(),
+                                       hashlib.sha512
+                                       ).hexdigest()
+                   }
+        return request_url, headers
 
     def private_request(self, command, extra=''):
-        try:
-            nonce = str(int(time.time()*1000))
-            request_url = self._BASE_URL + command + '?' + 'apikey=' + self._API_KEY + "&nonce=" + nonce + extra
-            result = requests.get(
-                request_url,
-                headers={"apisign": hmac.new(self._API_SECRET.encode(),
-                                             request_url.encode(),
-                                             hashlib.sha512
-                                             ).hexdigest()
-                         }
-            ).json()
-            if result.get('success', None):
-                self.log_request_success()
-                return result['result']
-            else:
-                self.log_request_error(result['message'])
-                if self.retry_count_not_exceeded():
-                    return self.private_request(command, extra)
-                else:
-                    return {}
-
-        except Exception as e:
-            self.log_request_error(str(e))
-            if self.retry_count_not_exceeded():
-                return self.private_request(command, extra)
-            else:
-                return {}
+        def send():
+            # Signed again on every attempt to get a fresh nonce
+            request_url, headers = self.private_sign_request(command, extra)
+            return self.decode_response(self.http_request('get', request_url, headers=headers))
+        return self.execute_request(
+            command,
+            send,
+            self.validate_response,
+            idempotent=command not in self._non_idempotent_commands,
+            default={},
+            cache_key=command + extra,
+            max_age=0
+        )
+
+    async def async_private_request(self, command, extra=''):
+        def send():
+            request_url, headers = self.private_sign_request(command, extra)
+            return self.async_http_request('get', request_url, headers=headers)
+        return await self.async_execute_request(
+            command,
+            send,
+            self.validate_response,
+            idempotent=command not in self._non_idempotent_commands,
+            default={},
+            cache_key=command + extra,
+            max_age=0
+        )
 
     # ############################################
     # ##### Exchange specific public methods #####
@@ -640,7 +686,19 @@ class Bittrex(Exchange):
             Used to get best bids and asks across markets at Bittrex
             Debug: ct['Bittrex'].update_market_quotes()
         """
-        market_summaries = self.public_get_market_summaries()
+        self.apply_market_quotes(self.public_get_market_summaries())
+
+    async def async_update_market_quotes(self):
+        """
+            Coroutine version of update_market_quotes()
+            Debug: CTEventLoop.instance().run(ct['Bittrex'].async_update_market_quotes())
+        """
+        self.apply_market_quotes(await self.async_public_get_request('/public/getmarketsummaries'))
+
+    def apply_market_quotes(self, market_summaries):
+        """
+            Updates markets with public_get_market_summaries() output
+        """
         if isinstance(market_summaries, list):
             for market in market_summaries:
                 market_symbol = market['MarketName']
@@ -727,7 +785,14 @@ class Bittrex(Exchange):
         return results
 
     def get_consolidated_order_book(self, market, depth=5):
-        raw_results = self.public_get_order_book(market, 'both')
+        return self.format_consolidated_order_book(self.public_get_order_book(market, 'both'), depth)
+
+    async def async_get_consolidated_order_book(self, market, depth=5):
+        raw_results = await self.async_public_get_request('/public/getorderbook?market=' + market + '&type=both')
+        return self.format_consolidated_order_book(raw_results, depth)
+
+    @staticmethod
+    def format_consolidated_order_book(raw_results, depth):
         take_bid = min(depth, len(raw_results['buy']))
         take_ask = min(depth, len(raw_results['sell']))
 
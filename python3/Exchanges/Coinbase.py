@@ -1,13 +1,15 @@
-import requests
+from Exchange import Exchange
 
 
-class Coinbase:
-    def __init__(self):
-        pass
+class Coinbase(Exchange):
+    def __init__(self, APIKey='', Secret='', PassPhrase=''):
+        super().__init__(APIKey, Secret, PassPhrase)
+        self._BASE_URL = 'https://api.gdax.com'
+        # Public endpoints are limited to 3 requests per second
+        self.set_request_rate_limit(3, 1)
 
-    @staticmethod
-    def get_request(url):
-        return requests.get('https://api.gdax.com' + url).json()
+    def get_request(self, url):
+        return self.decode_response(self.http_request('get', self._BASE_URL + url))
 
     def get_btc_usd_price(self):
         book = self.get_request('/products/BTC-USD/book')
@@ -1,62 +1,61 @@
 import hashlib
 
-import requests
-
 from Exchange import Exchange
+from Retry import CTRequestError
 
 
 class Hotbit(Exchange):
     def __init__(self, APIKey='', Secret=''):
         super().__init__(APIKey, Secret)
         self._BASE_URL = 'https://api.hotbit.io/api/v1'
+        # Hotbit allows 10 requests per second per IP
+        self.set_request_rate_limit(10, 1)
+        # Error codes worth another attempt: internal error, service unavailable, service timeout
+        self._retryable_error_codes = {2, 3, 5}
+
+    def validate_response(self, result):
+        """
+            Raises CTRequestError for responses carrying an error
+        """
+        error = result.get('error', None)
+        if error is None:
+            return result
+        raise CTRequestError(
+            error.get('message', ''),
+            retryable=error.get('code', None) in self._retryable_error_codes,
+            code=error.get('code', None)
+        )
 
     def get_request(self, url):
-        try:
-            result = requests.get(self._BASE_URL + url).json()
-            if result.get('error', None) is None:
-                self.log_request_success()
-                return result
-            else:
-                self.log_request_error(result['error']['message'])
-                if self.retry_count_not_exceeded():
-                    return self.get_request(url)
-                else:
-                    return {}
-        except Exception as e:
-            self.log_request_error(self._BASE_URL + url + ". " + str(e))
-            if self.retry_count_not_exceeded():
-                return self.get_request(url)
-            else:
-                return {}
+        return self.execute_request(
+            url.split('?')[0],
+            lambda: self.decode_response(self.http_request('get', self._BASE_URL + url)),
+            self.validate_response,
+            default={},
+            cache_key=url
+        )
 
     def trading_api_request(self, method, endpoint='', extra=''):
         """
 
         """
-        try:
+        def send():
             url = self._BASE_URL + endpoint + '?Api_key=' + self._API_KEY + '&sign='
             # string_to_sign = 'api_key=' + self._API_KEY + extra + '&secret_key=' + self._API_SECRET
             signature = hashlib.md5("whatever your string is".encode('utf-8')).hexdigest()
             signature = signature.upper()
             url += signature
-            result = getattr(requests, method)(url).json()
-
-            if result.get('error', None) is None:
-                self.log_request_success()
-                return result
-            else:
-                self.log_request_error(result['error']['message'])
-                if self.retry_count_not_exceeded():
-                    return self.trading_api_request(method, endpoint, extra)
-                else:
-                    return {}
-
-        except Exception as e:
-            self.log_request_error(str(e))
-            if self.retry_count_not_exceeded():
-                return self.trading_api_request(method, endpoint, extra)
-            else:
-                return {}
+            return self.decode_response(self.http_request(method, url))
+        return self.execute_request(
+            endpoint,
+            send,
+            self.validate_response,
+            idempotent=endpoint != '/order.put_limit',
+            default={},
+            cache_key=endpoint + extra,
+            method=method,
+            max_age=0
+        )
 
     # ############################################
     # ##### Exchange specific public methods #####
@@ -374,7 +373,7 @@ class Hotbit(Exchange):
         """
             ct['Hotbit'].get_markets()
         """
-        return requests.get('https://www.hotbit.io/public/markets').json()['Content']
+        return self.decode_response(self.http_request('get', 'https://www.hotbit.io/public/markets'))['Content']
 
     # #############################################
     # ##### Exchange specific private methods #####
@@ -735,8 +734,7 @@ class Hotbit(Exchange):
         return self._currencies
 
     def load_markets(self):
-        self._markets = {}
-        self._active_markets = {}
+        self.clear_markets()
         open_trading_symbols = self.get_all_tickers()
 
         for symbol in open_trading_symbols:
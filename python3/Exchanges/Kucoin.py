@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import hashlib
 import hmac
@@ -6,12 +7,10 @@ import time
 import uuid
 from datetime import datetime
 
-import requests
-import websocket
-from PyQt5.QtCore import QThreadPool
-
+from EventLoop import CTEventLoop
 from Exchange import Exchange
-from Worker import CTWorker
+from Retry import CTRequestError
+from WebsocketSupervisor import CTWebsocketSupervisor
 
 
 class Kucoin(Exchange):
@@ -37,29 +36,82 @@ class Kucoin(Exchange):
             '1day':      24 * 60,
             '1week':     7 * 24 * 60
         }
-        self._ws = None
-        self._ws_token = None
-        self._ws_heartbeat = None
+        # Kucoin public and private REST limits are 30 requests per 3 seconds
+        self.set_request_rate_limit(30, 3)
+        # Error codes worth another attempt: invalid timestamp (the request is
+        # signed again), too many requests and internal server error
+        self._retryable_error_codes = {'400002', '429000', '500000'}
 
-        self._thread_pool = QThreadPool()
-        self._thread_pool.start(CTWorker(self.ws_init))
+        self._ws_token = None
+        # True while async_ws_subscribe_snapshots() is retrying
+        self._ws_snapshots_pending = False
+        self._ws_supervisor = self.add_ws_supervisor(CTWebsocketSupervisor(
+            'Kucoin',
+            self.ws_get_url,
+            self.ws_on_message,
+            get_subscribe_message=lambda subscription: self.ws_get_topic_message('subscribe', subscription),
+            get_unsubscribe_message=lambda subscription: self.ws_get_topic_message('unsubscribe', subscription),
+            on_open=self.ws_on_open
+        ))
+        # Market fields in update_quotes() order
+        self._ticker_fields = ('BestBid', 'BestAsk', 'BestBidSize', 'BestAskSize')
+        self._snapshot_fields = (
+            'BestBid',
+            'BestAsk',
+            'BaseVolume',
+            'CurrVolume',
+            '24HrHigh',
+            '24HrLow',
+            '24HrPercentMove',
+            'LastTradedPrice',
+        )
+        self._all_tickers_fields = (
+            'BestBid',
+            'BestAsk',
+            'CurrVolume',
+            '24HrHigh',
+            '24HrLow',
+            '24HrPercentMove',
+            'LastTradedPrice',
+        )
 
         self._implements = {
             'ws_24hour_market_moves',
             'ws_all_markets_best_bid_ask',
+            'ws_order_book',
         }
 
+        # Started last, ws_on_message() uses attributes set above
+        self.ws_init()
+
+    def validate_response(self, result):
+        """
+            Returns data of a successful response, raises CTRequestError otherwise
+        """
+        code = result.get('code', None)
+        if code == '200000':
+            return result['data']
+        raise CTRequestError(
+            str(result.get('msg', result)),
+            retryable=code in self._retryable_error_codes,
+            code=code
+        )
+
     def public_get_request(self, url):
-        try:
-            result = requests.get(self._BASE_URL + url).json()
-            if result.get('code', None) == '200000':
-                return result['data']
-            else:
-                print(self._BASE_URL + url + ". " + str(result.get('msg')))
-                # return self.public_get_request(url)
-        except Exception as e:
-            print(self._BASE_URL + url + ". " + str(e))
-            # return self.public_get_request(url)
+        return self.execute_request(
+            url.split('?')[0],
+            lambda: self.decode_response(self.http_request('get', self._BASE_URL + url)),
+            self.validate_response,
+            cache_key=url
+        )
+
+    async def async_public_get_request(self, url):
+        return await self.async_execute_request(
+            url.split('?')[0],
+            lambda: self.async_http_request('get', self._BASE_URL + url),
+            self.validate_response,
+            cache_key=url
+        )
 
     def private_sign_request(self, method, endpoint, body, nonce):
         """
@@ -95,39 +147,67 @@ class Kucoin(Exchange):
             "KC-API-TIMESTAMP":     1547015186532   //A timestamp for your request.
             "KC-API-PASSPHRASE":    "Abc123456"   //The passphrase you specified when creating the API key.
         """
-        try:
-            nonce = str(int(time.time()*1000))
-            request_url = self._BASE_URL + endpoint
+        def send():
+            # Signed again on every attempt, so that KC-API-TIMESTAMP stays fresh
+            return self.decode_response(self.http_request(
+                method,
+                self._BASE_URL + endpoint,
+                **self.private_request_arguments(method, endpoint, body)
+            ))
+        return self.execute_request(
+            endpoint.split('?')[0],
+            send,
+            self.validate_response,
+            idempotent=method != 'post',
+            default={},
+            cache_key=endpoint + '?' + self.order_params_for_sig(body),
+            method=method,
+            max_age=0
+        )
+
+    async def async_private_request(self, method, endpoint, body={}):
+        def send():
+            return self.async_http_request(
+                method,
+                self._BASE_URL + endpoint,
+                **self.private_request_arguments(method, endpoint, body)
+            )
+        return await self.async_execute_request(
+            endpoint.split('?')[0],
+            send,
+            self.validate_response,
+            idempotent=method != 'post',
+            default={},
+            cache_key=endpoint + '?' + self.order_params_for_sig(body),
+            method=method,
+            max_age=0
+        )
 
-            body_str = ''
-            if any(body):
-                body_str = json.dumps(body, sort_keys=True, separators=(',', ':'))
+    def private_request_arguments(self, method, endpoint, body):
+        """
+            Returns signed keyword arguments (params or data, headers) for the http request
+        """
+        nonce = str(int(time.time()*1000))
 
-            signature = self.private_sign_request(method, endpoint, body_str, nonce)
+        body_str = ''
+        if any(body):
+            body_str = json.dumps(body, sort_keys=True, separators=(',', ':'))
 
-            request = {}
-            if method == 'get':
-                request['params'] = body
-            else:
-                request['data'] = body_str
-            request['headers'] = {
-                                    'Content-Type': 'application/json',
-                                    "KC-API-KEY": self._API_KEY,
-                                    "KC-API-TIMESTAMP": nonce,
-                                    "KC-API-PASSPHRASE": self._API_PASSPHRASE,
-                                    "KC-API-SIGN": signature
-                                 }
-            result = getattr(requests, method)(request_url, **request).json()
-
-            if result.get('code', None) == '200000':
-                return result['data']
-            else:
-                print(request_url + ". " + str(result))
-                # return self.private_request(method,endpoint,body)
+        signature = self.private_sign_request(method, endpoint, body_str, nonce)
 
-        except Exception as e:
-            print(str(e))
-            return {}
+        request = {}
+        if method == 'get':
+            request['params'] = body
+        else:
+            request['data'] = body_str
+        request['headers'] = {
+                                'Content-Type': 'application/json',
+                                "KC-API-KEY": self._API_KEY,
+                                "KC-API-TIMESTAMP": nonce,
+                                "KC-API-PASSPHRASE": self._API_PASSPHRASE,
+                                "KC-API-SIGN": signature
+                             }
+        return request
 
     # ############################################
     # ##### Exchange specific public methods #####
@@ -146,6 +226,9 @@ class Kucoin(Exchange):
         """
         return self.public_get_request('/api/v1/markets')
 
+    async def async_public_get_base_currencies(self):
+        return await self.async_public_get_request('/api/v1/markets')
+
     def public_get_market_definitions(self):
         """
             Get a list of available currency pairs for trading.
@@ -649,58 +732,104 @@ class Kucoin(Exchange):
         if token_type == 'private':
             return self.private_request('post', '/api/v1/bullet-private')
         else:
-            return requests.post(self._BASE_URL + '/api/v1/bullet-public').json()['data']
+            return self.decode_response(self.http_request('post', self._BASE_URL + '/api/v1/bullet-public'))['data']
 
     def ws_init(self):
+        self._ws_supervisor.start()
+
+    def ws_get_url(self):
+        """
+            Every connection needs a fresh bullet token, it also sets the
+            interval of the ping messages Kucoin expects
+        """
         token = self.ws_get_token('public')
         self._ws_token = token
-        if token['instanceServers'][0]['protocol'] == 'websocket':
-            self._ws = websocket.WebSocketApp(
-                '{}?token={}'.format(token['instanceServers'][0]['endpoint'], token['token']),
-                on_message=self.ws_on_message,
-                on_error=self.ws_on_error,
-                on_close=self.ws_on_close
-            )
-            self._ws.run_forever(ping_interval=30)
+        server = token['instanceServers'][0]
+        if server['protocol'] != 'websocket':
+            raise ValueError('Unsupported Kucoin websocket protocol ' + str(server['protocol']))
+        self._ws_supervisor.set_keepalive(server['pingInterval'] / 1000, self.ws_get_ping_message)
+        return '{}?token={}'.format(server['endpoint'], token['token'])
 
     def ws_subscribe(self, channel, is_private_channel=False):
         """
             To subscribe to a particular channel, the client side should send subscription message to the server.
+            Channels are subscribed again after reconnects.
         """
-        nonce = int(time.time() * 1000000)
-        self._ws.send(json.dumps({
-            "id": nonce,
-            "type": "subscribe",
+        self._ws_supervisor.subscribe((channel, is_private_channel))
+
+    def ws_unsubscribe(self, channel, is_private_channel=False):
+        self._ws_supervisor.unsubscribe((channel, is_private_channel))
+
+    @staticmethod
+    def ws_get_topic_message(message_type, subscription):
+        channel, is_private_channel = subscription
+        return json.dumps({
+            "id": int(time.time() * 1000000),
+            "type": message_type,
             "topic": channel,
             "privateChannel": is_private_channel
-        }))
+        })
 
-    def ws_unsubscribe(self, channel):
-        """
-        """
-        self._ws.send(json.dumps({"command": "unsubscribe", "channel": channel}))
+    @staticmethod
+    def ws_get_ping_message():
+        return json.dumps({"id": int(time.time() * 1000000), "type": "ping"})
+
+    def ws_on_open(self, is_reconnect):
+        """
+            Subscribes the ticker topics, order books missed their changes
+            while disconnected. Runs on the event loop, the base currencies
+            of the snapshot topics are fetched by a coroutine of their own.
+        """
+        self.ws_subscribe('/market/ticker:all')
+        if not self._ws_snapshots_pending:
+            # Subscribed topics are remembered by the supervisor, a retry still running covers this connection too
+            self._ws_snapshots_pending = True
+            CTEventLoop.instance().submit(self.async_ws_subscribe_snapshots())
+        if is_reconnect:
+            for market_symbol in list(self._order_book.keys()):
+                self.resync_order_book(market_symbol)
+
+    async def async_ws_subscribe_snapshots(self):
+        """
+            Subscribes /market/snapshot of every base currency, retrying with
+            backoff until the base currencies could be loaded
+        """
+        delay = 1
+        while True:
+            try:
+                bases = await self.async_public_get_base_currencies()
+            except Exception as e:
+                print('Exception loading Kucoin base currencies: {}'.format(e))
+                bases = None
+            if bases:
+                for base in bases:
+                    self.ws_subscribe('/market/snapshot:' + base)
+                self._ws_snapshots_pending = False
+                return
+            print('Kucoin market snapshots not subscribed, retrying in {} seconds'.format(delay))
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
 
     def ws_on_message(self, message):
-        parsed_message = json.loads(message)
-        if parsed_message['type'] == 'welcome':
-            self.ws_subscribe('/market/ticker:all')
-            for base in self.public_get_base_currencies():
-                self.ws_subscribe('/market/snapshot:' + base)
+        parsed_message = self.decode_json(message)
+        if parsed_message['type'] in ('welcome', 'pong', 'ack'):
             return
         if parsed_message['type'] == 'message':
+            if parsed_message['topic'][:15] == '/market/level2:':
+                self.ws_on_level2_message(parsed_message['data'])
+                return
             if parsed_message['topic'] == '/market/ticker:all':
                 try:
-                    market_symbol = parsed_message['subject']
-                    update_dict = {
-                        'BestBid': float(parsed_message['data'].get('bestBid', 0)),
-                        'BestAsk': float(parsed_message['data'].get('bestAsk', 0)),
-                        'BestBidSize': float(parsed_message['data'].get('bestBidSize', 0)),
-                        'BestAskSize': float(parsed_message['data'].get('bestAskSize', 0)),
-                    }
-                    self.update_market(
-                        market_symbol,
-                        update_dict
-                    )
+                    key = self.get_quote_key(parsed_message['subject'])
+                    if key is not None:
+                        data = parsed_message['data']
+                        self.update_quotes(self._ticker_fields, [(
+                            key,
+                            float(data.get('bestBid', 0)),
+                            float(data.get('bestAsk', 0)),
+                            float(data.get('bestBidSize', 0)),
+                            float(data.get('bestAskSize', 0)),
+                        )])
                 except Exception as e:
                     self.log_request_error(str(e))
                 return
@@ -708,36 +837,39 @@ class Kucoin(Exchange):
                 try:
                     new_data = parsed_message['data']['data']
                     market_symbol = new_data['symbol']
-                    is_active = new_data['trading']
-                    is_restricted = not is_active
-                    update_dict = {
-                        'BestBid': float(new_data.get('buy', 0)),
-                        'BestAsk': float(new_data.get('sell', 0)),
-                        'IsActive': is_active,
-                        'IsRestricted': is_restricted,
-                        'BaseVolume': float(new_data.get('volValue', 0)),
-                        'CurrVolume': float(new_data.get('vol', 0)),
-                        '24HrHigh': float(new_data.get('high', 0)),
-                        '24HrLow': float(new_data.get('low', 0)),
-                        '24HrPercentMove': float(new_data.get('changeRate', 0)) * 100,
-                        'LastTradedPrice': float(new_data.get('lastTradedPrice', 0))
-                    }
-                    self.update_market(
-                        market_symbol,
-                        update_dict
-                    )
+                    key = self.get_quote_key(market_symbol)
+                    if key is not None:
+                        is_active = new_data['trading']
+                        self.update_quote_activity(market_symbol, key, is_active, not is_active)
+                        self.update_quotes(self._snapshot_fields, [(
+                            key,
+                            float(new_data.get('buy', 0)),
+                            float(new_data.get('sell', 0)),
+                            float(new_data.get('volValue', 0)),
+                            float(new_data.get('vol', 0)),
+                            float(new_data.get('high', 0)),
+                            float(new_data.get('low', 0)),
+                            float(new_data.get('changeRate', 0)) * 100,
+                            float(new_data.get('lastTradedPrice', 0)),
+                        )])
                 except Exception as e:
                     self.log_request_error(str(e))
                 return
         print(message)
 
-    @staticmethod
-    def ws_on_error(error):
-        print("*** Kucoin websocket ERROR: ", error)
-
-    @staticmethod
-    def ws_on_close():
-        print("### Kucoin websocket is closed ###")
+    def ws_on_level2_message(self, data):
+        """
+            Level-2 market data, every change carries its own sequence number,
+            a price of "0" only advances the sequence:
+            {'sequenceStart': 1545896669105, 'sequenceEnd': 1545896669106, 'symbol': 'BTC-USDT',
+             'changes': {'asks': [['6', '1', '1545896669105']], 'bids': [['4', '1', '1545896669106']]}}
+        """
+        changes = [(int(change[2]), 'Asks', change[0], change[1]) for change in data['changes']['asks']]
+        changes.extend((int(change[2]), 'Bids', change[0], change[1]) for change in data['changes']['bids'])
+        # Applied one by one, a message may straddle the sequence of the snapshot
+        for sequence, side, price, size in sorted(changes):
+            self.apply_order_book_delta(
+                data['symbol'], sequence, sequence, [(side, price, size)] if float(price) > 0 else [])
 
     # ###########################
     # ##### Generic methods #####
@@ -821,26 +953,39 @@ class Kucoin(Exchange):
             Used to get the market quotes
             Debug: ct['Kucoin'].update_market_quotes()
         """
-        all_markets = self.public_get_all_tickers()['ticker']
+        self.apply_market_quotes(self.public_get_all_tickers())
+
+    async def async_update_market_quotes(self):
+        """
+            Coroutine version of update_market_quotes()
+            Debug: CTEventLoop.instance().run(ct['Kucoin'].async_update_market_quotes())
+        """
+        self.apply_market_quotes(await self.async_public_get_request('/api/v1/market/allTickers'))
+
+    def apply_market_quotes(self, all_tickers):
+        """
+            Updates markets with public_get_all_tickers() output
+        """
+        all_markets = all_tickers.get('ticker', None) if isinstance(all_tickers, dict) else None
         if isinstance(all_markets, list):
+            batch = []
             for ticker in all_markets:
                 try:
-                    market_symbol = ticker['symbol']
-                    update_dict = {
-                        'BestBid':          float(ticker.get('buy', 0)),
-                        'BestAsk':          float(ticker.get('sell', 0)),
-                        'CurrVolume':       float(ticker.get('vol', 0)),
-                        '24HrHigh':         float(ticker.get('high', 0)),
-                        '24HrLow':          float(ticker.get('low', 0)),
-                        '24HrPercentMove':  float(ticker.get('changeRate', 0)) * 100,
-                        'LastTradedPrice':  float(ticker.get('last', 0)),
-                    }
-                    self.update_market(
-                        market_symbol,
-                        update_dict
-                    )
+                    key = self.get_quote_key(ticker['symbol'])
+                    if key is not None:
+                        batch.append((
+                            key,
+                            float(ticker.get('buy', 0)),
+                            float(ticker.get('sell', 0)),
+                            float(ticker.get('vol', 0)),
+                            float(ticker.get('high', 0)),
+                            float(ticker.get('low', 0)),
+                            float(ticker.get('changeRate', 0)) * 100,
+                            float(ticker.get('last', 0)),
+                        ))
                 except Exception as e:
                     self.log_request_error(str(e))
+            self.update_quotes(self._all_tickers_fields, batch)
 
     def update_market_24hrs(self):
         """
@@ -937,7 +1082,33 @@ class Kucoin(Exchange):
         return results
 
     def get_consolidated_order_book(self, market, depth=5):
-        raw_results = self.public_get_part_order_book_agg(market)
+        return self.format_consolidated_order_book(self.public_get_part_order_book_agg(market), depth)
+
+    def subscribe_order_book(self, market_symbol):
+        """
+            Level-2 topic of market_symbol seeded from the full aggregated book
+            Debug: ct['Kucoin'].subscribe_order_book('ETH-BTC')
+        """
+        book = self._order_book.get(market_symbol, None)
+        if book is None:
+            book = self.create_local_order_book(market_symbol)
+            self.ws_subscribe('/market/level2:' + market_symbol)
+            self.submit_order_book_resync(market_symbol, book)
+        return book
+
+    async def async_get_order_book_snapshot(self, market_symbol):
+        """
+            Coroutine version of public_get_full_order_book_agg()
+        """
+        results = await self.async_public_get_request('/api/v1/market/orderbook/level2?symbol=' + market_symbol)
+        return results['bids'], results['asks'], int(results['sequence'])
+
+    async def async_get_consolidated_order_book(self, market, depth=5):
+        raw_results = await self.async_public_get_request('/api/v1/market/orderbook/level2_100?symbol=' + market)
+        return self.format_consolidated_order_book(raw_results, depth)
+
+    @staticmethod
+    def format_consolidated_order_book(raw_results, depth):
         take_bid = min(depth, len(raw_results['bids']))
         take_ask = min(depth, len(raw_results['asks']))
 
@@ -5,12 +5,9 @@ import time
 import urllib
 from datetime import datetime
 
-import requests
-import websocket
-from PyQt5.QtCore import QThreadPool
-
 from Exchange import Exchange
-from Worker import CTWorker
+from Retry import CTRequestError
+from WebsocketSupervisor import CTWebsocketSupervisor
 
 
 class Poloniex(Exchange):
@@ -29,11 +26,34 @@ class Poloniex(Exchange):
             '14400':   14400 / 60,
             '86400':   86400 / 60,
         }
-        self._thread_pool = QThreadPool()
-        self._thread_pool.start(CTWorker(self.ws_init))
-
-        self._ws = None
-        self._ws_heartbeat = None
+        # Poloniex allows 6 calls per second to public and trading APIs
+        self.set_request_rate_limit(6, 1)
+        # Parts of error messages that are worth another attempt
+        self._retryable_error_fragments = (
+            'nonce',
+            'api calls per second',
+            'internal error',
+            'try again',
+        )
+        # Commands that must not be sent twice
+        self._non_idempotent_commands = {
+            'buy',
+            'sell',
+            'moveOrder',
+            'withdraw',
+            'generateNewAddress',
+            'transferBalance',
+        }
+        # Poloniex sends heartbeats (channel 1010) every second without other messages
+        self._ws_supervisor = self.add_ws_supervisor(CTWebsocketSupervisor(
+            'Poloniex',
+            lambda: 'wss://api2.poloniex.com',
+            self.ws_on_message,
+            get_subscribe_message=self.ws_get_subscribe_message,
+            get_unsubscribe_message=self.ws_get_unsubscribe_message,
+            on_open=self.ws_on_open,
+            stall_timeout=30
+        ))
         self._implements = {
             'ws_24hour_market_moves',
             'ws_account_balances',
@@ -43,57 +63,98 @@ class Poloniex(Exchange):
 
         self._currency_id_map = {}
         self._currency_pair_map = {}
+        # Market fields of websocket ticker messages in update_quotes() order
+        self._ticker_fields = (
+            'BaseVolume',
+            'CurrVolume',
+            'BestBid',
+            'BestAsk',
+            '24HrHigh',
+            '24HrLow',
+            '24HrPercentMove',
+            'LastTradedPrice',
+        )
+
+        # Started last, ws_on_message() uses attributes set above
+        self.ws_init()
+
+    def validate_response(self, result):
+        """
+            Raises CTRequestError for responses carrying an error message.
+            Poloniex reports errors as free text, transient ones are
+            recognised by _retryable_error_fragments.
+        """
+        if isinstance(result, dict) and 'error' in result:
+            message = str(result['error'])
+            retryable = any(fragment in message.lower() for fragment in self._retryable_error_fragments)
+            raise CTRequestError(message, retryable=retryable)
+        return result
 
     def public_get_request(self, url):
-        try:
-            result = requests.get(self._BASE_URL + url).json()
-            if 'error' in result:
-                self.log_request_error(result['error'])
-                if self.retry_count_not_exceeded():
-                    return self.public_get_request(url)
-                else:
-                    return {}
-            else:
-                self.log_request_success()
-                return result
-        except Exception as e:
-            self.log_request_error(str(e))
-            if self.retry_count_not_exceeded():
-                return self.public_get_request(url)
-            else:
-                return {}
+        return self.execute_request(
+            url.split('&')[0],
+            lambda: self.decode_response(self.http_request('get', self._BASE_URL + url)),
+            self.validate_response,
+            default={},
+            cache_key=url
+        )
+
+    async def async_public_get_request(self, url):
+        return await self.async_execute_request(
+            url.split('&')[0],
+            lambda: self.async_http_request('get', self._BASE_URL + url),
+            self.validate_response,
+            default={},
+            cache_key=url
+        )
 
     def private_sign_request(self, string_to_sign):
         return hmac.new(self._API_SECRET.encode(), string_to_sign.encode(), hashlib.sha512).hexdigest()
 
+    def private_request_headers(self, command, req):
+        """
+            Adds command and nonce to req and returns signed headers
+        """
+        req['command'] = command
+        req['nonce'] = int(time.time()*1000000)
+        post_data = urllib.parse.urlencode(req)
+        return {
+            'Sign': self.private_sign_request(post_data),
+            'Key': self._API_KEY
+        }
+
     def private_request(self, command, req={}):
-        try:
-            req['command'] = command
-            req['nonce'] = int(time.time()*1000000)
-            post_data = urllib.parse.urlencode(req)
-            sign = self.private_sign_request(post_data)
-
-            headers = {
-                'Sign': sign,
-                'Key': self._API_KEY
-            }
+        def send():
+            # Signed again on every attempt, Poloniex rejects reused nonces
+            data = dict(req)
+            headers = self.private_request_headers(command, data)
+            return self.decode_response(self.http_request('post', self._BASE_URL + 'tradingApi', data=data, headers=headers))
+        return self.execute_request(
+            command,
+            send,
+            self.validate_response,
+            idempotent=command not in self._non_idempotent_commands,
+            default={},
+            cache_key=command + '?' + self.order_params_for_sig(req),
+            method='post',
+            max_age=0
+        )
 
-            result = requests.post(self._BASE_URL + 'tradingApi', data=req, headers=headers).json()
-            if 'error' in result:
-                self.log_request_error(result['error'])
-                if self.retry_count_not_exceeded():
-                    return self.private_request(command, req)
-                else:
-                    return {}
-            else:
-                self.log_request_success()
-                return result
-        except Exception as e:
-            self.log_request_error(str(e))
-            if self.retry_count_not_exceeded():
-                return self.private_request(command, req)
-            else:
-                return {}
+    async def async_private_request(self, command, req={}):
+        def send():
+            data = dict(req)
+            headers = self.private_request_headers(command, data)
+            return self.async_http_request('post', self._BASE_URL + 'tradingApi', data=data, headers=headers)
+        return await self.async_execute_request(
+            command,
+            send,
+            self.validate_response,
+            idempotent=command not in self._non_idempotent_commands,
+            default={},
+            cache_key=command + '?' + self.order_params_for_sig(req),
+            method='post',
+            max_age=0
+        )
 
     # ############################################
     # ##### Exchange specific public methods #####
@@ -675,18 +736,13 @@ class Poloniex(Exchange):
     # ############################################
 
     def ws_init(self):
-        self._ws = websocket.WebSocketApp("wss://api2.poloniex.com",
-                                          on_message=self.ws_on_message,
-                                          on_error=self.ws_on_error,
-                                          on_close=self.ws_on_close
-                                          )
-        self._ws.run_forever()
         self.ws_subscribe(1002)
         self.ws_subscribe(1000)
+        self._ws_supervisor.start()
 
     def ws_subscribe(self, channel):
         """
-            Subscibe to a channel
+            Subscibe to a channel, it is subscribed again after reconnects
             The following <channel> values are supported:
 
             Channel	Type	Name
@@ -697,44 +753,47 @@ class Poloniex(Exchange):
             <currency pair>	Public	Price Aggregated Book
             Debug: ct['Poloniex'].ws_subscribe(1000)
         """
-        try:
-            if channel == 1000:
-                nonce = int(time.time()*1000000)
-                self._ws.send(json.dumps({
-                    "command": "subscribe",
-                    "channel": 1000,
-                    "key": self._API_KEY,
-                    "payload": "nonce={}".format(nonce),
-                    "sign": self.private_sign_request("nonce={}".format(nonce))
-                }))
-            else:
-                self._ws.send(json.dumps({"command": "subscribe", "channel": channel}))
-        except Exception as e:
-            print("Failed to subscribe to Poloniex channel ", channel)
+        self._ws_supervisor.subscribe(channel)
 
     def ws_unsubscribe(self, channel):
         """
-            Unsubscibe from a channel
-            The following <channel> values are supported:
+            Unsubscibe from a channel, see ws_subscribe()
+        """
+        self._ws_supervisor.unsubscribe(channel)
 
-            Channel	Type	Name
-            1000	Private	Account Notifications (Beta)
-            1002	Public	Ticker Data
-            1003	Public	24 Hour Exchange Volume
-            1010	Public	Heartbeat
-            <currency pair>	Public	Price Aggregated Book
+    def ws_get_subscribe_message(self, channel):
+        if channel == 1000:
+            nonce = int(time.time()*1000000)
+            return json.dumps({
+                "command": "subscribe",
+                "channel": 1000,
+                "key": self._API_KEY,
+                "payload": "nonce={}".format(nonce),
+                "sign": self.private_sign_request("nonce={}".format(nonce))
+            })
+        return json.dumps({"command": "subscribe", "channel": channel})
+
+    @staticmethod
+    def ws_get_unsubscribe_message(channel):
+        return json.dumps({"command": "unsubscribe", "channel": channel})
+
+    def ws_on_open(self, is_reconnect):
         """
-        self._ws.send(json.dumps({"command": "unsubscribe", "channel": channel}))
+            Books of the replayed pair channels are sent again ('i' messages)
+        """
+        if is_reconnect:
+            for market_symbol, book in list(self._order_book.items()):
+                book.start_resync()
+                self.publish_order_book(market_symbol)
 
     def ws_on_message(self, message):
-        parsed_message = json.loads(message)
+        parsed_message = self.decode_json(message)
         if len(parsed_message) > 0:
             msg_code = parsed_message[0]
             if msg_code == 1010:
                 """
-                    Heartbeats
+                    Heartbeats, counted by the supervisor
                 """
-                self._ws_heartbeat = datetime.now().timestamp()
                 return
             if msg_code == 1002:
                 """
@@ -755,26 +814,27 @@ class Poloniex(Exchange):
                 if len(parsed_message) > 1:
                     payload = parsed_message[2]
                     market_symbol = self._currency_pair_map[payload[0]]
-                    self.update_market(
-                        market_symbol,
-                        {
-                            'IsActive':         1-payload[7],
-                            'IsRestricted':     payload[7],
-                            'BaseVolume':       float(payload[5]),
-                            'CurrVolume':       float(payload[6]),
-                            'BestBid':          float(payload[3]),
-                            'BestAsk':          float(payload[2]),
-                            '24HrHigh':         float(payload[8]),
-                            '24HrLow':          float(payload[9]),
-                            '24HrPercentMove':  100 * float(payload[4]),
-                            'LastTradedPrice':  float(payload[1]),
-                        }
-                    )
+                    key = self.get_quote_key(market_symbol)
+                    if key is not None:
+                        self.update_quote_activity(market_symbol, key, 1-payload[7], payload[7])
+                        self.update_quotes(self._ticker_fields, [(
+                            key,
+                            float(payload[5]),
+                            float(payload[6]),
+                            float(payload[3]),
+                            float(payload[2]),
+                            float(payload[8]),
+                            float(payload[9]),
+                            100 * float(payload[4]),
+                            float(payload[1]),
+                        )])
                 return
             if msg_code == 1000:
                 """
                     Account notification
                 """
+                balances_changed = False
+                changed_markets = set()
                 for account_update in parsed_message[2]:
                     print(account_update)
                     if account_update[0] == 'b':
@@ -782,15 +842,15 @@ class Poloniex(Exchange):
                         if currency is not None:
                             self._available_balances[currency] = self._available_balances.get(currency, 0) + \
                                                                  float(account_update[3])
+                            balances_changed = True
                     if account_update[0] == 'n':
                         market_symbol = self._currency_pair_map[account_update[1]]
-                        if market_symbol not in self._open_orders:
-                            self._open_orders[market_symbol] = []
                         if account_update[3] == 1:
                             order_type = 'Buy'
                         else:
                             order_type = 'Sell'
-                        self._open_orders[market_symbol].append(
+                        # Lists are replaced, the open orders view may be reading the previous one
+                        self._open_orders[market_symbol] = self._open_orders.get(market_symbol, []) + [
                             {
                                 'OrderId': account_update[2],
                                 'OrderType': order_type,
@@ -800,19 +860,24 @@ class Poloniex(Exchange):
                                 'Total': float(account_update[4]) * float(account_update[5]),
                                 'AmountRemaining': float(account_update[5]),
                             }
-                        )
+                        ]
+                        changed_markets.add(market_symbol)
                     if account_update[0] == 'o':
                         order_id = account_update[1]
-                        for market_symbol in self._open_orders:
-                            for order_ix in range(self._open_orders[market_symbol]):
-                                if order_id == self._open_orders[market_symbol][order_ix]['OrderId']:
-                                    if float(account_update[2]) == 0:
-                                        self._open_orders[market_symbol].pop(order_ix)
-                                    else:
-                                        self._open_orders[market_symbol][order_ix]['AmountRemaining'] = \
-                                            float(account_update[2])
+                        amount_remaining = float(account_update[2])
+                        for market_symbol, orders in list(self._open_orders.items()):
+                            if any(order['OrderId'] == order_id for order in orders):
+                                self._open_orders[market_symbol] = [
+                                    order if order['OrderId'] != order_id else {**order, 'AmountRemaining': amount_remaining}
+                                    for order in orders if order['OrderId'] != order_id or amount_remaining != 0
+                                ]
+                                changed_markets.add(market_symbol)
                     if account_update[0] == 't':
                         print('Trade:', account_update)
+                if balances_changed:
+                    self.publish_balances()
+                for market_symbol in changed_markets:
+                    self.publish_open_orders(market_symbol)
                 return
             if msg_code in self._currency_pair_map:
                 """
@@ -822,32 +887,22 @@ class Poloniex(Exchange):
                 sequence_id = parsed_message[1]
                 payload = parsed_message[2]
                 if payload[0][0] == 'i':
-                    self._order_book[market_symbol] = {
-                        'Bids': {},
-                        'Asks': {},
-                        'Sequence_Id': sequence_id
-                    }
-                    for price, amount in payload[0][1]['orderBook'][1].items():
-                        self._order_book[market_symbol]['Bids'][float(price)] = float(amount)
-                    for price, amount in payload[0][1]['orderBook'][0].items():
-                        self._order_book[market_symbol]['Asks'][float(price)] = float(amount)
+                    loaded = self.get_local_order_book(market_symbol).load_snapshot(
+                        payload[0][1]['orderBook'][1].items(),
+                        payload[0][1]['orderBook'][0].items(),
+                        sequence_id
+                    )
+                    self.publish_order_book(market_symbol)
+                    if not loaded:
+                        # Buffered deltas do not continue the snapshot, ask for another one
+                        self.resync_order_book(market_symbol)
                     return
-                if sequence_id < self._order_book[market_symbol]['Sequence_Id']:
-                    print("Wrong ws message order: ", sequence_id, self._order_book[market_symbol]['Sequence_Id'])
-                self._order_book[market_symbol]['Sequence_Id'] = max(sequence_id,
-                                                                     self._order_book[market_symbol]['Sequence_Id'])
+                # Every message has its own sequence number, so it is both the first and the last one
+                self.apply_order_book_delta(market_symbol, sequence_id, sequence_id, [
+                    ('Bids' if book_update[1] == 1 else 'Asks', book_update[2], book_update[3])
+                    for book_update in payload if book_update[0] == 'o'
+                ])
                 for book_update in payload:
-                    if book_update[0] == 'o':
-                        if book_update[1] == 0:
-                            if float(book_update[3]) == 0:
-                                self._order_book[market_symbol]['Asks'].pop(float(book_update[2]), None)
-                            else:
-                                self._order_book[market_symbol]['Asks'][float(book_update[2])] = float(book_update[3])
-                        if book_update[1] == 1:
-                            if float(book_update[3]) == 0:
-                                self._order_book[market_symbol]['Bids'].pop(float(book_update[2]), None)
-                            else:
-                                self._order_book[market_symbol]['Bids'][float(book_update[2])] = float(book_update[3])
                     if book_update[0] == 't':
                         if book_update[2] == 1:
                             order_type = 'Buy'
@@ -863,16 +918,22 @@ class Poloniex(Exchange):
                                 'Total': float(book_update[3] * book_update[4])
                             }
                         )
+                        self.publish_trades(market_symbol)
                 return
         print(message)
 
-    @staticmethod
-    def ws_on_error(error):
-        print("*** Poloniex websocket ERROR: ", error)
-
-    @staticmethod
-    def ws_on_close():
-        print("### Poloniex websocket is closed ###")
+    def resync_order_book(self, market_symbol):
+        """
+            Poloniex sends the whole book ('i' message) on subscription,
+            resubscribing is cheaper than a REST snapshot of full depth
+        """
+        book = self._order_book.get(market_symbol, None)
+        if book is None:
+            return
+        book.start_resync()
+        self.publish_order_book(market_symbol)
+        self.ws_unsubscribe(market_symbol)
+        self.ws_subscribe(market_symbol)
 
     # ###########################
     # ##### Generic methods #####
@@ -933,7 +994,12 @@ class Poloniex(Exchange):
             * Assumes that currency mappings are already available
             Debug: ct['Poloniex'].update_market_definitions()
         """
-        markets = self.public_get_all_markets()
+        self.apply_market_definitions(self.public_get_all_markets())
+
+    def apply_market_definitions(self, markets):
+        """
+            Updates markets with public_get_all_markets() output
+        """
         if isinstance(markets, dict):
             for market_symbol in markets:
                 try:
@@ -973,6 +1039,13 @@ class Poloniex(Exchange):
     def update_market_quotes(self):
         self.update_market_definitions()
 
+    async def async_update_market_quotes(self):
+        """
+            Coroutine version of update_market_quotes()
+            Debug: CTEventLoop.instance().run(ct['Poloniex'].async_update_market_quotes())
+        """
+        self.apply_market_definitions(await self.async_public_get_request('public?command=returnTicker'))
+
     def update_market_24hrs(self):
         self.update_market_definitions()
 
@@ -1062,7 +1135,14 @@ class Poloniex(Exchange):
         return results
 
     def get_consolidated_order_book(self, market, depth=5):
-        raw_results = self.public_get_order_book(market, str(depth))
+        return self.format_consolidated_order_book(self.public_get_order_book(market, str(depth)), depth)
+
+    async def async_get_consolidated_order_book(self, market, depth=5):
+        url = "public?command=returnOrderBook&currencyPair={}&depth={}".format(market, depth)
+        return self.format_consolidated_order_book(await self.async_public_get_request(url), depth)
+
+    @staticmethod
+    def format_consolidated_order_book(raw_results, depth):
         take_bid = min(depth, len(raw_results['bids']))
         take_ask = min(depth, len(raw_results['asks']))
 
@@ -0,0 +1,197 @@
+import asyncio
+import collections
+import copy
+import threading
+import time
+
+from EventLoop import CTEventLoop
+
+
+class CTCircuitBreaker:
+    """
+        Circuit breaker of a single endpoint.
+
+        Closed - requests go through, outcomes are tracked in a rolling window.
+        Open - the endpoint failed failure_threshold calls in a row or at least
+               failure_rate of the window; requests are refused.
+        HalfOpen - a background probe is checking whether the endpoint recovered.
+        A failed probe opens the breaker again for twice as long, up to
+        max_cooldown seconds.
+    """
+    def __init__(self, failure_threshold=3, failure_rate=0.5, window=20, cooldown=30, max_cooldown=300):
+        self._failure_threshold = failure_threshold
+        self._failure_rate = failure_rate
+        self._base_cooldown = cooldown
+        self._max_cooldown = max_cooldown
+        self._cooldown = cooldown
+        self._outcomes = collections.deque(maxlen=window)
+        self._consecutive_failures = 0
+        self._latency = None
+        self._state = 'Closed'
+        self._opened_at = None
+
+    def allow_request(self):
+        return self._state == 'Closed'
+
+    def get_cooldown(self):
+        return self._cooldown
+
+    def get_failure_rate(self):
+        if not self._outcomes:
+            return 0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def record_latency(self, latency):
+        # Exponentially weighted moving average
+        self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+
+    def record_success(self, latency):
+        self.record_latency(latency)
+        self._outcomes.append(True)
+        self._consecutive_failures = 0
+        self._cooldown = self._base_cooldown
+        self._state = 'Closed'
+        self._opened_at = None
+
+    def record_failure(self, latency):
+        """
+            Returns True when this failure opened the breaker
+        """
+        self.record_latency(latency)
+        self._outcomes.append(False)
+        self._consecutive_failures += 1
+        if self._state != 'Closed':
+            return False
+        if self._consecutive_failures >= self._failure_threshold or (
+                len(self._outcomes) >= self._outcomes.maxlen // 2 and self.get_failure_rate() >= self._failure_rate):
+            self._state = 'Open'
+            self._opened_at = time.time()
+            return True
+        return False
+
+    def start_probe(self):
+        self._state = 'HalfOpen'
+
+    def record_probe_failure(self):
+        self._cooldown = min(self._max_cooldown, self._cooldown * 2)
+        self._state = 'Open'
+        self._opened_at = time.time()
+
+    def get_state(self):
+        return {
+            'State': self._state,
+            'FailureRate': self.get_failure_rate(),
+            'ConsecutiveFailures': self._consecutive_failures,
+            'AverageLatency': self._latency,
+            'OpenedAt': self._opened_at,
+            'CooldownSeconds': self._cooldown,
+        }
+
+
+class CTExchangeHealth:
+    """
+        Health of the REST endpoints of one exchange: a circuit breaker per
+        endpoint plus the last good result per request, which is served with
+        a stale flag while the endpoint is failing or its breaker is open.
+        Results are kept for the max_results requests used most recently and
+        copied in and out, callers changing their result do not change the
+        cached one.
+        Debug: ct['Binance']._health.get_state()
+    """
+    def __init__(self, name, max_results=256):
+        self._name = name
+        self._breaker_settings = {}
+        self._breakers = {}
+        self._max_results = max_results
+        # cache_key -> result, least recently used first
+        self._last_good_results = collections.OrderedDict()
+        self._stale = set()
+        self._lock = threading.Lock()
+
+    def configure(self, **breaker_settings):
+        """
+            Keyword arguments of CTCircuitBreaker used for breakers created from now on
+        """
+        with self._lock:
+            self._breaker_settings = breaker_settings
+            self._breakers = {}
+
+    def get_breaker(self, endpoint):
+        if endpoint not in self._breakers:
+            self._breakers[endpoint] = CTCircuitBreaker(**self._breaker_settings)
+        return self._breakers[endpoint]
+
+    def allow_request(self, endpoint):
+        with self._lock:
+            return self.get_breaker(endpoint).allow_request()
+
+    def record_success(self, endpoint, latency, cache_key=None, result=None):
+        with self._lock:
+            self.get_breaker(endpoint).record_success(latency)
+            if cache_key is not None:
+                self._last_good_results[cache_key] = copy.deepcopy(result)
+                self._last_good_results.move_to_end(cache_key)
+                if len(self._last_good_results) > self._max_results:
+                    evicted, _ = self._last_good_results.popitem(last=False)
+                    self._stale.discard(evicted)
+                self._stale.discard(cache_key)
+
+    def record_failure(self, endpoint, latency, probe, cache_key=None):
+        """
+            probe is a coroutine function repeating the failed request once.
+            When the failure opens the breaker the probe is scheduled in the
+            background after the cooldown, its result refreshes cache_key.
+        """
+        with self._lock:
+            breaker = self.get_breaker(endpoint)
+            opened = breaker.record_failure(latency)
+            cooldown = breaker.get_cooldown()
+        if opened:
+            print('{} circuit breaker opened for {}, probing again in {} seconds'.format(
+                self._name, endpoint, cooldown))
+            CTEventLoop.instance().submit(self.run_probe(endpoint, probe, cooldown, cache_key))
+
+    async def run_probe(self, endpoint, probe, delay, cache_key=None):
+        """
+            Waits delay seconds and repeats probe until the endpoint recovers
+        """
+        while True:
+            await asyncio.sleep(delay)
+            with self._lock:
+                breaker = self.get_breaker(endpoint)
+                breaker.start_probe()
+            started = time.monotonic()
+            try:
+                result = await probe()
+                self.record_success(endpoint, time.monotonic() - started, cache_key, result)
+                print('{} circuit breaker closed for {}'.format(self._name, endpoint))
+                return
+            except Exception:
+                with self._lock:
+                    breaker.record_probe_failure()
+                    delay = breaker.get_cooldown()
+
+    def get_cached(self, cache_key, default=None):
+        """
+            Returns the last good result of the request and marks it stale
+        """
+        with self._lock:
+            if cache_key not in self._last_good_results:
+                return default
+            self._stale.add(cache_key)
+            self._last_good_results.move_to_end(cache_key)
+            return copy.deepcopy(self._last_good_results[cache_key])
+
+    def is_stale(self, cache_key=None):
+        """
+            True when cached data was served for the request, or for any
+            request when cache_key is None, since its last successful call
+        """
+        with self._lock:
+            if cache_key is None:
+                return len(self._stale) > 0
+            return cache_key in self._stale
+
+    def get_state(self):
+        with self._lock:
+            return {endpoint: breaker.get_state() for endpoint, breaker in self._breakers.items()}
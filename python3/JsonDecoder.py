@@ -0,0 +1,93 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+class CTJsonDecoder:
+    """
+        JSON decoding of REST responses and websocket messages with the
+        fastest backend installed: orjson, ujson or the json module.
+        Payloads can be str or bytes, bytes are passed on without decoding
+        them to str first when the backend reads them directly.
+
+        iterate_items() yields the elements of one array of a document. With
+        ijson installed the document is parsed incrementally and only one
+        element is built at a time, otherwise it falls back to loads().
+        Decoding errors are ValueError with every backend.
+        Debug: CTJsonDecoder.instance().get_backend()
+    """
+    _BACKENDS = ('orjson', 'ujson', 'json')
+    _instance = None
+
+    def __init__(self, backend=None):
+        """
+            backend - one of _BACKENDS, None picks the first one installed
+        """
+        available = self.get_available_backends()
+        if backend is None:
+            backend = available[0]
+        elif backend not in available:
+            raise ValueError('JSON backend {} is not installed, available: {}'.format(backend, available))
+        self._backend = backend
+        if backend == 'orjson':
+            self._loads = orjson.loads
+        elif backend == 'ujson':
+            self._loads = ujson.loads
+        else:
+            self._loads = json.loads
+
+    @classmethod
+    def instance(cls):
+        """
+            Decoder shared by all exchanges
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def get_available_backends(cls):
+        modules = {'orjson': orjson, 'ujson': ujson, 'json': json}
+        return [backend for backend in cls._BACKENDS if modules[backend] is not None]
+
+    @staticmethod
+    def is_streaming_available():
+        return ijson is not None
+
+    def get_backend(self):
+        return self._backend
+
+    def loads(self, payload):
+        if self._backend == 'ujson' and isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode('utf-8')
+        return self._loads(payload)
+
+    def iterate_items(self, payload, path=()):
+        """
+            Elements of the array found at path, a tuple of object keys, e.g.
+            ('symbols',) for Binance exchangeInfo, ('data', 'ticker') for Kucoin
+            allTickers or () for a document that is an array itself.
+            payload - str, bytes or a binary file object (ijson only)
+        """
+        if ijson is not None:
+            if isinstance(payload, str):
+                payload = payload.encode('utf-8')
+            prefix = '.'.join(list(path) + ['item'])
+            return ijson.items(payload, prefix, use_float=True)
+        document = self.loads(payload if not hasattr(payload, 'read') else payload.read())
+        for key in path:
+            document = document[key]
+        return iter(document)
@@ -0,0 +1,199 @@
+import bisect
+import threading
+
+
+class CTLocalOrderBook:
+    """
+        Order book of one market maintained from websocket updates.
+
+        Prices are kept as integer ticks (price / PriceIncrement of the
+        market), so float prices that print the same never end up as two
+        levels. Each side is a dictionary tick -> amount plus a sorted list of
+        ticks: best levels are O(1), changing a level is a binary search and
+        the top levels are a slice, nothing is sorted again on refresh.
+
+        Updates carry exchange sequence numbers. A delta is applied only when
+        it continues the sequence of the book: older ones are dropped as
+        duplicates, a gap marks the book inconsistent. Until a new snapshot
+        arrives deltas are buffered and replayed on top of it.
+        Debug: ct['Poloniex']._order_book['BTC_ETH'].get_consolidated(5)
+    """
+    def __init__(self, price_increment=0.00000001, max_buffer=1000):
+        if not price_increment or price_increment <= 0:
+            price_increment = 0.00000001
+        self._price_increment = price_increment
+        self._levels = {'Bids': {}, 'Asks': {}}
+        # Ascending ticks of both sides, best bid is the last bid tick, best ask the first ask tick
+        self._ticks = {'Bids': [], 'Asks': []}
+        self._sequence = None
+        self._consistent = False
+        self._syncing = True
+        self._buffer = []
+        self._max_buffer = max_buffer
+        self._counters = {'Snapshots': 0, 'Resyncs': 0, 'Gaps': 0, 'Duplicates': 0}
+        self._lock = threading.Lock()
+
+    def get_tick(self, price):
+        return int(round(float(price) / self._price_increment))
+
+    def get_price(self, tick):
+        return tick * self._price_increment
+
+    def get_sequence(self):
+        return self._sequence
+
+    def is_consistent(self):
+        return self._consistent
+
+    def is_syncing(self):
+        return self._syncing
+
+    def load_snapshot(self, bids, asks, sequence=None):
+        """
+            Replaces the book, bids and asks are iterables of (price, amount).
+            Buffered deltas newer than sequence are replayed. Returns False
+            when they do not continue the snapshot and another one is needed.
+        """
+        levels = {'Bids': {}, 'Asks': {}}
+        for side, entries in (('Bids', bids), ('Asks', asks)):
+            for price, amount in entries:
+                amount = float(amount)
+                if amount > 0:
+                    levels[side][self.get_tick(price)] = amount
+        ticks = {side: sorted(side_levels) for side, side_levels in levels.items()}
+        with self._lock:
+            self._levels = levels
+            self._ticks = ticks
+            self._sequence = sequence
+            self._counters['Snapshots'] += 1
+            buffered = sorted(self._buffer, key=lambda delta: delta[0])
+            self._buffer = []
+            self._syncing = False
+            self._consistent = True
+            for index, (first_sequence, last_sequence, changes) in enumerate(buffered):
+                if sequence is not None and last_sequence <= sequence:
+                    continue
+                if self.apply_delta_locked(first_sequence, last_sequence, changes) is False:
+                    # Kept for the next snapshot
+                    self._buffer.extend(buffered[index + 1:])
+                    return False
+            return True
+
+    def apply_delta(self, first_sequence, last_sequence, changes):
+        """
+            changes - iterable of (side, price, amount), side 'Bids' or 'Asks',
+            amount 0 removes the level. A single sequence number per message
+            is passed as both first_sequence and last_sequence.
+            Returns False when a gap was found and the book needs a snapshot.
+        """
+        with self._lock:
+            return self.apply_delta_locked(first_sequence, last_sequence, list(changes))
+
+    def apply_delta_locked(self, first_sequence, last_sequence, changes):
+        """
+            apply_delta() for callers holding _lock
+        """
+        if self._syncing:
+            if len(self._buffer) >= self._max_buffer:
+                self._buffer.pop(0)
+            self._buffer.append((first_sequence, last_sequence, changes))
+            return True
+        if self._sequence is not None:
+            if last_sequence <= self._sequence:
+                self._counters['Duplicates'] += 1
+                return True
+            if first_sequence > self._sequence + 1:
+                self._counters['Gaps'] += 1
+                self._consistent = False
+                self._syncing = True
+                self._buffer = [(first_sequence, last_sequence, changes)]
+                return False
+        for side, price, amount in changes:
+            self.change_level(side, self.get_tick(price), float(amount))
+        self._sequence = last_sequence
+        return True
+
+    def start_resync(self):
+        """
+            Marks the book inconsistent until the next load_snapshot(),
+            deltas received meanwhile are buffered
+        """
+        with self._lock:
+            self._consistent = False
+            self._syncing = True
+            self._counters['Resyncs'] += 1
+
+    def set_level(self, side, price, amount):
+        """
+            Changes a level outside of sequence tracking,
+            side - 'Bids' or 'Asks', amount 0 removes the level
+        """
+        with self._lock:
+            self.change_level(side, self.get_tick(price), float(amount))
+
+    def change_level(self, side, tick, amount):
+        """
+            Called with _lock held
+        """
+        levels = self._levels[side]
+        if amount > 0:
+            if tick not in levels:
+                bisect.insort(self._ticks[side], tick)
+            levels[tick] = amount
+        elif levels.pop(tick, None) is not None:
+            ticks = self._ticks[side]
+            del ticks[bisect.bisect_left(ticks, tick)]
+
+    def get_best_bid(self):
+        """
+            Returns (price, amount) or None
+        """
+        with self._lock:
+            if not self._ticks['Bids']:
+                return None
+            tick = self._ticks['Bids'][-1]
+            return self.get_price(tick), self._levels['Bids'][tick]
+
+    def get_best_ask(self):
+        with self._lock:
+            if not self._ticks['Asks']:
+                return None
+            tick = self._ticks['Asks'][0]
+            return self.get_price(tick), self._levels['Asks'][tick]
+
+    def get_top(self, side, depth):
+        """
+            Best depth levels of side as [(price, amount), ...], best first
+        """
+        with self._lock:
+            if side == 'Bids':
+                ticks = self._ticks['Bids'][:-depth - 1:-1] if depth > 0 else []
+            else:
+                ticks = self._ticks['Asks'][:depth]
+            levels = self._levels[side]
+            return [(self.get_price(tick), levels[tick]) for tick in ticks]
+
+    def get_consolidated(self, depth=5):
+        """
+            Top of the book in the get_consolidated_order_book() format:
+            {'Bid': {0: {'Price': price, 'Quantity': amount}, ...}, 'Ask': {...}}
+        """
+        results = {}
+        for side, name in (('Bids', 'Bid'), ('Asks', 'Ask')):
+            results[name] = {
+                level: {'Price': price, 'Quantity': amount}
+                for level, (price, amount) in enumerate(self.get_top(side, depth))
+            }
+        return results
+
+    def get_state(self):
+        with self._lock:
+            return {
+                'BidLevels': len(self._ticks['Bids']),
+                'AskLevels': len(self._ticks['Asks']),
+                'PriceIncrement': self._price_increment,
+                'Sequence': self._sequence,
+                'Consistent': self._consistent,
+                'Buffered': len(self._buffer),
+                **self._counters,
+            }
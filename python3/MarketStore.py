@@ -0,0 +1,472 @@
+import threading
+import time
+from collections.abc import MutableMapping
+from datetime import datetime
+
+import numpy as np
+
+from Registry import CTInstrumentRegistry
+
+
+class CTMarketStore:
+    """
+        Columnar state of the markets of all exchanges.
+
+        Every (exchange, code_base, code_curr) market gets a row index, its
+        exchange and pair are stored as CTInstrumentRegistry ids. Quotes,
+        sizes, volumes, 24 hour statistics, timestamps and numeric definitions
+        are kept in NumPy columns, so the whole universe can be scanned with
+        vectorized operations. Quote values not received yet are NaN.
+        MarketSymbol and Notice are kept in lists, fields without a column in a
+        dictionary per row created on first use.
+        CTMarketRow gives the dictionary interface used by views and adapters.
+        Rows of removed markets are reused, the generation of a row changes
+        on every removal so a CTMarketRow kept after its market was removed
+        reads as empty instead of showing the market now in its row.
+
+        Quote writes are guarded by seqlocks instead of locking readers out:
+        writers (one at a time) make the version of every written row and the
+        sequence of the store odd while they write and even again when done.
+        get_quotes() and get_snapshot() read a row, get_columns() whole
+        columns, and read again when a version changed meanwhile, so BestBid
+        and BestAsk always come from the same update.
+        Debug: ct['Binance']._market_store.get_state()
+    """
+    _FLOAT_FIELDS = (
+        'BestBid',
+        'BestAsk',
+        'BestBidSize',
+        'BestAskSize',
+        'BaseVolume',
+        'CurrVolume',
+        '24HrHigh',
+        '24HrLow',
+        '24HrPercentMove',
+        'LastTradedPrice',
+        'TimeStamp',
+        'BaseMinAmount',
+        'BaseIncrement',
+        'CurrMinAmount',
+        'CurrIncrement',
+        'PriceMin',
+        'PriceIncrement',
+    )
+    _BOOL_FIELDS = ('IsActive', 'IsRestricted')
+    # Values of new markets, fields missing here start as NaN (not received)
+    _DEFAULTS = {
+        'BaseMinAmount':    0,
+        'BaseIncrement':    0.00000001,
+        'CurrMinAmount':    0,
+        'CurrIncrement':    0.00000001,
+        'PriceMin':         0,
+        'PriceIncrement':   0.00000001,
+        'IsActive':         True,
+        'IsRestricted':     False,
+        'Notice':           '',
+    }
+
+    def __init__(self, registry=None, capacity=1024):
+        self._registry = registry if registry is not None else CTInstrumentRegistry()
+        self._capacity = capacity
+        self._size = 0
+        self._free_rows = []
+        self._rows = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # Seqlock of all quote columns, odd while a write is in progress
+        self._sequence = 0
+
+        self._exchange = np.full(capacity, -1, dtype=np.int32)
+        self._pair = np.full(capacity, -1, dtype=np.int32)
+        self._listed = np.zeros(capacity, dtype=bool)
+        # Seqlock of every row, odd while the row is written
+        self._versions = np.zeros(capacity, dtype=np.int64)
+        # Changed when the market of a row is removed, see CTMarketRow
+        self._generations = np.zeros(capacity, dtype=np.int64)
+        self._float_columns = {field: np.full(capacity, np.nan) for field in self._FLOAT_FIELDS}
+        self._bool_columns = {field: np.zeros(capacity, dtype=bool) for field in self._BOOL_FIELDS}
+        self._market_symbols = [None] * capacity
+        self._notices = [''] * capacity
+        self._extras = [None] * capacity
+
+    # ##### Rows #####
+    def get_registry(self):
+        return self._registry
+
+    def add_market(self, exchange, code_base, code_curr):
+        """
+            Returns the row of the market, a new row starts with _DEFAULTS
+        """
+        exchange_id = self._registry.get_exchange_id(exchange)
+        key = (exchange_id, code_base, code_curr)
+        with self._lock:
+            if key in self._rows:
+                return self._rows[key]
+            if self._free_rows:
+                row = self._free_rows.pop()
+            else:
+                if self._size == self._capacity:
+                    self.grow()
+                row = self._size
+                self._size += 1
+            self._exchange[row] = exchange_id
+            self._pair[row] = self._registry.get_pair_id(code_base, code_curr)
+            self.reset_row(row)
+            self._listed[row] = True
+            self._rows[key] = row
+            return row
+
+    def remove_market(self, exchange, code_base, code_curr):
+        with self._lock:
+            row = self._rows.pop((self._registry.find_exchange_id(exchange), code_base, code_curr), None)
+            if row is None:
+                return
+            self._generations[row] += 1
+            self._listed[row] = False
+            self._exchange[row] = -1
+            self._pair[row] = -1
+            self.reset_row(row)
+            self._free_rows.append(row)
+
+    def get_generation(self, row):
+        return int(self._generations[row])
+
+    def is_current(self, row, generation):
+        """
+            False once the market row was handed out for (generation) is removed
+        """
+        return self._generations[row] == generation
+
+    def reset_row(self, row):
+        with self._write_lock:
+            self.begin_write(row)
+            for field, column in self._float_columns.items():
+                column[row] = self._DEFAULTS.get(field, np.nan)
+            self.end_write(row)
+        for field, column in self._bool_columns.items():
+            column[row] = self._DEFAULTS[field]
+        self._market_symbols[row] = None
+        self._notices[row] = self._DEFAULTS['Notice']
+        self._extras[row] = None
+
+    def grow(self):
+        """
+            Doubles the capacity of all columns, called with _lock held. Value
+            writers are held off by _write_lock meanwhile, a write to a column
+            between its copy and its replacement would be lost.
+        """
+        extra = self._capacity
+        self._exchange = np.concatenate([self._exchange, np.full(extra, -1, dtype=np.int32)])
+        self._pair = np.concatenate([self._pair, np.full(extra, -1, dtype=np.int32)])
+        self._listed = np.concatenate([self._listed, np.zeros(extra, dtype=bool)])
+        with self._write_lock:
+            self._versions = np.concatenate([self._versions, np.zeros(extra, dtype=np.int64)])
+            self._generations = np.concatenate([self._generations, np.zeros(extra, dtype=np.int64)])
+            for field in self._FLOAT_FIELDS:
+                self._float_columns[field] = np.concatenate([self._float_columns[field], np.full(extra, np.nan)])
+            for field in self._BOOL_FIELDS:
+                self._bool_columns[field] = np.concatenate([self._bool_columns[field], np.zeros(extra, dtype=bool)])
+        self._market_symbols.extend([None] * extra)
+        self._notices.extend([''] * extra)
+        self._extras.extend([None] * extra)
+        self._capacity += extra
+
+    # ##### Values #####
+    def get_value(self, row, field):
+        """
+            Value of field in row, KeyError when the market has no such value
+        """
+        if field in self._float_columns:
+            value = self._float_columns[field][row]
+            if value != value:
+                raise KeyError(field)
+            if field == 'TimeStamp':
+                return datetime.fromtimestamp(value)
+            return float(value)
+        if field in self._bool_columns:
+            return bool(self._bool_columns[field][row])
+        if field == 'MarketSymbol':
+            if self._market_symbols[row] is None:
+                raise KeyError(field)
+            return self._market_symbols[row]
+        if field == 'Notice':
+            return self._notices[row]
+        extras = self._extras[row]
+        if extras is None:
+            raise KeyError(field)
+        return extras[field]
+
+    def set_value(self, row, field, value):
+        if field in self._float_columns:
+            if value is None:
+                value = np.nan
+            elif field == 'TimeStamp' and isinstance(value, datetime):
+                value = value.timestamp()
+            with self._write_lock:
+                self.begin_write(row)
+                self._float_columns[field][row] = value
+                self.end_write(row)
+        elif field in self._bool_columns:
+            with self._write_lock:
+                self._bool_columns[field][row] = bool(value)
+        elif field == 'MarketSymbol':
+            self._market_symbols[row] = value
+        elif field == 'Notice':
+            self._notices[row] = value
+        else:
+            if self._extras[row] is None:
+                self._extras[row] = {}
+            self._extras[row][field] = value
+
+    def update_quotes(self, fields, batch):
+        """
+            fields - tuple of numeric fields, e.g. ('BestBid', 'BestAsk')
+            batch - sequence of (row, value of fields[0], value of fields[1], ...)
+            Writes every field of the batch with one vectorized assignment.
+            TimeStamp values are epoch seconds.
+        """
+        values = np.array(batch, dtype=np.float64)
+        self.update_quote_columns(fields, values[:, 0].astype(np.intp), values[:, 1:])
+
+    def update_quote_columns(self, fields, rows, values):
+        """
+            rows - integer array of n rows
+            values - float array of shape (n, len(fields)), column i holds fields[i]
+            For feeds that convert whole frames at once, see update_quotes()
+        """
+        with self._write_lock:
+            self.begin_write(rows)
+            for index, field in enumerate(fields):
+                self._float_columns[field][rows] = values[:, index]
+            self.end_write(rows)
+
+    # ##### Seqlocks #####
+    def begin_write(self, rows):
+        """
+            Called with _write_lock held before rows (an index or an array of them) are written
+        """
+        self._sequence += 1
+        self._versions[rows] += 1
+
+    def end_write(self, rows):
+        self._versions[rows] += 1
+        self._sequence += 1
+
+    @staticmethod
+    def wait_for_writer(attempt):
+        """
+            Readers give the writer the interpreter after a few optimistic retries
+        """
+        if attempt > 2:
+            time.sleep(0)
+
+    def read_row(self, row, read):
+        """
+            Returns read() of row once no write of the row overlapped it
+        """
+        attempt = 0
+        while True:
+            version = self._versions[row]
+            if version % 2 == 0:
+                result = read()
+                if self._versions[row] == version:
+                    return result
+            attempt += 1
+            self.wait_for_writer(attempt)
+
+    def get_quotes(self, row, fields=('BestBid', 'BestAsk')):
+        """
+            {field: value} of numeric fields of row written by the same
+            update, fields without a value are None
+        """
+        def read():
+            # Columns looked up on every attempt, grow() may have replaced them
+            return {field: self._float_columns[field][row] for field in fields}
+        quotes = self.read_row(row, read)
+        return {field: None if value != value else float(value) for field, value in quotes.items()}
+
+    def get_snapshot(self, row):
+        """
+            Dictionary with every field of row, quotes from the same update
+        """
+        def read():
+            snapshot = {}
+            for field in self.get_fields(row):
+                try:
+                    snapshot[field] = self.get_value(row, field)
+                except KeyError:
+                    # Deleted after get_fields()
+                    pass
+            return snapshot
+        return self.read_row(row, read)
+
+    def get_columns(self, fields):
+        """
+            Returns (sequence, {field: copy of the column}) of the rows in use,
+            all columns written by the same updates
+        """
+        attempt = 0
+        while True:
+            sequence = self._sequence
+            if sequence % 2 == 0:
+                size = self._size
+                columns = {field: self._float_columns[field][:size].copy() for field in fields}
+                if self._sequence == sequence:
+                    return sequence, columns
+            attempt += 1
+            self.wait_for_writer(attempt)
+
+    def get_sequence(self):
+        """
+            Changes with every quote write, readers can skip work when it did not change
+        """
+        return self._sequence
+
+    def delete_value(self, row, field):
+        if field in self._float_columns:
+            self.set_value(row, field, None)
+        elif field in self._bool_columns or field == 'Notice':
+            self.set_value(row, field, self._DEFAULTS[field])
+        elif field == 'MarketSymbol':
+            self._market_symbols[row] = None
+        elif self._extras[row] is not None:
+            self._extras[row].pop(field, None)
+
+    def get_market(self, row):
+        """
+            Returns (code_base, code_curr) of row
+        """
+        return self._registry.get_pair(self._pair[row])
+
+    def get_fields(self, row):
+        """
+            Names of fields with a value in row
+        """
+        fields = []
+        if self._market_symbols[row] is not None:
+            fields.append('MarketSymbol')
+        for field, column in self._float_columns.items():
+            if column[row] == column[row]:
+                fields.append(field)
+        fields.extend(self._BOOL_FIELDS)
+        fields.append('Notice')
+        if self._extras[row] is not None:
+            fields.extend(self._extras[row].keys())
+        return fields
+
+    # ##### Scans #####
+    def get_active_rows(self, exchanges=None):
+        """
+            Boolean mask of listed, active and unrestricted markets,
+            optionally limited to a list of exchange names
+        """
+        size = self._size
+        active = self._listed[:size] & self._bool_columns['IsActive'][:size] & ~self._bool_columns['IsRestricted'][:size]
+        if exchanges is not None:
+            exchange_ids = [self._registry.get_exchange_id(exchange) for exchange in exchanges]
+            active &= np.isin(self._exchange[:size], exchange_ids)
+        return active
+
+    def get_arbitrage_pairs(self, required_rate_of_return, exchanges=None):
+        """
+            Returns [(code_base, code_curr), ...] of pairs listed on more than
+            one of the exchanges whose best bid exceeds the best ask of another
+            exchange times required_rate_of_return, in one pass over all rows
+        """
+        _, columns = self.get_columns(('BestBid', 'BestAsk'))
+        size = len(columns['BestBid'])
+        active = self.get_active_rows(exchanges)[:size]
+        if not active.any():
+            return []
+        bids = columns['BestBid']
+        asks = columns['BestAsk']
+        pairs = self._pair[:size]
+        n_pairs = self._registry.get_pair_count()
+
+        has_bid = active & ~np.isnan(bids)
+        has_ask = active & ~np.isnan(asks)
+        best_bid = np.full(n_pairs, -np.inf)
+        best_ask = np.full(n_pairs, np.inf)
+        np.maximum.at(best_bid, pairs[has_bid], bids[has_bid])
+        np.minimum.at(best_ask, pairs[has_ask], asks[has_ask])
+        markets_per_pair = np.bincount(pairs[active], minlength=n_pairs)
+
+        found = (markets_per_pair > 1) & (best_bid > best_ask * required_rate_of_return)
+        return [self._registry.get_pair(pair_id) for pair_id in np.flatnonzero(found)]
+
+    def get_state(self):
+        return {
+            'Rows': self._size - len(self._free_rows),
+            'Capacity': self._capacity,
+            'Sequence': self._sequence,
+            'Registry': self._registry.get_state(),
+            'ColumnBytes': sum(column.nbytes for column in self._float_columns.values()) +
+            sum(column.nbytes for column in self._bool_columns.values()) +
+            self._exchange.nbytes + self._pair.nbytes + self._listed.nbytes,
+        }
+
+
+class CTMarketRow(MutableMapping):
+    """
+        Dictionary interface of one market row of CTMarketStore, it is what
+        Exchange._markets[code_base][code_curr] holds. Reads and writes go
+        straight to the columns, so every holder sees current quotes.
+        Once the market is removed the row reads as empty and writes are
+        dropped, even after the store reused the row for another market.
+    """
+    __slots__ = ('_store', '_row', '_generation')
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+        self._generation = store.get_generation(row)
+
+    def get_row(self):
+        return self._row
+
+    def is_removed(self):
+        return not self._store.is_current(self._row, self._generation)
+
+    def get_quotes(self, fields=('BestBid', 'BestAsk')):
+        """
+            Consistent quotes of the market, see CTMarketStore.get_quotes()
+        """
+        quotes = self._store.get_quotes(self._row, fields)
+        if self.is_removed():
+            return {field: None for field in fields}
+        return quotes
+
+    def get_snapshot(self):
+        """
+            Plain dictionary copy of the market, quotes from the same update
+        """
+        snapshot = self._store.get_snapshot(self._row)
+        return {} if self.is_removed() else snapshot
+
+    def __getitem__(self, field):
+        # Checked after reading, the row may be reused while it is read
+        value = self._store.get_value(self._row, field)
+        if self.is_removed():
+            raise KeyError(field)
+        return value
+
+    def __setitem__(self, field, value):
+        if not self.is_removed():
+            self._store.set_value(self._row, field, value)
+
+    def __delitem__(self, field):
+        if not self.is_removed():
+            self._store.delete_value(self._row, field)
+
+    def __iter__(self):
+        return iter(self.get_fields())
+
+    def __len__(self):
+        return len(self.get_fields())
+
+    def get_fields(self):
+        fields = self._store.get_fields(self._row)
+        return [] if self.is_removed() else fields
+
+    def __repr__(self):
+        return repr(dict(self.items()))
@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+
+
+class CTTokenBucket:
+    """
+        Token bucket holding up to capacity tokens that refill continuously at
+        capacity tokens per interval seconds. Requests reserve tokens up front;
+        when the bucket runs dry the balance goes negative and the caller gets
+        back how long to wait, so concurrent callers queue up in order instead
+        of bursting.
+    """
+    def __init__(self, capacity, interval):
+        self._capacity = float(capacity)
+        self._interval = float(interval)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    def get_capacity(self):
+        return self._capacity
+
+    def get_interval(self):
+        return self._interval
+
+    def get_tokens(self):
+        return self._tokens
+
+    def refill(self, now):
+        rate = self._capacity / self._interval
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * rate)
+        self._updated = now
+
+    def reserve(self, weight, now):
+        """
+            Takes weight tokens and returns number of seconds to wait before
+            the request may be sent
+        """
+        self.refill(now)
+        self._tokens -= min(weight, self._capacity)
+        if self._tokens >= 0:
+            return 0
+        return -self._tokens * self._interval / self._capacity
+
+    def resize(self, capacity, interval, now):
+        """
+            Changes the limit keeping the amount already used in the current window
+        """
+        self.refill(now)
+        used = self._capacity - self._tokens
+        self._capacity = float(capacity)
+        self._interval = float(interval)
+        self._tokens = self._capacity - used
+
+    def correct_usage(self, used, now):
+        """
+            Applies usage reported by the exchange. The estimate is only ever
+            lowered: requests still in flight are not counted by the server yet.
+        """
+        self.refill(now)
+        self._tokens = min(self._tokens, self._capacity - used)
+
+    def drain(self, seconds, now):
+        """
+            Empties the bucket so that nothing is sent for the next seconds
+        """
+        self.refill(now)
+        self._tokens = min(self._tokens, -seconds * self._capacity / self._interval)
+
+
+class CTRateLimiter:
+    """
+        Weight aware rate limiter of a single exchange.
+
+        Each named bucket models one limit published by the exchange (e.g.
+        Binance REQUEST_WEIGHT per minute or ORDERS per second). Every endpoint
+        costs a weight in one or more buckets. acquire() blocks the calling
+        thread (async_acquire() suspends the coroutine) until all buckets the
+        request touches have enough capacity, which turns bursts from several
+        views polling at once into a queue rather than bans.
+        Debug: ct['Binance']._rate_limiter.get_state()
+    """
+    def __init__(self, default_weights=None):
+        self._buckets = {}
+        self._endpoint_weights = {}
+        self._default_weights = default_weights or {}
+        self._usage_headers = {}
+        self._lock = threading.Lock()
+
+    def set_bucket(self, name, capacity, interval):
+        """
+            Creates or resizes bucket name allowing capacity weight per interval seconds
+        """
+        with self._lock:
+            if name in self._buckets:
+                self._buckets[name].resize(capacity, interval, time.monotonic())
+            else:
+                self._buckets[name] = CTTokenBucket(capacity, interval)
+
+    def set_endpoint_weights(self, endpoint_weights):
+        """
+            endpoint_weights is a dictionary endpoint path -> {bucket name: weight}
+        """
+        self._endpoint_weights.update(endpoint_weights)
+
+    def set_default_weights(self, weights):
+        """
+            Weights charged for endpoints missing from the endpoint table
+        """
+        self._default_weights = weights
+
+    def set_usage_header(self, header, bucket_name):
+        """
+            Response header reporting weight already used in bucket_name
+        """
+        self._usage_headers[header.lower()] = bucket_name
+
+    def get_weights(self, endpoint):
+        return self._endpoint_weights.get(endpoint, self._default_weights)
+
+    def reserve(self, weights):
+        """
+            Reserves weights ({bucket name: weight}) and returns seconds to wait
+        """
+        delay = 0
+        with self._lock:
+            now = time.monotonic()
+            for name, weight in weights.items():
+                if name in self._buckets:
+                    delay = max(delay, self._buckets[name].reserve(weight, now))
+        return delay
+
+    def acquire(self, weights):
+        delay = self.reserve(weights)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def async_acquire(self, weights):
+        delay = self.reserve(weights)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def update_from_headers(self, headers):
+        """
+            Self-corrects bucket levels with usage reported in response headers
+        """
+        if not self._usage_headers:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for header, value in headers.items():
+                name = self._usage_headers.get(header.lower(), None)
+                if name in self._buckets:
+                    try:
+                        self._buckets[name].correct_usage(float(value), now)
+                    except ValueError:
+                        pass
+
+    def pause(self, seconds):
+        """
+            Stops all requests for seconds, e.g. after HTTP 429 with Retry-After
+        """
+        with self._lock:
+            now = time.monotonic()
+            for bucket in self._buckets.values():
+                bucket.drain(seconds, now)
+
+    def get_state(self):
+        """
+            Returns available tokens per bucket
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = {}
+            for name, bucket in self._buckets.items():
+                bucket.refill(now)
+                state[name] = {
+                    'Available': bucket.get_tokens(),
+                    'Capacity': bucket.get_capacity(),
+                    'IntervalSeconds': bucket.get_interval(),
+                }
+            return state
@@ -0,0 +1,155 @@
+import threading
+
+
+class CTInstrumentRegistry:
+    """
+        Dense integer ids of exchanges, global currency codes, global pairs
+        (code_base, code_curr) and exchange market symbols, with O(1) mappings
+        between them, e.g. pair id -> symbol ids of the exchanges listing it.
+
+        get_*_id() methods register unknown names, find_*_id() methods return
+        None for them. Lookups take no lock: registrants fill the lists of a
+        new id before publishing it in the dictionaries. Ids are never reused, so they can be kept as compact
+        keys in columns (CTMarketStore) and in scans.
+        Debug: self._CTMain._Crypto_Trader._registry.get_state()
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._exchange_ids = {}
+        self._exchanges = []
+        self._currency_ids = {}
+        self._currencies = []
+        self._pairs_of_currency = []
+        self._pair_ids = {}
+        self._pairs = []
+        self._pair_currency_ids = []
+        self._symbols_of_pair = []
+        self._symbol_ids = {}
+        self._symbols = []
+
+    # ##### Exchanges #####
+    def get_exchange_id(self, exchange):
+        exchange_id = self._exchange_ids.get(exchange, None)
+        if exchange_id is None:
+            with self._lock:
+                if exchange not in self._exchange_ids:
+                    self._exchanges.append(exchange)
+                    self._exchange_ids[exchange] = len(self._exchanges) - 1
+                exchange_id = self._exchange_ids[exchange]
+        return exchange_id
+
+    def find_exchange_id(self, exchange):
+        return self._exchange_ids.get(exchange, None)
+
+    def get_exchange(self, exchange_id):
+        return self._exchanges[exchange_id]
+
+    # ##### Currencies #####
+    def get_currency_id(self, code):
+        currency_id = self._currency_ids.get(code, None)
+        if currency_id is None:
+            with self._lock:
+                if code not in self._currency_ids:
+                    self._currencies.append(code)
+                    self._pairs_of_currency.append([])
+                    self._currency_ids[code] = len(self._currencies) - 1
+                currency_id = self._currency_ids[code]
+        return currency_id
+
+    def find_currency_id(self, code):
+        return self._currency_ids.get(code, None)
+
+    def get_currency(self, currency_id):
+        return self._currencies[currency_id]
+
+    def get_pairs_of_currency(self, currency_id):
+        """
+            Ids of pairs where the currency is the base or the traded currency
+        """
+        return self._pairs_of_currency[currency_id]
+
+    # ##### Pairs #####
+    def get_pair_id(self, code_base, code_curr):
+        pair = (code_base, code_curr)
+        pair_id = self._pair_ids.get(pair, None)
+        if pair_id is None:
+            with self._lock:
+                if pair not in self._pair_ids:
+                    pair_id = len(self._pairs)
+                    base_id = self.get_currency_id(code_base)
+                    curr_id = self.get_currency_id(code_curr)
+                    self._pairs.append(pair)
+                    self._pair_currency_ids.append((base_id, curr_id))
+                    self._symbols_of_pair.append([])
+                    self._pairs_of_currency[base_id].append(pair_id)
+                    self._pairs_of_currency[curr_id].append(pair_id)
+                    self._pair_ids[pair] = pair_id
+                pair_id = self._pair_ids[pair]
+        return pair_id
+
+    def find_pair_id(self, code_base, code_curr):
+        return self._pair_ids.get((code_base, code_curr), None)
+
+    def get_pair(self, pair_id):
+        """
+            Returns (code_base, code_curr)
+        """
+        return self._pairs[pair_id]
+
+    def get_pair_currency_ids(self, pair_id):
+        """
+            Returns (base currency id, traded currency id)
+        """
+        return self._pair_currency_ids[pair_id]
+
+    def get_pair_count(self):
+        return len(self._pairs)
+
+    def get_symbols_of_pair(self, pair_id):
+        """
+            Symbol ids of the markets of the pair on all exchanges
+        """
+        return self._symbols_of_pair[pair_id]
+
+    # ##### Exchange market symbols #####
+    def get_symbol_id(self, exchange, market_symbol, code_base, code_curr):
+        """
+            Registers market_symbol of exchange as a market of the pair, a
+            symbol mapped to another pair before is moved to the new one
+        """
+        exchange_id = self.get_exchange_id(exchange)
+        pair_id = self.get_pair_id(code_base, code_curr)
+        key = (exchange_id, market_symbol)
+        symbol_id = self._symbol_ids.get(key, None)
+        if symbol_id is not None and self._symbols[symbol_id][1] == pair_id:
+            return symbol_id
+        with self._lock:
+            symbol_id = self._symbol_ids.get(key, None)
+            if symbol_id is None:
+                symbol_id = len(self._symbols)
+                self._symbols.append((exchange_id, pair_id, market_symbol))
+                self._symbols_of_pair[pair_id].append(symbol_id)
+                self._symbol_ids[key] = symbol_id
+            elif self._symbols[symbol_id][1] != pair_id:
+                self._symbols_of_pair[self._symbols[symbol_id][1]].remove(symbol_id)
+                self._symbols[symbol_id] = (exchange_id, pair_id, market_symbol)
+                self._symbols_of_pair[pair_id].append(symbol_id)
+        return symbol_id
+
+    def find_symbol_id(self, exchange, market_symbol):
+        exchange_id = self._exchange_ids.get(exchange, None)
+        return self._symbol_ids.get((exchange_id, market_symbol), None)
+
+    def get_symbol(self, symbol_id):
+        """
+            Returns (exchange id, pair id, market symbol)
+        """
+        return self._symbols[symbol_id]
+
+    def get_state(self):
+        return {
+            'Exchanges': len(self._exchanges),
+            'Currencies': len(self._currencies),
+            'Pairs': len(self._pairs),
+            'Symbols': len(self._symbols),
+        }
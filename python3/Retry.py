@@ -0,0 +1,101 @@
+import asyncio
+import random
+import threading
+import time
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class CTRequestError(Exception):
+    """
+        Error reported by an exchange in an otherwise valid response.
+        retryable tells the retry engine whether repeating the call can help
+        (rate limits, internal errors, stale nonce) or not (bad parameters,
+        insufficient funds, invalid keys).
+    """
+    def __init__(self, message, retryable=False, code=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.code = code
+
+
+class CTRetryPolicy:
+    """
+        Exponential backoff with full jitter: attempt n waits a random time
+        between 0 and min(max_delay, base_delay * 2 ** n) seconds, so that
+        callers failing together do not come back together.
+    """
+    def __init__(self, max_attempts=3, base_delay=0.25, max_delay=5.0):
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+
+    def get_max_attempts(self):
+        return self._max_attempts
+
+    def get_delay(self, attempt):
+        return random.uniform(0, min(self._max_delay, self._base_delay * 2 ** attempt))
+
+    def is_retryable(self, error, idempotent=True):
+        """
+            Classifies an exception raised by a request attempt.
+            Requests that are not idempotent (e.g. new orders) are only
+            repeated when the exchange certainly did not act on them.
+        """
+        if isinstance(error, CTRequestError):
+            return error.retryable
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if not idempotent:
+            return False
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, asyncio.TimeoutError,
+                              ValueError)):
+            # ValueError covers html error pages of overloaded gateways that fail json decoding
+            return True
+        if aiohttp is not None and isinstance(error, aiohttp.ClientError):
+            return True
+        return False
+
+
+class CTRequestMetrics:
+    """
+        Per endpoint statistics of request attempts
+        Debug: ct['Binance']._request_metrics.get_metrics()
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def record_attempt(self, endpoint, latency, outcome, message=''):
+        """
+            outcome is one of 'Success', 'Retry', 'Failure'
+        """
+        with self._lock:
+            if endpoint not in self._metrics:
+                self._metrics[endpoint] = {
+                    'Attempts': 0,
+                    'Success': 0,
+                    'Retry': 0,
+                    'Failure': 0,
+                    'TotalLatency': 0.0,
+                    'LastLatency': 0.0,
+                    'LastError': '',
+                    'LastErrorTimestamp': None,
+                }
+            metrics = self._metrics[endpoint]
+            metrics['Attempts'] += 1
+            metrics[outcome] += 1
+            metrics['TotalLatency'] += latency
+            metrics['LastLatency'] = latency
+            if outcome != 'Success':
+                metrics['LastError'] = message
+                metrics['LastErrorTimestamp'] = time.time()
+
+    def get_metrics(self):
+        with self._lock:
+            return {endpoint: dict(metrics) for endpoint, metrics in self._metrics.items()}
@@ -0,0 +1,124 @@
+import asyncio
+import collections
+import concurrent.futures
+import copy
+import threading
+import time
+
+
+class CTSingleFlight:
+    """
+        Coalesces identical requests of one exchange.
+
+        While a request with a given key is in flight, later callers with the
+        same key wait for its result instead of sending another one. Results
+        stored with store() are reused for freshness seconds, so several views
+        refreshing at the same moment cost one bulk call. Results of the
+        max_results keys stored most recently are kept. Every caller but the
+        one that sent the request gets a copy, so results can be changed.
+        Blocking callers (call()) and coroutines (async_call()) are coalesced
+        separately; coroutines all run on the shared event loop.
+        Debug: ct['Binance']._single_flight.get_state()
+    """
+    def __init__(self, freshness=1.0, max_results=256):
+        self._freshness = freshness
+        self._max_results = max_results
+        self._in_flight = {}
+        self._async_in_flight = {}
+        # key -> (time stored, result), oldest first
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def set_freshness(self, seconds):
+        self._freshness = seconds
+
+    def store(self, key, result):
+        """
+            Remembers a successful result of request key
+        """
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._results[key] = (time.monotonic(), result)
+            self._results.move_to_end(key)
+            if len(self._results) > self._max_results:
+                self._results.popitem(last=False)
+
+    def get_fresh(self, key, max_age=None):
+        """
+            Returns (True, result) when request key has a result younger than
+            max_age seconds (the freshness window by default), else (False, None)
+        """
+        if max_age is None:
+            max_age = self._freshness
+        if max_age <= 0 or key not in self._results:
+            return False, None
+        stored, result = self._results[key]
+        if time.monotonic() - stored > max_age:
+            return False, None
+        return True, copy.deepcopy(result)
+
+    def call(self, key, function, max_age=None):
+        """
+            Returns function() or the result of an identical call in flight or
+            done less than max_age seconds ago
+        """
+        with self._lock:
+            found, result = self.get_fresh(key, max_age)
+            if found:
+                return result
+            future = self._in_flight.get(key, None)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._in_flight[key] = future
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = function()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    async def async_call(self, key, coroutine_function, max_age=None):
+        """
+            Coroutine version of call(), coroutine_function() returns an awaitable
+        """
+        with self._lock:
+            found, result = self.get_fresh(key, max_age)
+        if found:
+            return result
+        future = self._async_in_flight.get(key, None)
+        if future is not None:
+            # shield() keeps the shared request alive when one of the waiters is cancelled
+            return copy.deepcopy(await asyncio.shield(future))
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_in_flight[key] = future
+        try:
+            result = await coroutine_function()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marks the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self._async_in_flight.pop(key, None)
+
+    def get_state(self):
+        with self._lock:
+            return {
+                'InFlight': list(self._in_flight.keys()) + list(self._async_in_flight.keys()),
+                'Stored': len(self._results),
+                'FreshnessSeconds': self._freshness,
+            }
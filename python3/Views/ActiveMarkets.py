@@ -13,11 +13,14 @@ class CTActiveMarkets(QWidget):
         self.show_markets()
         self.setLayout(self._layout)
 
+    def on_exchange_ready(self, exchange):
+        self.show_markets()
+
     def show_markets(self):
-        exchanges = sorted(self._CTMain._Crypto_Trader._map_exchange_code_to_currency_code.keys())
+        exchanges = sorted(self._CTMain._Crypto_Trader._map_local_code_to_global_code.keys())
         column_names = ['BaseCode', 'CurrencyCode'] + exchanges
         markets = self._CTMain._Crypto_Trader.load_active_markets()
-        markets.pop(None)
+        markets.pop(None, None)
         row_count = 0
         for code_base in markets:
             row_count += len(markets[code_base])
@@ -47,6 +47,10 @@ class CTBalances(QWidget):
             """)
         self.show()
 
+    def on_exchange_ready(self, exchange):
+        if exchange in self._CTMain._Crypto_Trader._SETTINGS.get('Exchanges with API Keys', []):
+            self.reload_balances()
+
     def reload_balances(self):
         # Populate current BTC price in USD
         self._btc_usd_price = self._CTMain._Crypto_Trader.trader['Coinbase'].get_btc_usd_price()
@@ -1,6 +1,8 @@
-from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QPushButton)
 
+from EventBus import CTEvent
+from Views.EventBridge import CTQtEventBridge
+
 
 class CTCurrencies(QWidget):
     def __init__(self, CTMain=None):
@@ -20,14 +22,13 @@ class CTCurrencies(QWidget):
         self.setLayout(self._layout)
 
         self.show_currencies()
-        self._timer_painter = QTimer(self)
-        self._timer_painter.start(2000)
-        self._timer_painter.timeout.connect(self.show_currencies)
+        # Repainted when currency maps of an exchange are merged
+        self._currency_events = CTQtEventBridge(self, lambda events: self.show_currencies(), CTEvent.CURRENCIES)
 
     def show_currencies(self):
-        exchanges = sorted(self._CTMain._Crypto_Trader._map_exchange_code_to_currency_code.keys())
+        exchanges = sorted(self._CTMain._Crypto_Trader._map_local_code_to_global_code.keys())
         column_names = ['Code'] + exchanges
-        code_map = self._CTMain._Crypto_Trader._map_currency_code_to_exchange_code
+        code_map = self._CTMain._Crypto_Trader._map_global_code_to_local_code
         codes = sorted(code_map.keys())
         self._tableWidget.setRowCount(len(codes))
         self._tableWidget.setColumnCount(len(column_names))
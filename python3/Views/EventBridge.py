@@ -0,0 +1,52 @@
+import threading
+
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
+
+from EventBus import CTEventBus
+
+
+class CTQtEventBridge(QObject):
+    """
+        Delivers CTEventBus events to a view on the GUI thread.
+
+        Events arrive on feed threads and are queued here, one queued Qt
+        signal is emitted per batch and handler(events) runs on the thread of
+        the bridge (the GUI thread it was created on). Events with the same
+        type, exchange and key arriving before the GUI thread gets to them
+        are coalesced, only the latest one is delivered. The subscription is
+        closed together with the parent widget.
+    """
+    _pending_signal = pyqtSignal()
+
+    def __init__(self, parent, handler, event_type, exchange=None, keys=None):
+        super().__init__(parent)
+        self._handler = handler
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pending_signal.connect(self.deliver, Qt.QueuedConnection)
+        self._subscription = CTEventBus.instance().subscribe(self.on_event, event_type, exchange, keys)
+        subscription = self._subscription
+        self.destroyed.connect(lambda *args: subscription.close())
+
+    def on_event(self, event):
+        """
+            Called on the publishing thread
+        """
+        with self._lock:
+            is_scheduled = len(self._pending) > 0
+            self._pending[(event.type, event.exchange, event.key)] = event
+        if not is_scheduled:
+            self._pending_signal.emit()
+
+    def deliver(self):
+        with self._lock:
+            events = list(self._pending.values())
+            self._pending = {}
+        if events:
+            self._handler(events)
+
+    def set_filter(self, exchange=None, keys=None):
+        self._subscription.set_filter(exchange, keys)
+
+    def close(self):
+        self._subscription.close()
@@ -76,6 +76,9 @@ class CTExchangeArb(QWidget):
         self._timer.start(5000)
         self._timer.timeout.connect(self.check_arbs)
 
+    def on_exchange_ready(self, exchange):
+        self.check_arbs()
+
     def check_arbs(self, load_markets=True):
         required_rate_of_return = 1.0
         try:
@@ -95,20 +98,25 @@ class CTExchangeArb(QWidget):
             for code_curr in results[code_base]:
                 for exchangeBid in results[code_base][code_curr]:
                     for exchangeAsk in results[code_base][code_curr]:
-                        if results[code_base][code_curr][exchangeAsk]['BestAsk'] > 0 and results[code_base][code_curr][exchangeBid]['BestBid'] > results[code_base][code_curr][exchangeAsk]['BestAsk'] * required_rate_of_return:
+                        # Quotes of an exchange that just joined may still be missing
+                        best_ask = results[code_base][code_curr][exchangeAsk].get('BestAsk', None)
+                        best_bid = results[code_base][code_curr][exchangeBid].get('BestBid', None)
+                        if best_ask is None or best_bid is None:
+                            continue
+                        if best_ask > 0 and best_bid > best_ask * required_rate_of_return:
                             count_rows += 1
                             rows_to_report.append({
                                 'code_base': code_base,
                                 'code_curr': code_curr,
                                 'exchangeAsk': exchangeAsk,
                                 'marketAsk': results[code_base][code_curr][exchangeAsk]['MarketSymbol'],
-                                'exchangeAskBid': results[code_base][code_curr][exchangeAsk]['BestBid'],
-                                'exchangeAskAsk': results[code_base][code_curr][exchangeAsk]['BestAsk'],
+                                'exchangeAskBid': results[code_base][code_curr][exchangeAsk].get('BestBid', None) or 0,
+                                'exchangeAskAsk': best_ask,
                                 'exchangeBid': exchangeBid,
                                 'marketBid': results[code_base][code_curr][exchangeBid]['MarketSymbol'],
-                                'exchangeBidBid': results[code_base][code_curr][exchangeBid]['BestBid'],
-                                'exchangeBidAsk': results[code_base][code_curr][exchangeBid]['BestAsk'],
-                                'return': 100.0 * (results[code_base][code_curr][exchangeBid]['BestBid'] / results[code_base][code_curr][exchangeAsk]['BestAsk'] - 1)
+                                'exchangeBidBid': best_bid,
+                                'exchangeBidAsk': results[code_base][code_curr][exchangeBid].get('BestAsk', None) or 0,
+                                'return': 100.0 * (best_bid / best_ask - 1)
                             })
 
         if self._sort_by_return.isChecked():
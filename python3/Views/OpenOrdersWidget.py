@@ -1,8 +1,9 @@
-import threading
-
 from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QPushButton)
 
+from EventBus import CTEvent
+from Views.EventBridge import CTQtEventBridge
+
 
 class CTCancelOrderButton(QPushButton):
     def __init__(self, parent=None, order_id=None):
@@ -21,7 +22,6 @@ class CTOpenOrdersWidget(QWidget):
     def __init__(self, CTMain, exchange, market_symbol):
         super().__init__()
         self._CTMain = CTMain
-        self.update_market(exchange, market_symbol)
 
         self._table_widget = QTableWidget()
         self._layout = QVBoxLayout()
@@ -32,23 +32,23 @@ class CTOpenOrdersWidget(QWidget):
         self._single_shot_timer.setSingleShot(True)
         self._single_shot_timer.timeout.connect(self.update_open_orders)
 
-        self._timer = QTimer(self)
-        self._timer.start(1000)
-        self._timer.timeout.connect(self.refresh_widget)
+        # Repainted when open orders of the market are loaded
+        self._order_events = CTQtEventBridge(self, lambda events: self.refresh(), CTEvent.OPEN_ORDERS, exchange,
+                                             [market_symbol])
+        self.update_market(exchange, market_symbol)
 
     def update_market(self, exchange, market_symbol):
         self._exchange = exchange
         self._market_symbol = market_symbol
+        self._order_events.set_filter(exchange, [market_symbol])
+        self.refresh()
 
     def update_open_orders(self):
         self._CTMain._Crypto_Trader.trader[self._exchange].update_open_user_orders_in_market(self._market_symbol)
 
-    def refresh_widget(self):
-        t = threading.Thread(target=self.refresh)
-        t.start()
-        t.join(1)
-
     def refresh(self):
+        if self._exchange not in self._CTMain._Crypto_Trader.trader:
+            return
         self._open_orders = self._CTMain._Crypto_Trader.trader[self._exchange]._open_orders.get(self._market_symbol, [])
 
         self._table_widget.setRowCount(len(self._open_orders))
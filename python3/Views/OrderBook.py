@@ -1,10 +1,13 @@
-import time
+import asyncio
 
-from PyQt5.QtCore import Qt, QTimer, QThreadPool
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtWidgets import (QWidget, QTableWidget, QTableWidgetItem, QVBoxLayout)
 
 import CTColors
-from Worker import CTWorker
+from Conflation import CTConflator
+from EventBus import CTEvent
+from EventLoop import CTEventLoop
+from Views.EventBridge import CTQtEventBridge
 
 
 class CTOrderBook(QWidget):
@@ -18,6 +21,10 @@ class CTOrderBook(QWidget):
         self._depth = depth
 
         self._order_book = {}
+        # Websocket books are repainted only when the conflator reports a change or
+        # when whether they can be shown changed, polled books when a new one was loaded
+        self._book_changes = CTConflator.instance().subscribe('OrderBooks', [(self._exchange, self._market_symbol)])
+        self._painted = None
         self._tableWidget = QTableWidget()
         self._tableWidget.setRowCount(2 * self._depth)
         self._tableWidget.setColumnCount(4)
@@ -28,31 +35,43 @@ class CTOrderBook(QWidget):
         self.setLayout(self._layout)
 
         self._re_load_seconds = 1
-        self._re_draw_seconds = 0.3
-        self._thread_pool = QThreadPool()
-        order_book_reloader = CTWorker(self.load_order_book_thread)
-        self._thread_pool.start(order_book_reloader)
+        self._order_book_reloader = CTEventLoop.instance().submit(self.load_order_book_loop())
 
+        # Websocket books are repainted on their events, the timer picks up
+        # polled books and feeds going stale
+        self._book_events = CTQtEventBridge(self, lambda events: self.refresh_order_book(), CTEvent.ORDER_BOOK,
+                                            self._exchange, [self._market_symbol])
         self._timer_painter = QTimer(self)
-        self._timer_painter.start(self._re_draw_seconds * 1000)
+        self._timer_painter.start(self._re_load_seconds * 1000)
         self._timer_painter.timeout.connect(self.refresh_order_book)
 
-    def load_order_book_thread(self):
+        # Every order book view has its own conflator subscription and reload loop, both end with the widget
+        book_changes = self._book_changes
+        order_book_reloader = self._order_book_reloader
+        self.destroyed.connect(lambda *args: (book_changes.close(), order_book_reloader.cancel()))
+
+    async def load_order_book_loop(self):
         while True:
             if self._exchange in self._CTMain._Crypto_Trader.trader:
                 if not self._CTMain._Crypto_Trader.trader[self._exchange].has_implementation('ws_order_book'):
-                    self._order_book = self._CTMain._Crypto_Trader.trader[self._exchange].get_consolidated_order_book(
-                        self._market_symbol,
-                        self._depth
-                    )
-            time.sleep(self._re_load_seconds)
+                    try:
+                        self._order_book = await self._CTMain._Crypto_Trader.trader[
+                            self._exchange
+                        ].async_get_consolidated_order_book(self._market_symbol, self._depth)
+                    except Exception as e:
+                        print(str(e))
+            await asyncio.sleep(self._re_load_seconds)
 
     def refresh_order_book(self, exchange=None, market_symbol=None, base_curr=None, curr_curr=None, depth=None):
         try:
+            force_repaint = any(argument is not None for argument in (exchange, market_symbol, base_curr, curr_curr, depth))
             if exchange is not None:
                 self._exchange = exchange
             if market_symbol is not None:
                 self._market_symbol = market_symbol
+            if exchange is not None or market_symbol is not None:
+                self._book_changes.set_keys([(self._exchange, self._market_symbol)])
+                self._book_events.set_filter(self._exchange, [self._market_symbol])
             if self._market_symbol is None:
                 return
 
@@ -63,38 +82,36 @@ class CTOrderBook(QWidget):
             if depth is not None:
                 self._depth = depth
 
+            if self._CTMain._Crypto_Trader.trader[self._exchange].has_implementation('ws_order_book'):
+                changes = self._book_changes.collect()
+                full_book = self._CTMain._Crypto_Trader.trader[self._exchange]._order_book.get(self._market_symbol, None)
+                if full_book is not None:
+                    # An out of sync book or one of a feed that is down is not shown until it is resynchronized
+                    is_shown = full_book.is_consistent() and \
+                        not self._CTMain._Crypto_Trader.trader[self._exchange].is_quotes_stale()
+                    if not changes and not force_repaint and self._painted == is_shown:
+                        return
+                    self._painted = is_shown
+                    results = full_book.get_consolidated(self._depth) if is_shown else {}
+                else:
+                    results = {
+                        'Bid': {},
+                        'Ask': {}
+                    }
+                    self._painted = None
+                    self._CTMain._Crypto_Trader.trader[self._exchange].subscribe_order_book(self._market_symbol)
+            else:
+                results = self._order_book
+                if results is self._painted and not force_repaint:
+                    return
+                self._painted = results
+
             self._tableWidget.setHorizontalHeaderLabels([
                 'Price',
                 self._curr_curr + ' amount',
                 self._curr_curr + ' sum',
                 self._base_curr + ' sum'
             ])
-            if self._CTMain._Crypto_Trader.trader[self._exchange].has_implementation('ws_order_book'):
-                full_book = self._CTMain._Crypto_Trader.trader[self._exchange]._order_book.get(self._market_symbol, {})
-                results = {
-                    'Bid': {},
-                    'Ask': {}
-                }
-                if 'Bids' in full_book:
-                    bids = [{'Price': k, 'Quantity': full_book['Bids'][k]} for k in
-                            sorted(full_book['Bids'].keys(), reverse=True)[:5]]
-                    for i in range(len(bids)):
-                        results['Bid'][i] = {
-                            'Price': bids[i]['Price'],
-                            'Quantity': bids[i]['Quantity']
-                        }
-                else:
-                    self._CTMain._Crypto_Trader.trader[self._exchange].ws_subscribe(self._market_symbol)
-                if 'Asks' in full_book:
-                    asks = [{'Price': k, 'Quantity': full_book['Asks'][k]} for k in
-                            sorted(full_book['Asks'].keys())[:5]]
-                    for i in range(len(asks)):
-                        results['Ask'][i] = {
-                            'Price': asks[i]['Price'],
-                            'Quantity': asks[i]['Quantity']
-                        }
-            else:
-                results = self._order_book
 
             for cell_index in range(2 * self._depth):
                 self._tableWidget.setItem(cell_index, 0, QTableWidgetItem(""))
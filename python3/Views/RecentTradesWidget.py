@@ -1,47 +1,54 @@
-import time
+import asyncio
 
-from PyQt5.QtCore import Qt, QTimer, QThreadPool
+from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem)
 
 import CTColors
-from Worker import CTWorker
+from EventBus import CTEvent
+from EventLoop import CTEventLoop
+from Views.EventBridge import CTQtEventBridge
 
 
 class CTRecentTradesWidget(QWidget):
     def __init__(self, CTMain, exchange, code_base, code_curr, market_symbol):
         super().__init__()
         self._CTMain = CTMain
-        self._re_draw_seconds = 0.3
         self._re_load_seconds = 1
-        self._thread_pool = QThreadPool()
-        self.update_market(exchange, code_base, code_curr, market_symbol)
 
         self._table_widget = QTableWidget()
         self._layout = QVBoxLayout()
         self._layout.addWidget(self._table_widget)
         self.setLayout(self._layout)
 
-        self._timer_painter = QTimer(self)
-        self._timer_painter.start(self._re_draw_seconds * 1000)
-        self._timer_painter.timeout.connect(self.re_draw)
+        # Redrawn when trades of the market are loaded or printed on a websocket
+        self._trade_events = CTQtEventBridge(self, lambda events: self.re_draw(), CTEvent.TRADES, exchange,
+                                             [market_symbol])
+        self.update_market(exchange, code_base, code_curr, market_symbol)
 
-        # generic thread using signal
-        trade_reloader = CTWorker(self.re_load_recent_trades_thread)
-        self._thread_pool.start(trade_reloader)
+        # reload recent trades on the shared event loop
+        self._trade_reloader = CTEventLoop.instance().submit(self.re_load_recent_trades_loop())
+        # The reload loop ends with the widget
+        trade_reloader = self._trade_reloader
+        self.destroyed.connect(lambda *args: trade_reloader.cancel())
 
     def update_market(self, exchange, code_base, code_curr, market_symbol):
         self._exchange = exchange
         self._code_base = code_base
         self._code_curr = code_curr
         self._market_symbol = market_symbol
+        self._trade_events.set_filter(exchange, [market_symbol])
+        self.re_draw()
 
-    def re_load_recent_trades_thread(self):
+    async def re_load_recent_trades_loop(self):
         while True:
             if self._exchange in self._CTMain._Crypto_Trader.trader:
-                self._CTMain._Crypto_Trader.trader[self._exchange].update_recent_market_trades_per_market(
-                    self._market_symbol
-                )
-            time.sleep(self._re_load_seconds)
+                try:
+                    await self._CTMain._Crypto_Trader.trader[
+                        self._exchange
+                    ].async_update_recent_market_trades_per_market(self._market_symbol)
+                except Exception as e:
+                    print(str(e))
+            await asyncio.sleep(self._re_load_seconds)
 
     def re_draw(self):
         if self._exchange in self._CTMain._Crypto_Trader.trader:
@@ -4,6 +4,7 @@ from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem)
 
 import CTColors
+from Conflation import CTConflator
 
 
 class CTTwentyFourHours(QWidget):
@@ -12,49 +13,117 @@ class CTTwentyFourHours(QWidget):
 
         self._CTMain = CTMain
 
+        # (code_base, code_curr) -> {exchange: 24 hour move}, kept up to date from the conflator
+        self._moves = {}
+        # Table entries of the pairs, only those of changed pairs are computed again
+        self._entries = {}
+        # Entry painted in every row of the table, rows whose entry is unchanged are skipped,
+        # None until the columns of the ready exchanges are set up
+        self._painted = None
+        self._exchanges = []
+        self._quote_changes = CTConflator.instance().subscribe('Quotes')
+        # Feeds build quote updates only while the topic has subscribers
+        quote_changes = self._quote_changes
+        self.destroyed.connect(lambda *args: quote_changes.close())
+
         self._tableWidget = QTableWidget()
         self._layout = QVBoxLayout()
         self._layout.addWidget(self._tableWidget)
-        self.show_moves()
+        self.load_moves()
         self.setLayout(self._layout)
 
         self._timer_painter = QTimer(self)
         self._timer_painter.start(2000)
-        self._timer_painter.timeout.connect(self.show_moves)
+        self._timer_painter.timeout.connect(self.update_moves)
 
-    def show_moves(self):
-        exchanges = sorted(self._CTMain._Crypto_Trader._map_exchange_code_to_currency_code.keys())
-        column_names = ['BaseCode', 'CurrencyCode'] + exchanges + ['Average 24-Hour Move']
-        markets = self._CTMain._Crypto_Trader.load_24hour_moves()
+    def on_exchange_ready(self, exchange):
+        self.load_moves()
 
-        moves = []
+    def load_moves(self):
+        """
+            Full state of ready exchanges, later changes come from the conflator
+        """
+        markets = self._CTMain._Crypto_Trader.load_24hour_moves()
+        self._quote_changes.collect()
+        self._moves = {}
         for code_base in markets:
             for code_curr in markets[code_base]:
-                total_move = 0
-                exchange_counter = 0
-                entry = {
-                    'BaseCode': code_base,
-                    'CurrencyCode': code_curr
+                self._moves[(code_base, code_curr)] = {
+                    exchange: market.get('24HrPercentMove', 0)
+                    for exchange, market in markets[code_base][code_curr].items()
                 }
-                for exchange in markets[code_base][code_curr].keys():
-                    entry[exchange] = markets[code_base][code_curr][exchange].get('24HrPercentMove', 0)
-                    total_move += entry[exchange]
-                    exchange_counter += 1
+        self._entries = {}
+        self.show_moves(set(self._moves))
+
+    def update_moves(self):
+        """
+            Applies the moves changed since the last frame, the table is
+            repainted only when one of them changed
+        """
+        self._CTMain._Crypto_Trader.update_24hour_moves()
+        changed_pairs = set()
+        for (exchange, code_base, code_curr), quotes in self._quote_changes.collect().items():
+            move = quotes.get('24HrPercentMove', None) if quotes is not None else None
+            if move is None:
+                continue
+            pair_moves = self._moves.setdefault((code_base, code_curr), {})
+            if pair_moves.get(exchange, None) != move:
+                pair_moves[exchange] = move
+                changed_pairs.add((code_base, code_curr))
+        if changed_pairs:
+            self.show_moves(changed_pairs)
 
-                if exchange_counter > 0:
-                    entry['Avg_24HrPercentMove'] = total_move / exchange_counter
-                    moves.append(entry)
+    def show_moves(self, changed_pairs):
+        """
+            Computes entries of changed_pairs again and repaints the rows whose
+            entry changed, either because the pair changed or the sort moved it
+        """
+        exchanges = sorted(self._CTMain._Crypto_Trader.get_ready_exchanges())
+        if exchanges != self._exchanges:
+            changed_pairs = set(self._moves)
+            self._entries = {}
+            self._exchanges = exchanges
+            self._painted = None
+        column_names = ['BaseCode', 'CurrencyCode'] + exchanges + ['Average 24-Hour Move']
+
+        for code_base, code_curr in changed_pairs:
+            total_move = 0
+            exchange_counter = 0
+            entry = {
+                'BaseCode': code_base,
+                'CurrencyCode': code_curr
+            }
+            for exchange, move in self._moves[(code_base, code_curr)].items():
+                if exchange not in exchanges:
+                    continue
+                entry[exchange] = move
+                total_move += move
+                exchange_counter += 1
+
+            if exchange_counter > 0:
+                entry['Avg_24HrPercentMove'] = total_move / exchange_counter
+                self._entries[(code_base, code_curr)] = entry
+            else:
+                self._entries.pop((code_base, code_curr), None)
 
-        ordered_market_moves = sorted(moves, key=itemgetter('Avg_24HrPercentMove'), reverse=True)
+        ordered_market_moves = sorted(self._entries.values(), key=itemgetter('Avg_24HrPercentMove'), reverse=True)
         n_columns = len(column_names)
 
-        self._tableWidget.setRowCount(len(ordered_market_moves))
-        self._tableWidget.setColumnCount(n_columns)
-        self._tableWidget.verticalHeader().hide()
-        self._tableWidget.setHorizontalHeaderLabels(column_names)
+        n_rows = len(ordered_market_moves)
+        if self._painted is None:
+            self._tableWidget.setColumnCount(n_columns)
+            self._tableWidget.verticalHeader().hide()
+            self._tableWidget.setHorizontalHeaderLabels(column_names)
+            self._painted = []
+        if n_rows != len(self._painted):
+            self._tableWidget.setRowCount(n_rows)
+            self._painted = (self._painted + [None] * n_rows)[:n_rows]
 
-        cell_index = 0
-        for move in ordered_market_moves:
+        for cell_index, move in enumerate(ordered_market_moves):
+            # Only rows of changed pairs and rows the sort moved are painted again
+            if self._painted[cell_index] is move:
+                continue
+            self._painted[cell_index] = move
             self._tableWidget.setItem(cell_index, 0, QTableWidgetItem(move['BaseCode']))
             self._tableWidget.setItem(cell_index, 1, QTableWidgetItem(move['CurrencyCode']))
             for exchange_i in range(len(exchanges)):
@@ -68,6 +137,8 @@ class CTTwentyFourHours(QWidget):
                         self._tableWidget.item(cell_index, exchange_i + 2).setForeground(CTColors.GREEN_BOLD)
                     else:
                         self._tableWidget.item(cell_index, exchange_i + 2).setForeground(CTColors.RED_BOLD)
+                else:
+                    self._tableWidget.takeItem(cell_index, exchange_i + 2)
             self._tableWidget.setItem(
                 cell_index,
                 n_columns - 1,
@@ -77,4 +148,3 @@ class CTTwentyFourHours(QWidget):
                 self._tableWidget.item(cell_index, n_columns - 1).setForeground(CTColors.GREEN_BOLD)
             else:
                 self._tableWidget.item(cell_index, n_columns - 1).setForeground(CTColors.RED_BOLD)
-            cell_index += 1
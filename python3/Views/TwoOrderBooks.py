@@ -1,4 +1,3 @@
-from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import (QWidget, QHBoxLayout)
 
 from Views.OrderBookWithSelectors import CTOrderBookWithSelectors
@@ -42,12 +41,9 @@ class CTTwoOrderBooks(QWidget):
         self._layout.addWidget(self._order_book2)
         self.setLayout(self._layout)
 
+        # Both books repaint themselves on order book events
         self.refresh_order_books()
 
-        self._timer = QTimer(self)
-        self._timer.start(1000)
-        self._timer.timeout.connect(self.refresh_order_books)
-
         self.show()
 
     def refresh_order_books(self):
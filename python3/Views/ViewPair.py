@@ -145,7 +145,7 @@ class CTViewPair(QWidget):
         self._dropdown_base_curr = Dropdown(base_codes, self._base_curr)
         self._dropdown_base_curr.activated[str].connect(self.refresh_dropdown_base_change)
 
-        curr_codes = sorted(self._CTMain._Crypto_Trader.trader[self._exchange]._active_markets[self._base_curr].keys())
+        curr_codes = sorted(self._CTMain._Crypto_Trader.trader[self._exchange]._active_markets.get(self._base_curr, {}).keys())
         self._dropdown_curr_curr = Dropdown(curr_codes, self._curr_curr)
         self._dropdown_curr_curr.activated[str].connect(self.refresh_dropdown_curr_change)
 
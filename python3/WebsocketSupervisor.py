@@ -0,0 +1,313 @@
+import asyncio
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import websocket
+
+from EventLoop import CTEventLoop
+from Worker import CTWorker
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class CTWebsocketSupervisor:
+    """
+        Owns one websocket of an exchange for the lifetime of the process.
+
+        With aiohttp installed the connection is a coroutine on the shared
+        CTEventLoop, so all exchange feeds cost no threads of their own and
+        handlers run one at a time without competing with each other.
+        Feeds with heavy messages pass parse_in_executor: their handlers run
+        on one parsing thread shared by all supervisors, in arrival order.
+        Without aiohttp websocket-client runs on a CTWorker per connection.
+
+        The connection is opened again with exponential backoff whenever it
+        drops, get_url() is called before every attempt so it can fetch fresh
+        connection tokens. Subscriptions are remembered and sent again on
+        every open. Messages and pongs count as heartbeats: a connection
+        silent for stall_timeout seconds is closed and reconnected.
+        Application level pings are sent every keepalive interval, see
+        set_keepalive(). While is_live() is False quotes of the feed are stale.
+        Debug: ct['Kucoin']._ws_supervisor.get_state()
+    """
+    _parse_executor = None
+    _parse_executor_lock = threading.Lock()
+
+    def __init__(self, name, get_url, on_message, get_subscribe_message=None, get_unsubscribe_message=None,
+                 on_open=None, on_close=None, ping_interval=0, stall_timeout=60, max_backoff=60,
+                 parse_in_executor=False):
+        """
+            get_url() - websocket url to connect to, may block
+            on_message(message) - raw text of every message
+            get_subscribe_message(subscription), get_unsubscribe_message(subscription) - text sent
+                                                                                       for a subscription
+            on_open(is_reconnect) - called after subscriptions were sent again
+            on_close() - called when the connection is lost
+            ping_interval - seconds between websocket protocol pings, 0 disables them
+            parse_in_executor - run on_message on the shared parsing thread instead of the event loop
+        """
+        self._name = name
+        self._get_url = get_url
+        self._on_message = on_message
+        self._get_subscribe_message = get_subscribe_message
+        self._get_unsubscribe_message = get_unsubscribe_message
+        self._on_open = on_open
+        self._on_close = on_close
+        self._ping_interval = ping_interval
+        self._stall_timeout = stall_timeout
+        self._max_backoff = max_backoff
+        self._parse_in_executor = parse_in_executor
+        self._keepalive_interval = None
+        self._get_keepalive_message = None
+
+        self._use_asyncio = aiohttp is not None
+        self._loop = None
+        self._session = None
+        self._subscriptions = []
+        self._ws = None
+        self._is_open = False
+        self._last_alive = None
+        self._last_keepalive = 0
+        self._last_ping = 0
+        self._counters = {'Connects': 0, 'Disconnects': 0, 'Stalls': 0, 'Messages': 0}
+        self._thread = None
+        self._watchdog = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_parse_executor(cls):
+        """
+            A single thread keeps the messages of every feed in arrival order
+        """
+        with cls._parse_executor_lock:
+            if cls._parse_executor is None:
+                cls._parse_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='CTWebsocketParser')
+            return cls._parse_executor
+
+    def start(self):
+        if self._thread is not None or self._loop is not None:
+            return
+        if self._use_asyncio:
+            self._loop = CTEventLoop.instance().get_loop()
+            CTEventLoop.instance().submit(self.async_run())
+            CTEventLoop.instance().submit(self.async_run_watchdog())
+        else:
+            self._thread = CTWorker(self.run)
+            self._thread.start()
+            self._watchdog = CTWorker(self.run_watchdog)
+            self._watchdog.start()
+
+    # ##### asyncio backend #####
+    async def async_run(self):
+        backoff = 1
+        while True:
+            started = time.monotonic()
+            try:
+                url = await self._loop.run_in_executor(None, self._get_url)
+                if self._session is None or self._session.closed:
+                    self._session = aiohttp.ClientSession()
+                async with self._session.ws_connect(url, autoping=False, max_msg_size=0) as ws:
+                    self._ws = ws
+                    self.handle_open()
+                    async for message in ws:
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            self.dispatch_message(message.data)
+                        elif message.type == aiohttp.WSMsgType.PING:
+                            self.mark_alive()
+                            await ws.pong(message.data)
+                        elif message.type == aiohttp.WSMsgType.PONG:
+                            self.mark_alive()
+                        elif message.type == aiohttp.WSMsgType.ERROR:
+                            print('*** {} websocket ERROR: '.format(self._name), ws.exception())
+                            break
+            except Exception as e:
+                print('*** {} websocket ERROR: '.format(self._name), e)
+            self.handle_close()
+            if time.monotonic() - started > self._max_backoff:
+                backoff = 1
+            print('### {} websocket is closed, reconnecting in {} seconds ###'.format(self._name, backoff))
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self._max_backoff)
+
+    async def async_run_watchdog(self):
+        while True:
+            await asyncio.sleep(1)
+            self.check_connection()
+            if self._is_open and self._ping_interval and time.monotonic() - self._last_ping >= self._ping_interval:
+                self._last_ping = time.monotonic()
+                try:
+                    await self._ws.ping()
+                except Exception as e:
+                    print('Failed to ping {} websocket: '.format(self._name), e)
+
+    # ##### websocket-client backend #####
+    def run(self):
+        backoff = 1
+        while True:
+            started = time.monotonic()
+            try:
+                self._ws = websocket.WebSocketApp(
+                    self._get_url(),
+                    on_message=lambda ws, message: self.dispatch_message(message),
+                    on_open=lambda ws: self.handle_open(),
+                    on_pong=lambda ws, *args: self.mark_alive(),
+                    on_error=lambda ws, error: print('*** {} websocket ERROR: '.format(self._name), error),
+                    on_close=lambda ws, *args: self.handle_close()
+                )
+                self._ws.run_forever(ping_interval=self._ping_interval)
+            except Exception as e:
+                print('*** {} websocket ERROR: '.format(self._name), e)
+            self.handle_close()
+            if time.monotonic() - started > self._max_backoff:
+                backoff = 1
+            print('### {} websocket is closed, reconnecting in {} seconds ###'.format(self._name, backoff))
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self._max_backoff)
+
+    def run_watchdog(self):
+        while True:
+            time.sleep(1)
+            self.check_connection()
+
+    # ##### Connection state #####
+    def check_connection(self):
+        """
+            Closes a stalled connection and sends keepalive messages, called every second
+        """
+        if not self._is_open:
+            return
+        now = time.monotonic()
+        if self._last_alive is not None and now - self._last_alive > self._stall_timeout:
+            print('### {} websocket stalled for {:.0f} seconds, reconnecting ###'.format(
+                self._name, now - self._last_alive))
+            self._counters['Stalls'] += 1
+            self.close()
+        elif self._keepalive_interval and now - self._last_keepalive >= self._keepalive_interval:
+            self._last_keepalive = now
+            self.send(self._get_keepalive_message())
+
+    def set_keepalive(self, interval, get_message):
+        """
+            Sends get_message() every interval seconds while connected
+        """
+        self._keepalive_interval = interval
+        self._get_keepalive_message = get_message
+
+    def dispatch_message(self, message):
+        self._last_alive = time.monotonic()
+        self._counters['Messages'] += 1
+        if self._parse_in_executor:
+            self.get_parse_executor().submit(self.parse_message, message)
+        else:
+            self.parse_message(message)
+
+    def parse_message(self, message):
+        try:
+            self._on_message(message)
+        except Exception as e:
+            print('Failed to handle {} websocket message: '.format(self._name), e)
+
+    def handle_open(self):
+        with self._lock:
+            self._is_open = True
+            self._last_alive = time.monotonic()
+            self._last_keepalive = self._last_alive
+            self._last_ping = self._last_alive
+            self._counters['Connects'] += 1
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            self.send(self._get_subscribe_message(subscription))
+        if self._on_open is not None:
+            try:
+                self._on_open(self._counters['Connects'] > 1)
+            except Exception as e:
+                print('{} websocket open handler failed: '.format(self._name), e)
+
+    def handle_close(self):
+        with self._lock:
+            if not self._is_open:
+                return
+            self._is_open = False
+            self._counters['Disconnects'] += 1
+        if self._on_close is not None:
+            self._on_close()
+
+    def mark_alive(self):
+        self._last_alive = time.monotonic()
+
+    def close(self):
+        """
+            Drops the connection, it is opened again by the backend loop. A
+            websocket-client socket is only shut down, run_forever() reads the
+            end of the stream and closes it: a stalled peer never answers a
+            close frame, and a socket closed under run_forever() may never wake it up.
+        """
+        try:
+            if self._use_asyncio:
+                asyncio.run_coroutine_threadsafe(self._ws.close(), self._loop)
+            elif self._ws.sock is not None and self._ws.sock.sock is not None:
+                self._ws.sock.sock.shutdown(socket.SHUT_RDWR)
+            else:
+                self._ws.close()
+        except Exception as e:
+            print('*** {} websocket ERROR: '.format(self._name), e)
+
+    def send(self, message):
+        """
+            Sends from any thread, returns False when not connected
+        """
+        if not self._is_open:
+            return False
+        try:
+            if self._use_asyncio:
+                asyncio.run_coroutine_threadsafe(self._ws.send_str(message), self._loop)
+            else:
+                self._ws.send(message)
+            return True
+        except Exception as e:
+            print('Failed to send {} websocket message: '.format(self._name), e)
+            return False
+
+    def subscribe(self, subscription):
+        """
+            Kept in the active subscription set and sent right away when connected
+        """
+        with self._lock:
+            if subscription in self._subscriptions:
+                return
+            self._subscriptions.append(subscription)
+        self.send(self._get_subscribe_message(subscription))
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription not in self._subscriptions:
+                return
+            self._subscriptions.remove(subscription)
+        if self._get_unsubscribe_message is not None:
+            self.send(self._get_unsubscribe_message(subscription))
+
+    def get_subscriptions(self):
+        return list(self._subscriptions)
+
+    def is_live(self):
+        """
+            Connected and heard from within stall_timeout seconds
+        """
+        return self._is_open and self._last_alive is not None and \
+            time.monotonic() - self._last_alive <= self._stall_timeout
+
+    def get_state(self):
+        return {
+            'Name': self._name,
+            'Backend': 'asyncio' if self._use_asyncio else 'websocket-client',
+            'Live': self.is_live(),
+            'Open': self._is_open,
+            'SecondsSinceHeartbeat': None if self._last_alive is None else round(time.monotonic() - self._last_alive, 1),
+            'Subscriptions': len(self._subscriptions),
+            **self._counters,
+        }
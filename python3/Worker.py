@@ -1,11 +1,13 @@
-from PyQt5.QtCore import QRunnable
+import threading
 
 
-class CTWorker(QRunnable):
+class CTWorker(threading.Thread):
     """
         Worker thread
 
-        Inherits from QRunnable to handler worker thread setup, signals and wrap-up.
+        Runs a long lived blocking function, such as a websocket run_forever()
+        loop, on a daemon thread, so it neither needs a Qt thread pool nor
+        keeps the process alive on exit.
 
         :param callback: The function callback to run on this worker thread.
             Supplied args and kwargs will be passed through to the runner.
@@ -14,7 +16,7 @@ class CTWorker(QRunnable):
         :param kwargs: Keywords to pass to the callback function
     """
     def __init__(self, function, *args, **kwargs):
-        QRunnable.__init__(self)
+        threading.Thread.__init__(self, name=getattr(function, '__qualname__', None), daemon=True)
         self._function = function
         self._args = args
         self._kwargs = kwargs
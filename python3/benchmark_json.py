@@ -0,0 +1,113 @@
+import argparse
+import os
+import sys
+import time
+
+import requests
+import websocket
+
+from JsonDecoder import CTJsonDecoder
+
+# Recorded file -> (url, path of its largest array for CTJsonDecoder.iterate_items())
+REST_PAYLOADS = {
+    'binance_exchange_info.json':       ('https://api.binance.com/api/v1/exchangeInfo', ('symbols',)),
+    'binance_book_ticker.json':         ('https://api.binance.com/api/v3/ticker/bookTicker', ()),
+    'bittrex_market_summaries.json':    ('https://bittrex.com/api/v1.1/public/getmarketsummaries', ('result',)),
+    'kucoin_all_tickers.json':          ('https://openapi-v2.kucoin.com/api/v1/market/allTickers', ('data', 'ticker')),
+    'kucoin_symbols.json':              ('https://openapi-v2.kucoin.com/api/v1/symbols', ('data',)),
+    'poloniex_ticker.json':             ('https://poloniex.com/public?command=returnTicker', None),
+}
+WEBSOCKET_PAYLOADS = {
+    'binance_ticker_arr.json':          ('wss://stream.binance.com:9443/ws/!ticker@arr', ()),
+}
+
+
+def record(directory):
+    """
+        Saves current responses of the public endpoints and websocket streams
+    """
+    os.makedirs(directory, exist_ok=True)
+    for file_name, (url, path) in REST_PAYLOADS.items():
+        try:
+            response = requests.get(url, timeout=(5, 30))
+            with open(os.path.join(directory, file_name), 'wb') as payload_file:
+                payload_file.write(response.content)
+            print('Recorded {} ({} bytes)'.format(file_name, len(response.content)))
+        except Exception as e:
+            print('Failed to record {}: {}'.format(file_name, e))
+    for file_name, (url, path) in WEBSOCKET_PAYLOADS.items():
+        try:
+            ws = websocket.create_connection(url, timeout=30)
+            message = ws.recv()
+            ws.close()
+            with open(os.path.join(directory, file_name), 'wb') as payload_file:
+                payload_file.write(message.encode('utf-8') if isinstance(message, str) else message)
+            print('Recorded {} ({} bytes)'.format(file_name, len(message)))
+        except Exception as e:
+            print('Failed to record {}: {}'.format(file_name, e))
+
+
+def measure(function, repeat):
+    """
+        Best time of repeat calls in milliseconds
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def run(directory, repeat):
+    """
+        Decodes every recorded payload with every installed backend, bytes
+        as REST responses are read and str as websocket messages arrive
+    """
+    payloads = {**REST_PAYLOADS, **WEBSOCKET_PAYLOADS}
+    backends = CTJsonDecoder.get_available_backends()
+    columns = backends + (['ijson items'] if CTJsonDecoder.is_streaming_available() else [])
+    print('{:<34}{:>10}'.format('Payload (best of {}, ms)'.format(repeat), 'KB') +
+          ''.join('{:>14}'.format(column) for column in columns))
+    for file_name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, file_name), 'rb') as payload_file:
+            payload = payload_file.read()
+        if file_name in WEBSOCKET_PAYLOADS:
+            payload = payload.decode('utf-8')
+        path = payloads.get(file_name, (None, ()))[1]
+        results = []
+        for backend in backends:
+            decoder = CTJsonDecoder(backend)
+            try:
+                results.append('{:.2f}'.format(measure(lambda: decoder.loads(payload), repeat)))
+            except ValueError:
+                results.append('invalid')
+        if CTJsonDecoder.is_streaming_available():
+            if path is None:
+                results.append('-')
+            else:
+                decoder = CTJsonDecoder()
+                results.append('{:.2f}'.format(
+                    measure(lambda: sum(1 for _ in decoder.iterate_items(payload, path)), repeat)))
+        print('{:<34}{:>10.0f}'.format(file_name, len(payload) / 1024) +
+              ''.join('{:>14}'.format(result) for result in results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares JSON backends on recorded exchange payloads')
+    parser.add_argument('command', choices=['record', 'run'], nargs='?', default='run')
+    parser.add_argument('--directory', default='json_payloads', help='where payloads are recorded')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(args.directory)
+    elif not os.path.isdir(args.directory):
+        print('No payloads in {}, record them first: python3 benchmark_json.py record'.format(args.directory))
+        sys.exit(1)
+    else:
+        run(args.directory, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
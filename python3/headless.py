@@ -0,0 +1,124 @@
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+
+from CryptoTrader import CryptoTrader
+
+
+def read_settings_file(file_path='settings.json'):
+    """
+    Loading public (non-encrypted) settings file
+    :return: file contents as a dictionary
+    """
+    try:
+        with open(file_path, 'rb') as settings_file:
+            return json.loads(settings_file.read())
+    except FileNotFoundError:
+        print('Settings file is missing')
+        return {}
+    except ValueError as e:
+        print('Settings file is corrupted: {}'.format(e))
+        return {}
+
+
+def log(message='', message_type='INFO'):
+    print('{0} ({1}): {2}'.format(message_type, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), message))
+
+
+def log_exchange_state(exchange, state):
+    if state == 'Ready':
+        log(exchange + ' is ready')
+    elif state == 'Failed':
+        log('Failed to load ' + exchange, 'ERROR')
+
+
+def get_cross_exchange_arbs(crypto_trader, required_rate_of_return):
+    """
+        Best buy (lowest ask) and sell (highest bid) exchange of every market
+        with a cross exchange arbitrage possibility, sorted by return
+    """
+    rows = []
+    possibilities = crypto_trader.get_arbitrage_possibilities(required_rate_of_return)
+    for code_base in possibilities:
+        for code_curr in possibilities[code_base]:
+            markets = possibilities[code_base][code_curr]
+            asks = [(market['BestAsk'], exchange) for exchange, market in markets.items()
+                    if market.get('BestAsk', None)]
+            bids = [(market['BestBid'], exchange) for exchange, market in markets.items()
+                    if market.get('BestBid', None) is not None]
+            if not asks or not bids:
+                continue
+            best_ask, exchange_ask = min(asks)
+            best_bid, exchange_bid = max(bids)
+            rows.append({
+                'code_base': code_base,
+                'code_curr': code_curr,
+                'exchangeAsk': exchange_ask,
+                'exchangeAskAsk': best_ask,
+                'exchangeBid': exchange_bid,
+                'exchangeBidBid': best_bid,
+                'return': 100.0 * (best_bid / best_ask - 1)
+            })
+    return sorted(rows, key=lambda kv: kv['return'], reverse=True)
+
+
+def report_arbs(crypto_trader, required_rate_of_return, top):
+    start_time = time.time()
+    cross_arbs = get_cross_exchange_arbs(crypto_trader, required_rate_of_return)
+    circle_arbs = sorted(crypto_trader.get_arbitrage_possibilities_circle(required_rate_of_return),
+                         key=lambda kv: kv['return'], reverse=True)
+    log('Check for arbitrage possibilities took {:.4f} seconds, live exchanges: {}'.format(
+        time.time() - start_time, ', '.join(crypto_trader.get_live_exchanges())))
+    stale_exchanges = crypto_trader.get_stale_exchanges()
+    if stale_exchanges:
+        log('Stale quotes on ' + ', '.join(stale_exchanges), 'WARNING')
+
+    for row in cross_arbs[:top]:
+        print('  Cross  {}/{}: buy on {} at {:.8f}, sell on {} at {:.8f}, return {:.2f}%'.format(
+            row['code_curr'], row['code_base'], row['exchangeAsk'], row['exchangeAskAsk'],
+            row['exchangeBid'], row['exchangeBidBid'], row['return']))
+    for row in circle_arbs[:top]:
+        print('  Circle {}: {} {}, {} {}, {} {}, return {:.2f}%'.format(
+            row['exchange'],
+            row['action1'], row['market1']['MarketSymbol'],
+            row['action2'], row['market2']['MarketSymbol'],
+            row['action3'], row['market3']['MarketSymbol'],
+            row['return']))
+
+
+def main():
+    """
+        Runs exchanges, their websocket feeds and the arbitrage scanners
+        without the GUI, so it does not need Qt or a display.
+        Only public market data is used, API keys are not loaded.
+        Example: python headless.py --interval 5 --return 0.5
+    """
+    parser = argparse.ArgumentParser(description='Crypto Trader market data and arbitrage engine without GUI')
+    parser.add_argument('--settings', default='settings.json', help='public settings file')
+    parser.add_argument('--interval', type=float, default=5, help='seconds between arbitrage scans')
+    parser.add_argument('--return', dest='required_return', type=float, default=0.5,
+                        help='required arbitrage return in percent')
+    parser.add_argument('--top', type=int, default=10, help='number of possibilities reported per scan')
+    parser.add_argument('--once', action='store_true', help='scan once and exit')
+    args = parser.parse_args()
+
+    settings = read_settings_file(args.settings)
+    crypto_trader = CryptoTrader(api_keys={}, settings=settings, log=log)
+    crypto_trader.add_exchange_listener(log_exchange_state)
+    required_rate_of_return = 1.0 + args.required_return / 100.0
+
+    try:
+        while True:
+            report_arbs(crypto_trader, required_rate_of_return, args.top)
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        log('Stopped')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,7 +3,7 @@ import sys
 from datetime import datetime
 
 import qtawesome as qta
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QObject, pyqtSignal
 from PyQt5.QtGui import QFont
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QAction)
 
@@ -20,6 +20,17 @@ from Views.TwentyFourHours import CTTwentyFourHours
 from Views.ViewPair import CTViewPair
 
 
+class CTExchangeEvents(QObject):
+    """
+        Hands exchange state changes of CryptoTrader, which happen on the
+        event loop thread, over to the GUI thread through a queued signal
+    """
+    state_changed = pyqtSignal(str, str)
+
+    def on_exchange_state(self, exchange, state):
+        self.state_changed.emit(exchange, state)
+
+
 class CTMainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -37,8 +48,10 @@ class CTMainWindow(QMainWindow):
         self._views = {}
         self._selected_view = None
 
-        # Declare Crypto Trader
+        # Declare Crypto Trader and the bridge of its exchange events to the GUI thread
         self._Crypto_Trader = None
+        self._exchange_events = CTExchangeEvents()
+        self._exchange_events.state_changed.connect(self.on_exchange_state_changed)
 
         # Declare GUI actions through a setup dictionary using self.init_actions()
         self._actions = {}
@@ -120,11 +133,14 @@ class CTMainWindow(QMainWindow):
 
     def init_crypto_trader(self):
         if self._Crypto_Trader is None:
+            # Exchanges load in the background, views fill in as each one becomes ready
             self._Crypto_Trader = CryptoTrader(
                 api_keys=self._API_KEYS,
                 settings=self._settings,
-                log=self.log
+                log=self.log,
+                wait_for_exchanges=False
             )
+            self._Crypto_Trader.add_exchange_listener(self._exchange_events.on_exchange_state)
             self.log('Initialized Crypto Trader')
         else:
             self._Crypto_Trader.update_settings(
@@ -133,6 +149,19 @@ class CTMainWindow(QMainWindow):
             )
             self.log('Updated Crypto Trader Settings')
 
+    def on_exchange_state_changed(self, exchange, state):
+        """
+            Runs on the GUI thread. Views implementing on_exchange_ready(exchange)
+            merge in the data of an exchange as soon as it finished loading.
+        """
+        if state == 'Failed':
+            self.log('Failed to load ' + exchange, 'ERROR')
+        elif state == 'Ready':
+            self.log(exchange + ' is ready')
+            view = self._views.get(self._selected_view, None)
+            if hasattr(view, 'on_exchange_ready'):
+                view.on_exchange_ready(exchange)
+
     def log(self, message='', message_type='INFO'):
         message = '{0} ({1}): {2}'.format(message_type, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), message)
         self._status_bar.showMessage(message)